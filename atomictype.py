@@ -45,6 +45,21 @@ class NativeType(Enum):
     BOOLEAN = 15
     
 class native_base_type(object):
+    '''
+        Atomic types carry no state, so each one exists exactly once and is
+        shared by every type manager (and survives pickling as the same
+        instance).
+    '''
+    __slots__ = ()
+    _instances = {}
+
+    def __new__(cls):
+        instance = native_base_type._instances.get(cls)
+        if instance is None:
+            instance = object.__new__(cls)
+            native_base_type._instances[cls] = instance
+        return instance
+
     @property
     def typecode(self):
         return TypeCode.ATOMIC
@@ -217,4 +232,57 @@ class native_bool_type(native_base_type):
         
     @property
     def typename(self):
-        return "bool"
\ No newline at end of file
+        return "bool"
+
+
+# the types a field can be stored as in the file instead of its own (see
+# field_element.storage_type), by the name H5GEN_STORE_AS and the field rules
+# file take, with the size each has on disk. the fixed-width names map onto
+# the C types of that width on every platform HDF5 supports.
+_storage_types = {
+    "int8": (native_schar_type, 1),
+    "uint8": (native_uchar_type, 1),
+    "int16": (native_short_type, 2),
+    "uint16": (native_ushort_type, 2),
+    "int32": (native_int_type, 4),
+    "uint32": (native_uint_type, 4),
+    "int64": (native_longlong_type, 8),
+    "uint64": (native_ulonglong_type, 8),
+    "float": (native_float_type, 4),
+    "double": (native_double_type, 8),
+}
+
+_storage_type_aliases = {
+    "signed char": "int8",
+    "unsigned char": "uint8",
+    "short": "int16",
+    "unsigned short": "uint16",
+    "int": "int32",
+    "unsigned int": "uint32",
+    "unsigned": "uint32",
+    "long long": "int64",
+    "unsigned long long": "uint64",
+}
+
+_storage_type_sizes = {storage_type().atomic_type: size for storage_type, size in _storage_types.values()}
+
+
+def storage_type_by_name(name):
+    '''
+        Returns the atomic type a field can be stored as, given as int8 ...
+        uint64, float or double (or as int16_t, std::int16_t, short and the
+        like), or None if there's no such storage type.
+    '''
+    name = " ".join(name.split())
+    if name.startswith("std::"):
+        name = name[len("std::"):]
+    if name.endswith("_t"):
+        name = name[:-len("_t")]
+    name = _storage_type_aliases.get(name, name)
+    if name not in _storage_types:
+        return None
+    return _storage_types[name][0]()
+
+
+def storage_type_size(storage_type):
+    return _storage_type_sizes[storage_type.atomic_type]
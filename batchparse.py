@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import concurrent.futures
+import os
+
+import tracing
+from exceptiontypes import CompilerError, SevereLogMsgException
+from logger import Logger, LogLevel
+from typemanager import type_manager
+
+
+class ParseJob(object):
+    def __init__(self, target_file, include_dirs, extra_args=[]):
+        self._target = target_file
+        self._include_dirs = list(include_dirs)
+        self._extra_args = list(extra_args)
+        self._precompiled_prefix = None
+
+    @property
+    def target_file(self):
+        return self._target
+
+    @property
+    def include_dirs(self):
+        return self._include_dirs
+
+    @property
+    def extra_args(self):
+        return self._extra_args
+
+    @property
+    def precompiled_prefix(self):
+        return self._precompiled_prefix
+
+    @precompiled_prefix.setter
+    def precompiled_prefix(self, prefix):
+        self._precompiled_prefix = prefix
+
+    @property
+    def clang_args(self):
+        '''
+            The extra arguments the target is actually parsed with, including
+            the ones that load the precompiled prefix.
+        '''
+        if self._precompiled_prefix is None:
+            return self._extra_args
+        return self._extra_args + self._precompiled_prefix.clang_args
+
+
+def _init_parser_process(clang_library_file):
+    import clang.cindex
+    # a forked worker inherits the library if the parent already loaded it to
+    # build a precompiled prefix, and libclang refuses to have it set again.
+    if not clang.cindex.Config.loaded:
+        clang.cindex.Config.set_library_file(clang_library_file)
+
+
+def _parse_job(job, verbosity, warnings_are_errors, file_excluder=None, collect_layouts=False, trace=False):
+    # runs in a worker process. compiler diagnostics and log exceptions can't
+    # be sent back to the parent as they are, so they are turned into a
+    # printable message here. trace events go back with the result.
+    if trace:
+        tracing.enable()
+    parsed_file, error = _parse_job_traced(job, verbosity, warnings_are_errors, file_excluder, collect_layouts)
+    return parsed_file, error, tracing.take_events()
+
+
+def _parse_job_traced(job, verbosity, warnings_are_errors, file_excluder, collect_layouts):
+    from fileparse import parse_input_file
+
+    logger = Logger(verbosity, warnings_are_errors)
+    try:
+        with tracing.span(job.target_file, "header parse"):
+            parsed_file = parse_input_file(job.target_file, logger, job.include_dirs, job.clang_args,
+                                           file_excluder, collect_layouts)
+        # the headers in the precompiled prefix aren't reported as includes of
+        # the target, but a change to any of them changes the parse.
+        if job.precompiled_prefix is not None:
+            parsed_file.add_translation_unit_files(job.precompiled_prefix.dependency_files)
+        return parsed_file, None
+    except CompilerError as err:
+        return None, "The following compiler error(s) were encountered when parsing {0}:\n{1}".format(
+            job.target_file, err)
+    except SevereLogMsgException as logerr:
+        return None, None
+
+
+def parse_jobs(jobs, logger, verbosity, warnings_are_errors, clang_library_file, parse_cache=None, num_workers=1,
+               file_excluder=None, collect_layouts=False):
+    '''
+        Parses every job, reusing cached results where possible, and returns a
+        list of (job, parsed_file) for the jobs that parsed successfully. misses
+        are spread over a process pool when there is more than one of them.
+        record layouts are only read if collect_layouts is set.
+    '''
+    results = []
+    misses = []
+    for job in jobs:
+        cached = None
+        if parse_cache is not None:
+            cached = parse_cache.load(job.target_file, job.include_dirs, job.clang_args)
+        if cached is not None:
+            logger.log(LogLevel.Info, "Using cached parse of {0}.".format(job.target_file))
+            results.append((job, cached))
+        else:
+            misses.append(job)
+
+    if len(misses) == 0:
+        return results
+
+    # precompiled prefixes are built once, here, before the workers start;
+    # a prefix that fails to build is dropped and its targets parsed in full.
+    prefixes = []
+    for job in misses:
+        if job.precompiled_prefix is not None and job.precompiled_prefix not in prefixes:
+            prefixes.append(job.precompiled_prefix)
+    if len(prefixes) > 0:
+        _init_parser_process(clang_library_file)
+        failed = [prefix for prefix in prefixes if not prefix.ensure_built(logger)]
+        for job in misses:
+            if job.precompiled_prefix in failed:
+                job.precompiled_prefix = None
+
+    if num_workers <= 1 or len(misses) == 1:
+        _init_parser_process(clang_library_file)
+        outcomes = [_parse_job(job, verbosity, warnings_are_errors, file_excluder, collect_layouts,
+                               tracing.is_enabled())
+                    for job in misses]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(num_workers, len(misses)),
+                                                    initializer=_init_parser_process,
+                                                    initargs=(clang_library_file,)) as pool:
+            futures = [pool.submit(_parse_job, job, verbosity, warnings_are_errors, file_excluder, collect_layouts,
+                                   tracing.is_enabled())
+                       for job in misses]
+            outcomes = [future.result() for future in futures]
+
+    for job, (parsed_file, error, events) in zip(misses, outcomes):
+        tracing.add_events(events)
+        if parsed_file is None:
+            if error is not None:
+                print(error)
+                print("The process was aborted and the output for {0} was not generated.".format(
+                    job.target_file))
+            continue
+
+        logger.log(LogLevel.Info, "Parsed {0}.".format(job.target_file))
+        if parse_cache is not None:
+            parse_cache.store(job.target_file, job.include_dirs, parsed_file, job.clang_args)
+        results.append((job, parsed_file))
+
+    return results
+
+
+def share_type_managers(parsed_files, logger):
+    '''
+        Headers in a batch usually include the same project headers, so every
+        parse result carries its own copy of the same types. this folds them
+        into one type manager that all results share. a result that declares a
+        type differently from the others keeps its own type manager.
+    '''
+    shared = type_manager()
+    for parsed_file in parsed_files:
+        conflicts = shared.merge(parsed_file.type_manager)
+        if len(conflicts) > 0:
+            logger.log(LogLevel.Warning, "{0} declares types that conflict with other files in the batch ({1}); its types are kept separate.".format(
+                parsed_file.parsed_filepath, ", ".join(conflicts)))
+        else:
+            parsed_file.type_manager = shared
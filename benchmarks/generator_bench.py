@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+_repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _repo_dir)
+
+from fileexclusion import FileExcluder
+from filegen import generate_output_header_file
+from logger import Logger, LogLevel
+
+_atomic_field_types = ["int", "unsigned short", "double", "float", "long long", "unsigned char", "bool"]
+
+
+def synthesize_header(header_path, num_types, nesting_depth=3, array_fields=2, enum_constants=16,
+                      num_namespaces=8, enum_every=5, union_every=10):
+    '''
+        Writes a header with num_types type definitions spread over
+        num_namespaces namespaces. every enum_every-th type is an enum with
+        enum_constants constants and every union_every-th type (offset by one)
+        a union; the rest are structs with atomic fields, array_fields constant
+        arrays, a field of the most recent enum and, in chains of nesting_depth
+        structs, a field of the struct before it.
+    '''
+    last_enum = None
+    last_struct = None
+    chain_position = 0
+
+    with open(header_path, 'w') as header:
+        header.write("#pragma once\n\n")
+        for i in range(num_types):
+            namespace = "bench_ns{0}".format(i % num_namespaces)
+            header.write("namespace {0}\n{{\n".format(namespace))
+
+            if i % enum_every == 0:
+                name = "Enum{0}".format(i)
+                header.write("    enum {0}\n    {{\n".format(name))
+                for c in range(enum_constants):
+                    header.write("        {0}_C{1} = {2},\n".format(name, c, c * 3))
+                header.write("    };\n")
+                last_enum = "::{0}::{1}".format(namespace, name)
+
+            elif i % union_every == 1:
+                name = "Union{0}".format(i)
+                header.write("    union {0}\n    {{\n".format(name))
+                header.write("        double as_double;\n")
+                header.write("        long long as_integer;\n")
+                header.write("        unsigned char as_bytes[8];\n")
+                header.write("    };\n")
+
+            else:
+                name = "Struct{0}".format(i)
+                header.write("    struct {0}\n    {{\n".format(name))
+                for f in range(4):
+                    header.write("        {0} field{1};\n".format(_atomic_field_types[(i + f) % len(_atomic_field_types)], f))
+                for a in range(array_fields):
+                    header.write("        {0} array{1}[{2}];\n".format(_atomic_field_types[(i + a) % len(_atomic_field_types)], a, 4 + a))
+                if last_enum is not None:
+                    header.write("        {0} kind;\n".format(last_enum))
+                if last_struct is not None and chain_position > 0:
+                    header.write("        {0} nested;\n".format(last_struct))
+                header.write("    };\n")
+
+                last_struct = "::{0}::{1}".format(namespace, name)
+                chain_position = (chain_position + 1) % max(nesting_depth, 1)
+
+            header.write("}\n\n")
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(args, num_types):
+    '''
+        Runs one corpus size in this process and returns its measurements.
+    '''
+    import clang.cindex
+    clang.cindex.Config.set_library_file(args.clang_library_file)
+    from fileparse import parse_input_file
+
+    logger = Logger(LogLevel.Warning)
+    work_dir = tempfile.mkdtemp(prefix="h5gen_bench_")
+    header_path = os.path.join(work_dir, "bench_{0}.h".format(num_types))
+
+    start = time.perf_counter()
+    synthesize_header(header_path, num_types, args.nesting_depth, args.array_fields,
+                      args.enum_constants, args.namespaces)
+    synthesize_seconds = time.perf_counter() - start
+
+    rss_before_parse = _peak_rss_bytes()
+    start = time.perf_counter()
+    parsed_file = parse_input_file(header_path, logger)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output_path = generate_output_header_file(logger, work_dir, parsed_file, FileExcluder())
+    generate_seconds = time.perf_counter() - start
+
+    result = {
+        "num_types": num_types,
+        "input_bytes": os.path.getsize(header_path),
+        "output_bytes": os.path.getsize(output_path),
+        "synthesize_seconds": synthesize_seconds,
+        "parse_seconds": parse_seconds,
+        "generate_seconds": generate_seconds,
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "rss_before_parse_bytes": rss_before_parse
+    }
+
+    if not args.keep_corpus:
+        os.remove(header_path)
+        os.remove(output_path)
+        os.rmdir(work_dir)
+    return result
+
+
+def _run_case_in_subprocess(args, num_types):
+    # each size gets a fresh interpreter so peak RSS isn't carried over from
+    # a larger case.
+    command = [sys.executable, os.path.abspath(__file__), "--single-case", str(num_types),
+               "--clang-library-file", args.clang_library_file,
+               "--nesting-depth", str(args.nesting_depth),
+               "--array-fields", str(args.array_fields),
+               "--enum-constants", str(args.enum_constants),
+               "--namespaces", str(args.namespaces)]
+    if args.keep_corpus:
+        command.append("--keep-corpus")
+    completed = subprocess.run(command, check=True, stdout=subprocess.PIPE)
+    return json.loads(completed.stdout.decode().splitlines()[-1])
+
+
+def _find_regressions(results, baseline, threshold_percent):
+    baseline_by_size = {case["num_types"]: case for case in baseline["cases"]}
+    regressions = []
+    for case in results["cases"]:
+        base = baseline_by_size.get(case["num_types"])
+        if base is None:
+            continue
+        for metric in ("parse_seconds", "generate_seconds", "peak_rss_bytes", "output_bytes"):
+            if base[metric] > 0 and case[metric] > base[metric] * (1.0 + threshold_percent / 100.0):
+                regressions.append("{0} types: {1} went from {2} to {3}".format(
+                    case["num_types"], metric, base[metric], case[metric]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measures parse and generation time, peak RSS and output size of the generator over synthetic headers.")
+    parser.add_argument('--sizes', '-n', help='comma separated numbers of types per corpus.',
+                        default="10,100,1000,10000")
+    parser.add_argument('--nesting-depth', type=int, default=3,
+                        help='the length of the chains of structs that contain the previous struct.')
+    parser.add_argument('--array-fields', type=int, default=2, help='constant array fields per struct.')
+    parser.add_argument('--enum-constants', type=int, default=16, help='constants per enum.')
+    parser.add_argument('--namespaces', type=int, default=8, help='namespaces the types are spread over.')
+    parser.add_argument('--clang-library-file', '-l', default='libclang-12.so',
+                        help='the Clang library file the generator will use as the parser front-end.')
+    parser.add_argument('--output', '-o', default='generator_bench.json',
+                        help='the JSON file the results are written to.')
+    parser.add_argument('--baseline', '-b', default=None,
+                        help='a results file from an earlier run to compare against. exits with status 1 on a regression.')
+    parser.add_argument('--threshold', '-t', type=float, default=10.0,
+                        help='how many percent worse than the baseline a metric may get before it counts as a regression.')
+    parser.add_argument('--keep-corpus', action='store_true', default=False,
+                        help='leave the synthesized headers and the generated output behind.')
+    parser.add_argument('--single-case', type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single_case is not None:
+        print(json.dumps(run_case(args, args.single_case)))
+        sys.exit(0)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "clang_library_file": args.clang_library_file,
+        "parameters": {
+            "nesting_depth": args.nesting_depth,
+            "array_fields": args.array_fields,
+            "enum_constants": args.enum_constants,
+            "namespaces": args.namespaces
+        },
+        "cases": []
+    }
+
+    print("{0:>8} {1:>10} {2:>10} {3:>10} {4:>12}".format("types", "parse s", "gen s", "rss MiB", "output KiB"))
+    for num_types in [int(size) for size in args.sizes.split(',')]:
+        case = _run_case_in_subprocess(args, num_types)
+        results["cases"].append(case)
+        print("{0:>8} {1:>10.3f} {2:>10.3f} {3:>10.1f} {4:>12.1f}".format(
+            num_types, case["parse_seconds"], case["generate_seconds"],
+            case["peak_rss_bytes"] / (1024.0 * 1024.0), case["output_bytes"] / 1024.0))
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=4)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = _find_regressions(results, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -0,0 +1,153 @@
+// MIT License
+
+// Copyright (c) 2022 Johnathon Lewis
+
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+// measures the per-call overhead of H5Writer::write<T>() type dispatch. the
+// "map" variant reproduces the original dispatch (copy the DxDataType, then
+// look the stream up in a std::map keyed by std::type_index); the "slot"
+// variant is the current H5Writer. both end in the same buffered stream write,
+// and the datasets are created before timing starts.
+
+#include "H5Writer.h"
+
+#include <chrono>
+#include <cstdio>
+#include <cstdlib>
+#include <map>
+#include <typeindex>
+
+struct BenchRecord
+{
+    int id;
+    double value;
+};
+
+namespace h5gen
+{
+    template <>
+    class DxDataType<BenchRecord>
+    {
+    public:
+        static DxDataType& instance() noexcept
+        {
+            static DxDataType<BenchRecord> e {};
+            return e;
+        }
+
+        const H5::DataType& h5_datatype() const noexcept
+        {
+            return datatype_;
+        }
+
+        const H5::DataType& h5_file_datatype() const noexcept
+        {
+            return datatype_;
+        }
+
+        const char* type_name() const noexcept
+        {
+            return "BenchRecord";
+        }
+
+    private:
+        DxDataType() noexcept:
+            datatype_(sizeof(BenchRecord))
+        {
+            datatype_.insertMember("id", HOFFSET(BenchRecord, id), H5::PredType::NATIVE_INT);
+            datatype_.insertMember("value", HOFFSET(BenchRecord, value), H5::PredType::NATIVE_DOUBLE);
+        }
+
+        H5::CompType datatype_;
+    };
+}
+
+namespace
+{
+    using bench_clock = std::chrono::steady_clock;
+
+    class map_dispatch_writer
+    {
+    public:
+        explicit map_dispatch_writer(const H5::H5File& file):
+            file_(file)
+        {
+        }
+
+        template <typename CompoundOrEnumT>
+        void write(const CompoundOrEnumT& data)
+        {
+            h5gen::DxDataType<CompoundOrEnumT> data_type = h5gen::DxDataType<CompoundOrEnumT>::instance();
+            const H5::DataType& h5type = data_type.h5_datatype();
+
+            auto typeIdx = std::type_index(typeid(data));
+            auto elem = datasets_.find(typeIdx);
+            if (elem == datasets_.end())
+            {
+                elem = datasets_.emplace(typeIdx,
+                                         h5gen::make_dataset_stream<CompoundOrEnumT>(std::string("map_") + data_type.type_name(),
+                                                                                     file_,
+                                                                                     h5type)).first;
+            }
+            elem->second.write(data);
+        }
+
+    private:
+        H5::H5File file_;
+        std::map<std::type_index, h5gen::H5DataSetStream> datasets_;
+    };
+
+    template <typename WriterT>
+    double time_writes(WriterT& writer, size_t numRecords)
+    {
+        BenchRecord rec {};
+        writer.write(rec);
+
+        const auto start = bench_clock::now();
+        for (size_t i = 0; i < numRecords; ++i)
+        {
+            rec.id = static_cast<int>(i);
+            writer.write(rec);
+        }
+        const auto end = bench_clock::now();
+
+        return std::chrono::duration<double, std::nano>(end - start).count() / numRecords;
+    }
+}
+
+int main(int argc, char** argv)
+{
+    const size_t numRecords = argc > 1 ? std::strtoull(argv[1], nullptr, 10) : 10000000;
+
+    h5gen::H5Writer writer("writer_dispatch_bench");
+    const double slotNs = time_writes(writer, numRecords);
+
+    H5::H5File file("writer_dispatch_bench_map.h5", H5F_ACC_TRUNC);
+    double mapNs = 0.0;
+    {
+        map_dispatch_writer mapWriter(file);
+        mapNs = time_writes(mapWriter, numRecords);
+    }
+
+    std::printf("records per variant: %zu\n", numRecords);
+    std::printf("map dispatch (before): %8.2f ns/write\n", mapNs);
+    std::printf("slot dispatch (after): %8.2f ns/write\n", slotNs);
+    return 0;
+}
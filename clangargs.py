@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+
+def build_clang_arglist(additional_include_dirs=[], extra_args=[]):
+    # force C++ parsing, so that way headers are parsed correctly if they contain
+    # C++-style declarations.
+    arglist = ['-x', 'c++', '-std=c++11']
+    for dir in additional_include_dirs:
+        arglist.append('-I')
+        arglist.append(dir)
+
+    # anything else, e.g. defines from a compilation database. these come last
+    # so that they can override the defaults above (e.g. a later -std=).
+    arglist.extend(extra_args)
+    return arglist
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import os
+import re
+
+_placeholder = re.compile(r'\$(?:\$|\{(\w+)\}|(\w+))')
+
+
+class code_template(object):
+    '''
+        A text template with $name or ${name} placeholders ($$ is a literal $).
+        the template is compiled once into a str.format string, so rendering
+        is a single format_map call no matter how many lines it has.
+    '''
+    __slots__ = ('_format', '_fields')
+
+    def __init__(self, text):
+        pieces = []
+        fields = []
+        position = 0
+        for match in _placeholder.finditer(text):
+            pieces.append(text[position:match.start()].replace('{', '{{').replace('}', '}}'))
+            name = match.group(1) or match.group(2)
+            if name is None:
+                pieces.append('$')
+            else:
+                pieces.append('{' + name + '}')
+                fields.append(name)
+            position = match.end()
+        pieces.append(text[position:].replace('{', '{{').replace('}', '}}'))
+        self._format = ''.join(pieces)
+        self._fields = frozenset(fields)
+
+    @property
+    def fields(self):
+        return self._fields
+
+    def render(self, values):
+        return self._format.format_map(values)
+
+
+class emission_backend(object):
+    '''
+        A named set of templates that filegen renders a transform header
+        from, plus the spelling of each atomic type in the generated code.
+        templates are compiled when the backend is created.
+    '''
+
+    def __init__(self, name, templates, native_type_names):
+        self._name = name
+        self._sources = dict(templates)
+        self._templates = {template_name: code_template(text) for template_name, text in templates.items()}
+        self._native_type_names = dict(native_type_names)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def native_type_names(self):
+        return self._native_type_names
+
+    def render(self, template_name, **values):
+        return self._templates[template_name].render(values)
+
+    def with_overrides(self, name, templates):
+        '''
+            Returns a backend that uses the given templates in place of the
+            ones of the same name in this backend.
+        '''
+        merged = dict(self._sources)
+        for template_name, text in templates.items():
+            if template_name not in merged:
+                raise ValueError("{0} has no template named {1}.".format(self._name, template_name))
+            merged[template_name] = text
+        return emission_backend(name, merged, self._native_type_names)
+
+
+_backends = {}
+_directory_backends = {}
+
+
+def register_backend(backend):
+    _backends[backend.name] = backend
+
+
+def get_backend(name):
+    if name not in _backends:
+        # the built-in backend registers itself when its module is imported.
+        import h5templates
+    return _backends[name]
+
+
+def load_template_directory(base_backend_name, template_directory):
+    '''
+        Returns the backend with every <template name>.tmpl file in the
+        directory overriding the template of that name. the result is cached,
+        so the templates are read and compiled once per process.
+    '''
+    key = (base_backend_name, os.path.abspath(template_directory))
+    backend = _directory_backends.get(key)
+    if backend is None:
+        templates = {}
+        for filename in sorted(os.listdir(template_directory)):
+            if filename.endswith('.tmpl'):
+                with open(os.path.join(template_directory, filename), 'r', newline='') as template_file:
+                    templates[filename[:-len('.tmpl')]] = template_file.read()
+        backend = get_backend(base_backend_name).with_overrides(
+            "{0}:{1}".format(base_backend_name, key[1]), templates)
+        _directory_backends[key] = backend
+    return backend
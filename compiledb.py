@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import json
+import os
+import shlex
+
+
+_source_extensions = ['.cpp', '.cc', '.cxx', '.c++', '.C', '.c']
+
+# flags that carry their value in the next argument when they are not glued
+# to it, e.g. "-I inc" as opposed to "-Iinc".
+_include_dir_flags = ['-I', '-isystem', '-iquote', '-idirafter']
+_passthrough_flags = ['-D', '-U', '-include']
+
+# flags that are dropped along with their value. each is checked before the
+# flags above, whose names they start with: "-include-pch x.pch" isn't
+# -include with the value -pch. a PCH the compiler built can't be loaded by
+# libclang, and the header it was built from is passed with -include anyway.
+_dropped_flags = ['-include-pch']
+
+
+class CompilationDatabase(object):
+    '''
+        Reads a compile_commands.json and extracts the flags that matter to the
+        parser (include paths, defines, the language standard) for a header.
+        Headers rarely have entries of their own, so a header without one
+        borrows the flags of a source file with the same name next to it.
+    '''
+
+    def __init__(self, compile_commands_path):
+        with open(compile_commands_path, 'r') as dbfile:
+            entries = json.load(dbfile)
+
+        self._entries = {}
+        for entry in entries:
+            directory = entry['directory']
+            if 'arguments' in entry:
+                arguments = list(entry['arguments'])
+            else:
+                arguments = shlex.split(entry['command'])
+            filename = os.path.normpath(os.path.join(directory, entry['file']))
+            self._entries[filename] = (directory, arguments)
+
+    def flags_for(self, target_file):
+        '''
+            Returns (include_dirs, extra_args) for the file, or None if the
+            database has nothing that applies to it.
+        '''
+        entry = self._find_entry(os.path.abspath(target_file))
+        if entry is None:
+            return None
+
+        directory, arguments = entry
+        include_dirs = []
+        extra_args = []
+
+        # the first argument is the compiler itself.
+        i = 1
+        while i < len(arguments):
+            arg = arguments[i]
+            if arg == '-Xclang':
+                # CMake hands some options to clang this way, e.g.
+                # -Xclang -include -Xclang pch.hxx; the flag and its value
+                # are read as if they were given directly.
+                i += 1
+                continue
+
+            if arg in _dropped_flags:
+                i = self._value_index(arguments, i) + 1
+                continue
+
+            flag = next((f for f in _include_dir_flags + _passthrough_flags if arg == f), None)
+            if flag is None:
+                flag = next((f for f in _include_dir_flags + _passthrough_flags if arg.startswith(f)), None)
+            if flag is None:
+                if arg.startswith('-std='):
+                    extra_args.append(arg)
+                i += 1
+                continue
+
+            if arg == flag:
+                value_index = self._value_index(arguments, i)
+                if value_index >= len(arguments):
+                    break
+                value = arguments[value_index]
+                i = value_index + 1
+            else:
+                value = arg[len(flag):]
+                i += 1
+
+            if flag == '-I':
+                include_dirs.append(os.path.normpath(os.path.join(directory, value)))
+            elif flag in _include_dir_flags:
+                extra_args.extend([flag, os.path.normpath(os.path.join(directory, value))])
+            elif flag == '-include':
+                extra_args.extend([flag, os.path.normpath(os.path.join(directory, value))])
+            else:
+                extra_args.append(flag + value)
+
+        return include_dirs, extra_args
+
+    @staticmethod
+    def _value_index(arguments, flag_index):
+        # the index of the argument holding the value of a flag given on its own.
+        value_index = flag_index + 1
+        if value_index < len(arguments) and arguments[value_index] == '-Xclang':
+            value_index += 1
+        return value_index
+
+    def _find_entry(self, abs_target):
+        entry = self._entries.get(abs_target)
+        if entry is not None:
+            return entry
+
+        stem = os.path.splitext(abs_target)[0]
+        for ext in _source_extensions:
+            entry = self._entries.get(stem + ext)
+            if entry is not None:
+                return entry
+        return None
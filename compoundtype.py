@@ -24,17 +24,22 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import sys
+
 from fieldelem import field_element
 from typecode import TypeCode
 
 class compound_type(object):
+    __slots__ = ('_typename', '_header_filename', '_fieldlist', '_layout')
+
     def __init__(self, typename, declaration_filename):
-        self._typename = typename
-        self._header_filename = declaration_filename
+        self._typename = sys.intern(typename)
+        self._header_filename = sys.intern(declaration_filename)
         self._fieldlist = []
+        self._layout = None
     
-    def add_field(self, fieldname, fieldtype, num_elems=1):
-        self._fieldlist.append(field_element(fieldname, fieldtype, num_elems))
+    def add_field(self, fieldname, fieldtype, array_dims=(), storage_type=None):
+        self._fieldlist.append(field_element(fieldname, fieldtype, array_dims, storage_type))
         
     @property
     def declaration_filename(self):
@@ -59,4 +64,12 @@ class compound_type(object):
     @property 
     def fields(self):
         return self._fieldlist
+
+    @property
+    def layout(self):
+        return self._layout
+
+    @layout.setter
+    def layout(self, layout):
+        self._layout = layout
     
\ No newline at end of file
@@ -24,9 +24,13 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import sys
+
 from typecode import TypeCode
 
 class enum_value_pair(object):
+    __slots__ = ('_value', '_const')
+
     def __init__(self, enum_value, enum_constant):
         self._value = enum_value
         self._const = enum_constant
@@ -40,14 +44,16 @@ class enum_value_pair(object):
         return self._const
 
 class enumeration_type(object):
+    __slots__ = ('_name', '_underlying_type', '_header_filename', '_enum_dic')
+
     def __init__(self, name, int_type, declaration_filename):
-        self._name = name
-        self._underlying_type = int_type
-        self._header_filename = declaration_filename
+        self._name = sys.intern(name)
+        self._underlying_type = sys.intern(int_type)
+        self._header_filename = sys.intern(declaration_filename)
         self._enum_dic = {}
         
     def add_enum_elem(self, value_name, value_constant):
-        self._enum_dic[value_name] = value_constant
+        self._enum_dic[sys.intern(value_name)] = value_constant
         
     def get_enum_constants(self):
         ret = []
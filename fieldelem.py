@@ -24,13 +24,24 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import sys
+
 from typecode import TypeCode
 
 class field_element(object):
-    def __init__(self, fieldname, fieldtype, num_elems=1):
-        self._name = fieldname
+    __slots__ = ('_name', '_type', '_dims', '_num_elems', '_storage_type')
+
+    def __init__(self, fieldname, fieldtype, array_dims=(), storage_type=None):
+        self._name = sys.intern(fieldname)
         self._type = fieldtype
-        self._num_elems = num_elems
+        # the narrower atomic type the field is stored as in the file; None
+        # stores it as its own type.
+        self._storage_type = storage_type
+        # the extent of each dimension, outermost first; empty for a scalar.
+        self._dims = tuple(array_dims)
+        self._num_elems = 1
+        for extent in self._dims:
+            self._num_elems *= extent
         
     @property
     def name(self):
@@ -45,4 +56,12 @@ class field_element(object):
         
     def num_array_elems(self):
         return self._num_elems
+
+    @property
+    def array_dims(self):
+        return self._dims
+
+    @property
+    def storage_type(self):
+        return self._storage_type
             
\ No newline at end of file
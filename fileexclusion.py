@@ -23,14 +23,73 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
+import fnmatch
 import os
 
 class FileExcluder(object):
+    '''
+        What the parse leaves out: files under the paths listed in the ignore
+        file, and fields matching a pattern in the field rules file. a field
+        pattern is matched against the field's qualified name, e.g.
+        ns::Record::scratch or *::debug_*.
 
-    def __init__(self, exclusion_filename):
-        with open(exclusion_filename, 'r') as ignorefile:
-            self._excluded_paths_table = [line.strip() for line in ignorefile if not line.strip().startswith('#')]
+        a rules file line of the form pattern = type doesn't leave the
+        matching fields out but stores them as that type in the file, e.g.
+        ns::Sample::timestamp = float.
+    '''
 
+    def __init__(self, exclusion_filename=None, field_rules_filename=None):
+        self._excluded_paths_table = []
+        if exclusion_filename is not None:
+            with open(exclusion_filename, 'r') as ignorefile:
+                # an empty entry would be a prefix of every path.
+                self._excluded_paths_table = [line.strip() for line in ignorefile
+                                              if len(line.strip()) > 0 and not line.strip().startswith('#')]
+
+        self._excluded_field_patterns = []
+        self._field_storage_rules = []
+        if field_rules_filename is not None:
+            with open(field_rules_filename, 'r') as rulesfile:
+                for line in rulesfile:
+                    rule = line.strip()
+                    if len(rule) == 0 or rule.startswith('#'):
+                        continue
+                    pattern, separator, storage_typename = rule.partition('=')
+                    if len(separator) > 0:
+                        self._field_storage_rules.append((pattern.strip(), storage_typename.strip()))
+                    else:
+                        self._excluded_field_patterns.append(rule)
+
+
+    @property
+    def excluded_paths(self):
+        return self._excluded_paths_table
+
+    @property
+    def excluded_field_patterns(self):
+        return self._excluded_field_patterns
+
+    @property
+    def field_storage_rules(self):
+        return self._field_storage_rules
+
+    def field_storage_typename(self, record_typename, field_name):
+        '''
+            Returns the name of the type the first matching storage rule
+            stores the field as, or None if no rule matches it.
+        '''
+        qualified_field_name = "{0}::{1}".format(record_typename, field_name)
+        for pattern, storage_typename in self._field_storage_rules:
+            if fnmatch.fnmatchcase(qualified_field_name, pattern):
+                return storage_typename
+        return None
+
+    def is_excluded_field(self, record_typename, field_name):
+        qualified_field_name = "{0}::{1}".format(record_typename, field_name)
+        for pattern in self._excluded_field_patterns:
+            if fnmatch.fnmatchcase(qualified_field_name, pattern):
+                return True
+        return False
 
     def is_excluded_path(self, path):
         absolute_path = os.path.abspath(path)
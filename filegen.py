@@ -25,419 +25,370 @@ SOFTWARE.
 import os
 
 
-import atomictype
 import filegenutils
+import tracing
+from codetemplate import get_backend, load_template_directory
 from compoundtype import compound_type
 from enumtype import enumeration_type
 from exceptiontypes import CompilerError
+from h5templates import HDF5_BACKEND_NAME
 from logger import Logger, LogLevel
 from parsedfile import parsed_file
 from typecode import TypeCode
+from typeclosure import topological_order
 from typemanager import type_manager
 
-_our_namespace_name = "h5gen"
-
-_atomic_to_predefined_typemap = {
-    atomictype.NativeType.CHAR: "PredType::NATIVE_CHAR",
-    atomictype.NativeType.SCHAR: "PredType::NATIVE_SCHAR",
-    atomictype.NativeType.UCHAR: "PredType::NATIVE_UCHAR",
-    atomictype.NativeType.SHORT: "PredType::NATIVE_SHORT",
-    atomictype.NativeType.USHORT: "PredType::NATIVE_USHORT",
-    atomictype.NativeType.INT: "PredType::NATIVE_INT",
-    atomictype.NativeType.UINT: "PredType::NATIVE_UINT",
-    atomictype.NativeType.LONG: "PredType::NATIVE_LONG",
-    atomictype.NativeType.ULONG: "PredType::NATIVE_ULONG",
-    atomictype.NativeType.LONGLONG: "PredType::NATIVE_LLONG",
-    atomictype.NativeType.ULONGLONG: "PredType::NATIVE_ULLONG",
-    atomictype.NativeType.FLOAT: "PredType::NATIVE_FLOAT",
-    atomictype.NativeType.DOUBLE: "PredType::NATIVE_DOUBLE",
-    atomictype.NativeType.LONGDOUBLE: "PredType::NATIVE_LDOUBLE",
-    atomictype.NativeType.BOOLEAN: "PredType::NATIVE_HBOOL",
-
-}
-
 '''
-    Generates the transform class header file
+    Generates the transform class header file, and with out-of-line emission
+    the source file defining what the header declares.
 '''
 
+# which form of a DxDataType specialization a template renders: the complete
+# class, or (out-of-line) the class with its members only declared, or the
+# definitions of those members.
+_INLINE = ""
+_DECLARATION = "_declaration"
+_DEFINITION = "_definition"
+
 
-def generate_output_header_file(logger, output_directory, parsed_file, file_excluder):
+def generate_output_header_file(logger, output_directory, parsed_file, file_excluder, backend=None,
+                                emitted_typenames=None, out_of_line=False):
     filename_no_dir = os.path.basename(parsed_file.parsed_filepath)
     output_filepath = filegenutils.build_output_filepath(
         output_directory, filename_no_dir, "h")
 
-    with open(output_filepath, "w+") as writefile:
-        filegenutils.write_preamble(writefile, filename_no_dir)
-
-        ifdef_symbol = filename_no_dir.upper()[:filename_no_dir.find('.')]
-        writefile.write("#ifndef {0}_H5_DATATYPE_H\n".format(ifdef_symbol))
-        writefile.write("#define {0}_H5_DATATYPE_H\n\n".format(ifdef_symbol))
-
-        inclist = filegenutils.build_include_list(parsed_file, file_excluder)
-
-        writefile.write("#include \"DxDataType.h\"\n")
-
-        for include in inclist:
-            writefile.write("#include \"{0}\"\n".format(include))
-
-        writefile.write('\n')
-
-        for enum in parsed_file.enum_types_parsed_from_file:
-            _write_enum_dx_datatype_class(writefile, enum)
-
-        for struct in parsed_file.compound_types_parsed_from_file:
-            _write_compound_dx_datatype_class(writefile, struct)
-
-        for union in parsed_file.union_types_parsed_from_file:
-            _write_union_dx_datatype_class(writefile, union)
-
-        writefile.write("\n#endif\n")
-
-
-def _write_enum_dx_datatype_class(output_file, datatype):
-    indentation_spaces = filegenutils.Indentation()
-
-    output_file.write(indentation_spaces +
-                      "namespace {0} {{\n".format(_our_namespace_name))
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "template <>\n")
-    output_file.write(indentation_spaces +
-                      "class DxDataType<{0}> {{\n".format(datatype.fully_qualified_typename))
-
-    output_file.write(indentation_spaces + "public:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType& instance() noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType<{0}> e {{}};\n".format(datatype.fully_qualified_typename))
-    output_file.write(indentation_spaces + "return e;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n")
-
-    output_file.write(indentation_spaces +
-                      "const H5::DataType& h5_datatype() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "return datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    output_file.write(indentation_spaces +
-                      "const char* type_name() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "return \"{0}\";\n".format(datatype.typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "private:\n")
-    indentation_spaces.increment()
-
-    output_file.write(indentation_spaces + "DxDataType() noexcept:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "datatype_(sizeof({0}))\n".format(datatype.fully_qualified_typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "{\n")
-
-    indentation_spaces.increment()
-    backing_int_type = datatype.underlying_int_type
-    output_file.write(indentation_spaces +
-                      "{0} ev {{}};\n".format(backing_int_type))
-    for evp in datatype.get_enum_constants():
-        output_file.write(indentation_spaces + "datatype_.insert(\"{0}\", (ev={1},&ev));\n".format(evp.constant_name,
-                                                                                                   evp.constant_value))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-    output_file.write(indentation_spaces + "H5::EnumType datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "};\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n")
-
-
-def _write_compound_dx_datatype_class(output_file, datatype):
-    indentation_spaces = filegenutils.Indentation()
-
-    output_file.write(indentation_spaces +
-                      "namespace {0} {{\n".format(_our_namespace_name))
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "template <>\n")
-    output_file.write(indentation_spaces +
-                      "class DxDataType<{0}> {{\n".format(datatype.fully_qualified_typename))
-
-    output_file.write(indentation_spaces + "public:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType& instance() noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType<{0}> e {{}};\n".format(datatype.fully_qualified_typename))
-    output_file.write(indentation_spaces + "return e;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    output_file.write(indentation_spaces +
-                      "const H5::DataType& h5_datatype() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "return datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    output_file.write(indentation_spaces +
-                      "const char* type_name() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "return \"{0}\";\n".format(datatype.typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "private:\n")
-    indentation_spaces.increment()
-
-    output_file.write(indentation_spaces + "DxDataType() noexcept:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "datatype_(sizeof({0}))\n".format(datatype.fully_qualified_typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "{\n")
-
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static constexpr {0} zzz_tmp {{}};\n".format(datatype.fully_qualified_typename))
-
-    seen_datatypes = set()
-    for field in datatype.fields:
-        if field.type_definition.typecode == TypeCode.ATOMIC:
-            native_typename = _atomic_to_predefined_typemap[field.type_definition.atomic_type]
-            assert native_typename is not None
-            if not field.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), H5::{2});\n"
-                                  .format(field.name,
-                                          field.name,
-                                          native_typename))
-            else:
-                output_file.write(indentation_spaces + "hsize_t {0}_dims[1] = {{{1}}};\n".format(
-                    field.name, field.num_array_elems()))
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}[0]), H5::ArrayType(H5::{2}, 1, {3}_dims));\n"
-                                  .format(field.name,
-                                          field.name,
-                                          native_typename,
-                                          field.name))
-
-        elif field.type_definition.typecode == TypeCode.COMPOUND:
-            safe_typename = field.type_definition.fully_qualified_typename.replace(
-                "::", '_')
-            if safe_typename not in seen_datatypes:
-                output_file.write(indentation_spaces +
-                                  "DxDataType<{0}>& zzz_{1}_dxtype = DxDataType<{2}>::instance();\n"
-                                  .format(field.type_definition.fully_qualified_typename,
-                                          safe_typename,
-                                          field.type_definition.fully_qualified_typename))
-                seen_datatypes.add(safe_typename)
-
-            if not field.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), zzz_{2}_dxtype.h5_datatype());\n"
-                                  .format(field.name,
-                                          field.name,
-                                          safe_typename))
-            else:
-                output_file.write(indentation_spaces + "hsize_t {0}_dims[1] = {{{1}}};\n".format(
-                    field.name, field.num_array_elems()))
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}[0]), H5::ArrayType(zzz_{2}_dxtype.h5_datatype(), 1, {3}_dims);\n"
-                                  .format(field.name,
-                                          field.name,
-                                          safe_typename,
-                                          field.name))
-
-        elif field.type_definition.typecode == TypeCode.ENUM:
-            safe_typename = field.type_definition.fully_qualified_typename.replace(
-                "::", '_')
-
-            if safe_typename not in seen_datatypes:
-                output_file.write(indentation_spaces +
-                                  "DxDataType<{0}>& zzz_{1}_dxtype = DxDataType<{2}>::instance();\n"
-                                  .format(field.type_definition.fully_qualified_typename,
-                                          safe_typename,
-                                          field.type_definition.fully_qualified_typename))
-                seen_datatypes.add(safe_typename)
-
-            if not field.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), zzz_{2}_dxtype.h5_datatype());\n"
-                                  .format(field.name,
-                                          field.name,
-                                          safe_typename))
-            else:
-                for i in range(0, field.num_array_elems()):
-                    output_file.write(indentation_spaces +
-                                      "datatype_.insertMember(\"{0}[{1}]\", HDF5_FIELD_OFFSET(zzz_tmp,{2}[{3}]), zzz_{4}_dxtype.h5_datatype());\n"
-                                      .format(field.name,
-                                              i,
-                                              field.name,
-                                              i,
-                                              safe_typename))
-    indentation_spaces.decrement()
-
-    output_file.write(indentation_spaces + "}\n\n")
-    output_file.write(indentation_spaces + "H5::CompType datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "};\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n")
-
-
-def _write_union_dx_datatype_class(output_file, datatype):
-    indentation_spaces = filegenutils.Indentation()
-
-    output_file.write(indentation_spaces +
-                      "namespace {0} {{\n".format(_our_namespace_name))
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "template <>\n")
-    output_file.write(indentation_spaces +
-                      "class DxDataType<{0}> {{\n".format(datatype.fully_qualified_typename))
-
-    output_file.write(indentation_spaces + "public:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType& instance() noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static DxDataType<{0}> e {{}};\n".format(datatype.fully_qualified_typename))
-    output_file.write(indentation_spaces + "return e;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    output_file.write(indentation_spaces +
-                      "const H5::DataType& h5_datatype() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces + "return datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    output_file.write(indentation_spaces +
-                      "const char* type_name() const noexcept {\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "return \"{0}\";\n".format(datatype.typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "private:\n")
-    indentation_spaces.increment()
-
-    output_file.write(indentation_spaces + "DxDataType() noexcept:\n")
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "datatype_(sizeof({0}))\n".format(datatype.fully_qualified_typename))
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "{\n")
-
-    indentation_spaces.increment()
-    output_file.write(indentation_spaces +
-                      "static constexpr {0} zzz_tmp {{}};\n".format(datatype.fully_qualified_typename))
+    # the header is rendered in memory first and only written out if it
+    # differs from what's already on disk.
+    contents = render_output_header(parsed_file, file_excluder, backend, emitted_typenames, out_of_line)
+    _write_output_file(logger, output_filepath, contents)
+    return output_filepath
+
+
+def generate_output_source_file(logger, output_filepath, parsed_files, file_excluder, backend=None,
+                                emitted_typenames=None):
+    '''
+        Writes the out-of-line definitions for the headers of all the parsed
+        files into one source file.
+    '''
+    _write_output_file(logger, output_filepath,
+                       render_output_source(parsed_files, file_excluder, backend, emitted_typenames))
+    return output_filepath
+
+
+def _write_output_file(logger, output_filepath, contents):
+    if filegenutils.write_if_changed(output_filepath, contents):
+        logger.log(LogLevel.Info, "Wrote {0}.".format(output_filepath))
+    else:
+        logger.log(LogLevel.Debug1, "{0} is up to date.".format(output_filepath))
+
+
+def select_backend(template_directory=None):
+    '''
+        Returns the built-in HDF5 backend, with the templates in
+        template_directory overriding it if one is given.
+    '''
+    if template_directory is None:
+        return get_backend(HDF5_BACKEND_NAME)
+    return load_template_directory(HDF5_BACKEND_NAME, template_directory)
+
+
+def render_output_header(parsed_file, file_excluder, backend=None, emitted_typenames=None, out_of_line=False):
+    '''
+        Returns the text of the transform header for the parsed file. if
+        emitted_typenames is given, only the types named in it are written.
+        an out-of-line header only declares the specializations' members (see
+        render_output_source).
+    '''
+    if backend is None:
+        backend = get_backend(HDF5_BACKEND_NAME)
 
+    filename_no_dir = os.path.basename(parsed_file.parsed_filepath)
+    inclist = filegenutils.build_include_list(parsed_file, file_excluder)
+
+    types = []
+    staged_types = {}
+    template_suffix = _DECLARATION if out_of_line else _INLINE
+    for datatype in _types_to_emit(parsed_file, emitted_typenames):
+        with tracing.span(datatype.fully_qualified_typename, "type"):
+            types.append(_render_dx_datatype(backend, datatype, staged_types, template_suffix))
+
+    # the declarations only need the target header itself, unless a staged
+    # record's stored_type refers to the stored_type of another header's record.
+    if out_of_line and not any(staged_types.values()):
+        inclist = [filename_no_dir]
+
+    return backend.render("file",
+                          source_filename=filename_no_dir,
+                          include_guard=filename_no_dir.upper()[:filename_no_dir.find('.')],
+                          includes="".join(backend.render("include", include=include)
+                                           for include in inclist),
+                          types="".join(types))
+
+
+def render_output_source(parsed_files, file_excluder, backend=None, emitted_typenames=None):
+    '''
+        Returns the text of a source file defining the members declared by the
+        out-of-line headers of the parsed files.
+    '''
+    if backend is None:
+        backend = get_backend(HDF5_BACKEND_NAME)
+
+    inclist = []
+    definitions = []
+    staged_types = {}
+    for parsed_file in parsed_files:
+        filename_no_dir = os.path.basename(parsed_file.parsed_filepath)
+        header = os.path.basename(filegenutils.build_output_filepath("", filename_no_dir, "h"))
+        # the constructors refer to the DxDataType of every type their fields use.
+        for include in [header] + filegenutils.build_include_list(parsed_file, file_excluder):
+            if include not in inclist:
+                inclist.append(include)
+
+        for datatype in _types_to_emit(parsed_file, emitted_typenames):
+            with tracing.span(datatype.fully_qualified_typename, "type"):
+                definitions.append(_render_dx_datatype(backend, datatype, staged_types, _DEFINITION))
+
+    return backend.render("source_file",
+                          source_filename=", ".join(os.path.basename(parsed_file.parsed_filepath)
+                                                    for parsed_file in parsed_files),
+                          includes="".join(backend.render("include", include=include)
+                                           for include in inclist),
+                          definitions="".join(definitions))
+
+
+def _types_to_emit(parsed_file, emitted_typenames):
+    declared_types = parsed_file.enum_types_parsed_from_file + \
+        parsed_file.compound_types_parsed_from_file + parsed_file.union_types_parsed_from_file
+    if emitted_typenames is not None:
+        declared_types = [datatype for datatype in declared_types
+                          if datatype.fully_qualified_typename in emitted_typenames]
+
+    # a specialization has to be declared before the DxDataType of any type
+    # that uses it, e.g. a nested struct before the struct it's nested in.
+    return topological_order(declared_types)
+
+
+def _render_dx_datatype(backend, datatype, staged_types, template_suffix):
+    if datatype.typecode == TypeCode.ENUM:
+        return _render_enum_dx_datatype_class(backend, datatype, template_suffix)
+    return _render_record_dx_datatype_class(backend, datatype, _record_fields(datatype), staged_types, template_suffix)
+
+
+def _outdent(text):
+    # the member templates are indented for a constructor defined in the
+    # class; an out-of-line definition is one level shallower.
+    return "".join(line[4:] if line.startswith("    ") else line for line in text.splitlines(True))
+
+
+def _render_enum_dx_datatype_class(backend, datatype, template_suffix=_INLINE):
+    constants = "".join(backend.render("enum_constant",
+                                       constant_name=evp.constant_name,
+                                       constant_value=evp.constant_value)
+                        for evp in datatype.get_enum_constants())
+    if template_suffix == _DEFINITION:
+        constants = _outdent(constants)
+
+    return backend.render("enum" + template_suffix,
+                          qualified_name=datatype.fully_qualified_typename,
+                          name=datatype.typename,
+                          underlying_type=datatype.underlying_int_type,
+                          constants=constants)
+
+
+def _record_fields(datatype):
+    if datatype.typecode == TypeCode.UNION:
+        return datatype.written_fields
+    return datatype.fields
+
+
+def _is_staged_field(field, staged_types):
+    field_type = field.type_definition
+    if field_type.typecode == TypeCode.VLSTRING or field_type.typecode == TypeCode.VLSEQUENCE:
+        return True
+    return field_type.typecode == TypeCode.COMPOUND and _is_staged_record(field_type, staged_types)
+
+
+def _is_staged_record(datatype, staged_types):
+    '''
+        Whether a record has variable-length members, directly or in a nested
+        record, and so is written through a stored_type. staged_types caches
+        the answer per record.
+    '''
+    staged = staged_types.get(datatype)
+    if staged is None:
+        staged = any(_is_staged_field(field, staged_types) for field in _record_fields(datatype))
+        staged_types[datatype] = staged
+    return staged
+
+
+def _render_record_dx_datatype_class(backend, datatype, fields, staged_types, template_suffix=_INLINE):
+    members = []
     seen_datatypes = set()
-
-    # first, we will attempt to use the first compound type if one is available.
-    # if we do not find a field who is a compound type, then use the first
-    # atomic type or enum type available.
-    field_to_use = None
-    if len(datatype.fields) > 0:
-        field_to_use = next(
-            (field for field in datatype.fields if field.type_definition.typecode == TypeCode.COMPOUND), None)
-        if field_to_use is None:
-            field_to_use = datatype.fields[0]
-
-    if field_to_use is not None:
-        if field_to_use.type_definition.typecode == TypeCode.ATOMIC:
-            native_typename = _atomic_to_predefined_typemap[field_to_use.type_definition.atomic_type]
-            assert native_typename is not None
-            if not field_to_use.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), H5::{2});\n"
-                                  .format(field_to_use.name,
-                                          field_to_use.name,
-                                          native_typename))
-            else:
-                output_file.write(indentation_spaces + "hsize_t {0}_dims[1] = {{{1}}};\n".format(
-                    field_to_use.name, field_to_use.num_array_elems()))
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}[0]), H5::ArrayType(H5::{2}, 1, {3}_dims));\n"
-                                  .format(field_to_use.name,
-                                          field_to_use.name,
-                                          native_typename,
-                                          field_to_use.name))
-
-        elif field_to_use.type_definition.typecode == TypeCode.COMPOUND:
-            safe_typename = field_to_use.type_definition.fully_qualified_typename.replace(
-                "::", '_')
-            if safe_typename not in seen_datatypes:
-                output_file.write(indentation_spaces +
-                                  "DxDataType<{0}>& zzz_{1}_dxtype = DxDataType<{2}>::instance();\n"
-                                  .format(field_to_use.type_definition.fully_qualified_typename,
-                                          safe_typename,
-                                          field_to_use.type_definition.fully_qualified_typename))
-                seen_datatypes.add(safe_typename)
-
-            if not field_to_use.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), zzz_{2}_dxtype.h5_datatype());\n"
-                                  .format(field_to_use.name,
-                                          field_to_use.name,
-                                          safe_typename))
-            else:
-                output_file.write(indentation_spaces + "hsize_t {0}_dims[1] = {{{1}}};\n".format(
-                    field_to_use.name, field_to_use.num_array_elems()))
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}[0]), H5::ArrayType(zzz_{2}_dxtype.h5_datatype(), 1, {3}_dims);\n"
-                                  .format(field_to_use.name,
-                                          field_to_use.name,
-                                          safe_typename,
-                                          field_to_use.name))
-
-        elif field_to_use.type_definition.typecode == TypeCode.ENUM:
-            safe_typename = field_to_use.type_definition.fully_qualified_typename.replace(
-                "::", '_')
-
-            if safe_typename not in seen_datatypes:
-                output_file.write(indentation_spaces +
-                                  "DxDataType<{0}>& zzz_{1}_dxtype = DxDataType<{2}>::instance();\n"
-                                  .format(field_to_use.type_definition.fully_qualified_typename,
-                                          safe_typename,
-                                          field_to_use.type_definition.fully_qualified_typename))
-                seen_datatypes.add(safe_typename)
-
-            if not field_to_use.is_array():
-                output_file.write(indentation_spaces +
-                                  "datatype_.insertMember(\"{0}\", HDF5_FIELD_OFFSET(zzz_tmp,{1}), zzz_{2}_dxtype.h5_datatype());\n"
-                                  .format(field_to_use.name,
-                                          field_to_use.name,
-                                          safe_typename))
-            else:
-                for i in range(0, field_to_use.num_array_elems()):
-                    output_file.write(indentation_spaces +
-                                      "datatype_.insertMember(\"{0}[{1}]\", HDF5_FIELD_OFFSET(zzz_tmp,{2}[{3}]), zzz_{4}_dxtype.h5_datatype());\n"
-                                      .format(field_to_use.name,
-                                              i,
-                                              field_to_use.name,
-                                              i,
-                                              safe_typename))
-        indentation_spaces.decrement()
-
-    output_file.write(indentation_spaces + "}\n\n")
-    output_file.write(indentation_spaces + "H5::CompType datatype_;\n")
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "};\n\n")
-
-    indentation_spaces.decrement()
-    output_file.write(indentation_spaces + "}\n")
+    for field in fields:
+        _render_member(backend, field, seen_datatypes, members)
+    members = "".join(members)
+    file_type = _render_file_type(backend, fields)
+    if template_suffix == _DEFINITION:
+        members = _outdent(members)
+        file_type = _outdent(file_type)
+
+    layout_type = datatype.fully_qualified_typename
+    staging = ""
+    if _is_staged_record(datatype, staged_types):
+        layout_type = "stored_type"
+        staging = _render_staging(backend, datatype, fields, staged_types)
+
+    return backend.render("record" + template_suffix,
+                          qualified_name=datatype.fully_qualified_typename,
+                          name=datatype.typename,
+                          layout_type=layout_type,
+                          staging=staging,
+                          members=members,
+                          file_type=file_type)
+
+
+def _has_narrowed_fields(datatype):
+    # nested records are part of the file type of the record they're in, so
+    # a record with a narrowed field anywhere inside it needs a narrowed type.
+    for field in _record_fields(datatype):
+        if field.storage_type is not None:
+            return True
+        if field.type_definition.typecode == TypeCode.COMPOUND and _has_narrowed_fields(field.type_definition):
+            return True
+    return False
+
+
+def _render_file_type(backend, fields):
+    narrowed_members = []
+    for field in fields:
+        field_type = field.type_definition
+        if field.storage_type is not None:
+            storage_datatype = backend.render("atomic_datatype",
+                                              native_type=backend.native_type_names[field.storage_type.atomic_type])
+        elif field_type.typecode == TypeCode.COMPOUND and _has_narrowed_fields(field_type):
+            storage_datatype = backend.render("nested_file_datatype", safe_field_type=_safe_typename(field_type))
+        else:
+            continue
+        narrowed_members.append(backend.render("narrowed_member",
+                                               field_name=field.name,
+                                               storage_datatype=storage_datatype))
+
+    if len(narrowed_members) == 0:
+        return backend.render("packed_file_type")
+    return backend.render("narrowed_file_type", narrowed_members="".join(narrowed_members))
+
+
+def _render_staging(backend, datatype, fields, staged_types):
+    stored_members = []
+    stage_members = []
+    for field in fields:
+        field_type = field.type_definition
+        if not _is_staged_field(field, staged_types):
+            stored_members.append(backend.render("stored_member",
+                                                 qualified_name=datatype.fully_qualified_typename,
+                                                 field_name=field.name))
+            stage_members.append(backend.render("stage_copied_member", field_name=field.name))
+            continue
+
+        if field_type.typecode == TypeCode.VLSTRING:
+            template_name = "stored_vlstring_member"
+        elif field_type.typecode == TypeCode.VLSEQUENCE:
+            template_name = "stored_vlsequence_member"
+        else:
+            template_name = "stored_staged_member"
+        stored_members.append(backend.render(template_name,
+                                             field_name=field.name,
+                                             field_type=field_type.fully_qualified_typename,
+                                             extents="".join("[{0}]".format(extent)
+                                                             for extent in field.array_dims)))
+        stage_members.append(backend.render("stage_vlen_member", field_name=field.name))
+
+    return backend.render("staging",
+                          qualified_name=datatype.fully_qualified_typename,
+                          stored_members="".join(stored_members),
+                          stage_members="".join(stage_members))
+
+
+def _render_member(backend, field, seen_datatypes, members):
+    field_type = field.type_definition
+
+    if field_type.typecode == TypeCode.ATOMIC:
+        native_typename = backend.native_type_names[field_type.atomic_type]
+        assert native_typename is not None
+        if not field.is_array():
+            members.append(backend.render("atomic_member",
+                                          field_name=field.name,
+                                          native_type=native_typename))
+        else:
+            members.append(backend.render("atomic_array_member",
+                                          field_name=field.name,
+                                          native_type=native_typename,
+                                          **_array_values(field)))
+        return
+
+    if field_type.typecode == TypeCode.VLSTRING:
+        if not field.is_array():
+            members.append(backend.render("vlstring_member", field_name=field.name))
+        else:
+            members.append(backend.render("vlstring_array_member",
+                                          field_name=field.name,
+                                          **_array_values(field)))
+        return
+
+    if field_type.typecode == TypeCode.VLSEQUENCE:
+        element_type = field_type.element_type
+        if element_type.typecode == TypeCode.ATOMIC:
+            element_datatype = backend.render("atomic_datatype",
+                                              native_type=backend.native_type_names[element_type.atomic_type])
+        else:
+            element_datatype = backend.render("nested_datatype",
+                                              safe_field_type=_nested_instance(backend, element_type, seen_datatypes, members))
+        if not field.is_array():
+            members.append(backend.render("vlsequence_member",
+                                          field_name=field.name,
+                                          element_datatype=element_datatype))
+        else:
+            members.append(backend.render("vlsequence_array_member",
+                                          field_name=field.name,
+                                          element_datatype=element_datatype,
+                                          **_array_values(field)))
+        return
+
+    if field_type.typecode != TypeCode.COMPOUND and field_type.typecode != TypeCode.ENUM:
+        return
+
+    safe_typename = _nested_instance(backend, field_type, seen_datatypes, members)
+    if not field.is_array():
+        members.append(backend.render("nested_member",
+                                      field_name=field.name,
+                                      safe_field_type=safe_typename))
+    else:
+        members.append(backend.render("nested_array_member",
+                                      field_name=field.name,
+                                      safe_field_type=safe_typename,
+                                      **_array_values(field)))
+
+
+def _nested_instance(backend, field_type, seen_datatypes, members):
+    # compound and enum fields refer to the DxDataType of their type, which is
+    # looked up once per record.
+    safe_typename = _safe_typename(field_type)
+    if safe_typename not in seen_datatypes:
+        members.append(backend.render("nested_instance",
+                                      field_type=field_type.fully_qualified_typename,
+                                      safe_field_type=safe_typename))
+        seen_datatypes.add(safe_typename)
+    return safe_typename
+
+
+def _safe_typename(field_type):
+    return field_type.fully_qualified_typename.replace("::", '_')
+
+
+def _array_values(field):
+    dims = field.array_dims
+    return {
+        "rank": len(dims),
+        "dims": ", ".join(str(extent) for extent in dims),
+        "first_element": "[0]" * len(dims)
+    }
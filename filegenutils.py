@@ -24,27 +24,6 @@ SOFTWARE.
 '''
 import os
 
-class Indentation(object):
-    def __init__(self, default_indentation="", indentation_spaces=4):
-        self._idt = default_indentation
-        self._num_spaces = indentation_spaces
-    
-    def __str__(self):
-        return self._idt
-    
-    def __add__(self, other):
-        return self._idt + other
-
-    def __radd__(self, other):
-        return other + self._idt
-
-    def increment(self):
-        for i in range(0, self._num_spaces):
-            self._idt += " "
-
-    def decrement(self):
-        self._idt = self._idt[:-self._num_spaces]
-
 def build_include_list(parsed_file, file_excluder):
     include_filelist = []
     
@@ -72,9 +51,38 @@ def build_output_filepath(output_directory, parsed_filepath_no_dir, desired_outp
     output_filename = parsed_filepath_no_dir.replace(".{0}".format(input_file_ext), "_H5DataType.{0}".format(desired_output_ext))
     return os.path.join(output_directory, output_filename)
 
-def write_preamble(writefile, parsed_filename_no_dir):
-    writefile.write("//////////////////////////////////////////////////////////////////////////////////////\n")
-    writefile.write("// Auto-generated by the DxTransform tool.\n")
-    writefile.write("// Do not hand-edit this file; modify {0} and re-run the\n".format(parsed_filename_no_dir))
-    writefile.write("// DxTransform tool to re-generate the file.\n")
-    writefile.write("//////////////////////////////////////////////////////////////////////////////////////\n")
\ No newline at end of file
+def write_if_changed(filepath, contents):
+    '''
+        Replaces the file with contents unless it already holds exactly that,
+        so an unchanged output keeps its mtime and doesn't trigger rebuilds of
+        everything that includes it. returns True if the file was written.
+    '''
+    try:
+        with open(filepath, "r", newline='') as existing:
+            if existing.read() == contents:
+                return False
+    except OSError:
+        pass
+
+    # readers never see a partially written file.
+    tmp_path = "{0}.{1}.tmp".format(filepath, os.getpid())
+    with open(tmp_path, "w", newline='') as writefile:
+        writefile.write(contents)
+    os.replace(tmp_path, filepath)
+    return True
+
+def _escape_depfile_path(path):
+    return path.replace('\\', '/').replace('$', '$$').replace('#', '\\#').replace(' ', '\\ ')
+
+def build_depfile(rules):
+    '''
+        Renders a Make/Ninja depfile with one rule per (output, dependencies)
+        pair.
+    '''
+    lines = []
+    for output_filepath, dependencies in rules:
+        line = _escape_depfile_path(output_filepath) + ":"
+        for dependency in dependencies:
+            line += " \\\n  " + _escape_depfile_path(dependency)
+        lines.append(line + "\n")
+    return "".join(lines)
@@ -23,44 +23,331 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
+import os
+import re
 
 import clang.cindex
 from clang.cindex import CursorKind, TypeKind
 
 import clangworkarounds
+import tracing
+from atomictype import storage_type_by_name, storage_type_size
+from clangargs import build_clang_arglist
 from compoundtype import compound_type
 from enumtype import enumeration_type
 from exceptiontypes import CompilerError
 from logger import Logger, LogLevel
 from parsedfile import parsed_file
+from recordlayout import record_layout
+from typecode import TypeCode
 from typemanager import type_manager
 from uniontype import union_type
+from varlentype import vlsequence_type, vlstring_type
 
 
-def _build_typeman_recurse(logger, typeman, cursor):
+_type_declaration_kinds = (CursorKind.STRUCT_DECL, CursorKind.CLASS_DECL,
+                           CursorKind.UNION_DECL, CursorKind.ENUM_DECL)
+
+# marks a field that's left out of the generated type, either as an annotate
+# attribute (H5GEN_SKIP in H5GenAnnotations.h) or in the field's doc comment.
+_SKIP_FIELD_MARKER = "h5gen::skip"
+
+# gives the type a field is stored as in the file, the same two ways
+# (H5GEN_STORE_AS, or h5gen::store_as=int16 in the doc comment).
+_STORE_AS_MARKER = "h5gen::store_as="
+_store_as_comment = re.compile(r'h5gen::store_as\s*=\s*([\w:]+)')
+
+# the std:: class templates whose fields are written as variable-length data.
+_variable_length_templates = ("basic_string", "vector")
+
+
+class _traversal_scope(object):
+    '''
+        Decides where the type walk goes. only namespaces and type declarations
+        from the target file itself are walked; a type from any other file is
+        added on demand when a field uses it, unless the file it's declared in
+        is excluded. that keeps the walk out of the standard library and other
+        headers the target merely includes. it also decides which fields are
+        left out of a record.
+    '''
+
+    def __init__(self, target_filename, file_excluder, collect_layouts=False):
+        self._target = os.path.realpath(target_filename)
+        self._file_excluder = file_excluder
+        self._collect_layouts = collect_layouts
+        self._realpaths = {}
+        self._excluded = {}
+        # the records whose fields are being walked, innermost last.
+        self._open_records = []
+
+    def _declaring_file(self, cursor):
+        location_file = cursor.location.file
+        if location_file is None:
+            return None
+        filename = location_file.name
+        # resolved rather than just normalized: clang reports system headers
+        # through paths like /../lib/gcc/.../../../../include, where a
+        # lexical normalization goes wrong if /lib is a symlink.
+        realpath = self._realpaths.get(filename)
+        if realpath is None:
+            realpath = os.path.realpath(filename)
+            self._realpaths[filename] = realpath
+        return realpath
+
+    @property
+    def collect_layouts(self):
+        # layouts are only read for the layout report.
+        return self._collect_layouts
+
+    def open_record(self, datatype):
+        self._open_records.append(datatype)
+
+    def close_record(self):
+        self._open_records.pop()
+
+    def is_open_record(self, datatype):
+        return any(datatype is open_record for open_record in self._open_records)
+
+    def is_target_declaration(self, cursor):
+        return self._declaring_file(cursor) == self._target
+
+    def is_excluded_field(self, record_cursor, field_cursor):
+        for field_child in field_cursor.get_children():
+            if field_child.kind == CursorKind.ANNOTATE_ATTR and field_child.spelling == _SKIP_FIELD_MARKER:
+                return True
+        comment = field_cursor.raw_comment
+        if comment is not None and _SKIP_FIELD_MARKER in comment:
+            return True
+        return self._file_excluder is not None and \
+            self._file_excluder.is_excluded_field(record_cursor.type.spelling, field_cursor.spelling)
+
+    def field_storage_typename(self, record_cursor, field_cursor):
+        '''
+            Returns the name of the type a field is to be stored as in the
+            file, or None if it's stored as its own type. the source wins over
+            the rules file.
+        '''
+        for field_child in field_cursor.get_children():
+            if field_child.kind == CursorKind.ANNOTATE_ATTR and field_child.spelling.startswith(_STORE_AS_MARKER):
+                return field_child.spelling[len(_STORE_AS_MARKER):]
+        comment = field_cursor.raw_comment
+        if comment is not None:
+            match = _store_as_comment.search(comment)
+            if match is not None:
+                return match.group(1)
+        if self._file_excluder is None:
+            return None
+        return self._file_excluder.field_storage_typename(record_cursor.type.spelling, field_cursor.spelling)
+
+    def is_excluded_declaration(self, cursor):
+        declaring_file = self._declaring_file(cursor)
+        if declaring_file is None:
+            return True
+        if self._file_excluder is None:
+            return False
+        excluded = self._excluded.get(declaring_file)
+        if excluded is None:
+            excluded = self._file_excluder.is_excluded_path(declaring_file)
+            self._excluded[declaring_file] = excluded
+        return excluded
+
+
+def _add_declared_type(logger, typeman, cursor, scope):
+    type_location = cursor.type.get_declaration().location.file.name
+    if cursor.kind == CursorKind.ENUM_DECL:
+        declared_type = enumeration_type(
+            cursor.type.spelling, cursor.enum_type.spelling, type_location)
+    elif cursor.kind == CursorKind.UNION_DECL:
+        declared_type = union_type(cursor.type.spelling, type_location)
+    else:
+        declared_type = compound_type(cursor.type.spelling, type_location)
+
+    typeman.add_type(cursor.type.spelling, declared_type)
+    scope.open_record(declared_type)
+    try:
+        _build_typeman_recurse(logger, typeman, cursor, scope)
+    finally:
+        scope.close_record()
+    if scope.collect_layouts and cursor.kind != CursorKind.ENUM_DECL:
+        declared_type.layout = _record_layout(cursor)
+
+
+def _record_layout(cursor):
+    '''
+        Returns the compiler's layout of a record, or None if it can't be
+        described field by field (it has base classes or virtual functions,
+        whose storage libclang doesn't report, or isn't a complete type).
+    '''
+    size = cursor.type.get_size()
+    alignment = cursor.type.get_align()
+    if size < 0 or alignment < 0:
+        return None
+
+    layout = record_layout(size, alignment, cursor.kind == CursorKind.UNION_DECL)
+    for child in cursor.get_children():
+        if child.kind == CursorKind.CXX_BASE_SPECIFIER:
+            return None
+        if child.kind in (CursorKind.CXX_METHOD, CursorKind.DESTRUCTOR) and child.is_virtual_method():
+            return None
+        if child.kind == CursorKind.FIELD_DECL:
+            offset_bits = child.get_field_offsetof()
+            if offset_bits < 0:
+                return None
+            bit_width = child.get_bitfield_width() if child.is_bitfield() else None
+            layout.add_field(child.spelling, offset_bits, child.type.get_size(), child.type.get_align(), bit_width)
+    return layout
+
+
+def _resolve_field_type(logger, typeman, field_type, scope):
+    '''
+        Returns the type manager's type for a field, adding the definition of
+        the field's type first if it hasn't been seen yet. returns None if the
+        type can't be written (it isn't a record, enum, std::string or
+        std::vector, is anonymous, or is declared in an excluded file).
+    '''
+    if typeman.is_known_type(field_type.spelling):
+        return typeman.get_type(field_type.spelling)
+
+    declaration = field_type.get_declaration()
+    definition = declaration.get_definition() if declaration is not None else None
+    if definition is None or definition.kind not in _type_declaration_kinds or len(definition.spelling) == 0:
+        return None
+
+    template_name = _standard_library_template(definition)
+    if template_name in _variable_length_templates:
+        return _resolve_variable_length_type(logger, typeman, field_type, template_name, scope)
+
+    if scope.is_excluded_declaration(definition):
+        if logger.is_enabled(LogLevel.Debug2):
+            logger.log(LogLevel.Debug2, "Not adding {0}; it is declared in an excluded file.".format(
+                field_type.spelling))
+        return None
+
+    if not typeman.is_known_type(definition.type.spelling):
+        _add_declared_type(logger, typeman, definition, scope)
+
+    if typeman.is_known_type(field_type.spelling):
+        return typeman.get_type(field_type.spelling)
+    return None
+
+
+def _standard_library_template(definition):
+    '''
+        Returns the name of the std:: class template a record definition is a
+        specialization of (looking through inline namespaces like __cxx11), or
+        None if it isn't declared in std.
+    '''
+    if definition.kind not in (CursorKind.CLASS_DECL, CursorKind.STRUCT_DECL):
+        return None
+
+    outermost_namespace = None
+    parent = definition.semantic_parent
+    while parent is not None and parent.kind != CursorKind.TRANSLATION_UNIT:
+        if parent.kind != CursorKind.NAMESPACE:
+            return None
+        outermost_namespace = parent.spelling
+        parent = parent.semantic_parent
+
+    if outermost_namespace != "std":
+        return None
+    return definition.spelling
+
+
+def _resolve_variable_length_type(logger, typeman, field_type, template_name, scope):
+    if template_name == "basic_string":
+        if field_type.get_template_argument_type(0).kind in (TypeKind.CHAR_S, TypeKind.CHAR_U):
+            return vlstring_type()
+        logger.log(LogLevel.Warning, "Only std::string is supported as a variable-length string, not {0}.".format(
+            field_type.spelling))
+        return None
+
+    # the elements of a vector are written straight from the vector's
+    # storage, so they have to have a fixed layout themselves. std::vector<bool>
+    # has no element storage to speak of.
+    element_type = field_type.get_template_argument_type(0).get_canonical()
+    if element_type.kind == TypeKind.BOOL:
+        logger.log(LogLevel.Warning, "std::vector<bool> can't be written as a variable-length sequence.")
+        return None
+
+    resolved_element_type = _resolve_field_type(logger, typeman, element_type, scope)
+    if resolved_element_type is None or \
+            resolved_element_type.typecode in (TypeCode.VLSTRING, TypeCode.VLSEQUENCE) or \
+            _has_variable_length_members(resolved_element_type, scope):
+        logger.log(LogLevel.Warning, "Unsupported element type for a variable-length sequence: {0}".format(
+            field_type.spelling))
+        return None
+    return vlsequence_type(resolved_element_type)
+
+
+def _has_variable_length_members(datatype, scope):
+    '''
+        Whether a record has std::string or std::vector members, directly or
+        in a nested record. such a record is staged before it's written, which
+        the elements of a sequence, copied straight from the vector, can't be.
+        a record whose fields are still being walked reaches the sequence being
+        resolved, so it has one.
+    '''
+    if datatype.typecode != TypeCode.COMPOUND:
+        return False
+    if scope.is_open_record(datatype):
+        return True
+    for field in datatype.fields:
+        field_type = field.type_definition
+        if field_type.typecode in (TypeCode.VLSTRING, TypeCode.VLSEQUENCE):
+            return True
+        if _has_variable_length_members(field_type, scope):
+            return True
+    return False
+
+
+def _field_storage_type(logger, record_cursor, field_cursor, field_type, scope):
+    '''
+        Returns the atomic type a field is stored as in the file if it's
+        given one, or None. only arithmetic fields (and arrays of them) can be
+        stored as another type, and only one smaller than their own, since the
+        file type keeps each member at its offset in the record until it's
+        packed. HDF5 converts them when the records are written.
+    '''
+    storage_typename = scope.field_storage_typename(record_cursor, field_cursor)
+    if storage_typename is None:
+        return None
+
+    qualified_field_name = "{0}::{1}".format(record_cursor.type.spelling, field_cursor.spelling)
+    storage_type = storage_type_by_name(storage_typename)
+    if storage_type is None:
+        logger.log(LogLevel.Warning, "Unknown storage type {0} for {1}; it is stored as declared.".format(
+            storage_typename, qualified_field_name))
+        return None
+    if field_type.typecode != TypeCode.ATOMIC:
+        logger.log(LogLevel.Warning, "Only arithmetic fields can be stored as another type; {0} is stored as declared.".format(
+            qualified_field_name))
+        return None
+    if storage_type is field_type:
+        return None
+
+    element_type = field_cursor.type.get_canonical()
+    while element_type.kind == TypeKind.CONSTANTARRAY:
+        element_type = element_type.element_type
+    if storage_type_size(storage_type) >= element_type.get_size():
+        logger.log(LogLevel.Warning, "{0} isn't narrower than the type of {1}; it is stored as declared.".format(
+            storage_type.typename, qualified_field_name))
+        return None
+
+    if logger.is_enabled(LogLevel.Debug1):
+        logger.log(LogLevel.Debug1, "Storing {0} as {1}.".format(qualified_field_name, storage_type.typename))
+    return storage_type
+
+
+def _build_typeman_recurse(logger, typeman, cursor, scope):
     for child in cursor.get_children():
         if len(child.spelling) > 0:
             if child.kind == CursorKind.NAMESPACE:
-                _build_typeman_recurse(logger, typeman, child)
-            elif child.kind == CursorKind.STRUCT_DECL or child.kind == CursorKind.CLASS_DECL:
-                if child.is_definition():
-                    type_location = child.type.get_declaration().location.file.name
-                    ctype = compound_type(child.type.spelling, type_location)
-                    typeman.add_type(child.type.spelling, ctype)
-                    _build_typeman_recurse(logger, typeman, child)
-            elif child.kind == CursorKind.UNION_DECL:
-                if child.is_definition():
-                    type_location = child.type.get_declaration().location.file.name
-                    ctype = union_type(child.type.spelling, type_location)
-                    typeman.add_type(child.type.spelling, ctype)
-                    _build_typeman_recurse(logger, typeman, child)
-            elif child.kind == CursorKind.ENUM_DECL:
-                if child.is_definition():
-                    enum_location = child.type.get_declaration().location.file.name
-                    etype = enumeration_type(
-                        child.type.spelling, child.enum_type.spelling, enum_location)
-                    typeman.add_type(child.type.spelling, etype)
-                    _build_typeman_recurse(logger, typeman, child)
+                if scope.is_target_declaration(child):
+                    _build_typeman_recurse(logger, typeman, child, scope)
+            elif child.kind in _type_declaration_kinds:
+                if child.is_definition() and scope.is_target_declaration(child) and \
+                        not typeman.is_known_type(child.type.spelling):
+                    _add_declared_type(logger, typeman, child, scope)
 
             # we take advantage of the fact that we only ever expect to see this
             # cursor kind if we are parsing an enumeration. we assume that the parent
@@ -73,25 +360,44 @@ def _build_typeman_recurse(logger, typeman, cursor):
             # the field declaration logic takes advantage of an assumption that we will only
             # see this cursor type when parsing an existing structure/class definition.
             elif child.kind == CursorKind.FIELD_DECL:
+                # an excluded field is simply not part of the record's model;
+                # the members that are written keep their offsets in the struct.
+                if scope.is_excluded_field(cursor, child):
+                    if logger.is_enabled(LogLevel.Debug1):
+                        logger.log(LogLevel.Debug1, "Excluding field {0} of {1}.".format(
+                            child.spelling, cursor.type.spelling))
+                    continue
 
                 # see if the type is an array. if so, try to rip out
                 # the type information from it. we work in the opposite fashion
                 # of clang; whereas clang encodes the array information into the type,
-                # we want to encode that information on a per-field basis
-                if child.type.kind == TypeKind.CONSTANTARRAY:
-                    realtype = child.type.element_type.get_canonical()
+                # we want to encode that information on a per-field basis. arrays of
+                # arrays (and typedefs of arrays) are peeled one dimension at a time.
+                if child.type.get_canonical().kind == TypeKind.CONSTANTARRAY:
+                    array_dims = []
+                    elemtype = child.type
+                    while elemtype.get_canonical().kind == TypeKind.CONSTANTARRAY:
+                        canonical_array = elemtype.get_canonical()
+                        array_dims.append(canonical_array.element_count)
+                        if elemtype.kind == TypeKind.CONSTANTARRAY:
+                            elemtype = elemtype.element_type
+                        else:
+                            elemtype = canonical_array.element_type
+
+                    realtype = elemtype.get_canonical()
                     if len(realtype.spelling) == 0:
-                        realtype = child.type.element_type
+                        realtype = elemtype
 
-                    numelems = child.type.element_count
-                    if typeman.is_known_type(realtype.spelling):
-                        logger.log(LogLevel.Debug1, "Array var: {0} (child of struct: {1})".format(
-                            child.spelling, cursor.type.spelling))
-                        field_type = typeman.get_type(realtype.spelling)
+                    field_type = _resolve_field_type(logger, typeman, realtype, scope)
+                    if field_type is not None:
+                        if logger.is_enabled(LogLevel.Debug1):
+                            logger.log(LogLevel.Debug1, "Array var: {0} (child of struct: {1})".format(
+                                child.spelling, cursor.type.spelling))
                         active_compound_type = typeman.get_type(
                             cursor.type.spelling)
                         active_compound_type.add_field(
-                            child.spelling, field_type, numelems)
+                            child.spelling, field_type, array_dims,
+                            _field_storage_type(logger, cursor, child, field_type, scope))
                     else:
                         logger.log(LogLevel.Warning, "Unknown array type not known to type manager: {0} | {1}".format(
                             realtype.spelling, child.type.spelling))
@@ -103,54 +409,59 @@ def _build_typeman_recurse(logger, typeman, cursor):
                     if len(canonical_type.spelling) == 0:
                         canonical_type = child.type
 
-                    if typeman.is_known_type(canonical_type.spelling):
-                        logger.log(LogLevel.Debug1, "Non-array var: {0} (child of struct: {1})".format(
-                            child.spelling, cursor.type.spelling))
-                        field_type = typeman.get_type(canonical_type.spelling)
+                    field_type = _resolve_field_type(logger, typeman, canonical_type, scope)
+                    if field_type is not None:
+                        if logger.is_enabled(LogLevel.Debug1):
+                            logger.log(LogLevel.Debug1, "Non-array var: {0} (child of struct: {1})".format(
+                                child.spelling, cursor.type.spelling))
                         active_compound_type = typeman.get_type(
                             cursor.type.spelling)
                         active_compound_type.add_field(
-                            child.spelling, field_type)
+                            child.spelling, field_type, (),
+                            _field_storage_type(logger, cursor, child, field_type, scope))
                     else:
                         logger.log(LogLevel.Warning, "Unknown type not known to type manager: {0}".format(
                             child.type.spelling))
 
 
 def _build_include_list(typeman, additional_include_dirs):
-    inclist = []
-    for type in typeman.get_compound_types():
-        inclist.append(type.declaration_filename)
-    for type in typeman.get_enum_types():
-        inclist.append(type.declaration_filename)
-    for type in typeman.get_union_types():
-        inclist.append(type.declaration_filename)
-    return inclist
+    return typeman.get_declaring_files()
+
 
+default_parser_options = (
+    # needed for preprocessing parsing
+    clangworkarounds.CXTranslationUnit_DetailedPreprocessingRecord |
+    clangworkarounds.CXTranslationUnit_SkipFunctionBodies |  # for faster parsing
+    clangworkarounds.CXTranslationUnit_KeepGoing  # don't stop on errors
+)
 
-def parse_input_file(input_filename, logger, additional_include_dirs=[]):
+
+def parse_input_file(input_filename, logger, additional_include_dirs=[], extra_args=[], file_excluder=None,
+                     collect_layouts=False):
     index = clang.cindex.Index.create()
 
-    default_parser_options = (
-        # needed for preprocessing parsing
-        clangworkarounds.CXTranslationUnit_DetailedPreprocessingRecord |
-        clangworkarounds.CXTranslationUnit_SkipFunctionBodies |  # for faster parsing
-        clangworkarounds.CXTranslationUnit_KeepGoing  # don't stop on errors
-    )
+    arglist = build_clang_arglist(additional_include_dirs, extra_args)
+
+    with tracing.span("libclang parse", "parse", file=input_filename):
+        translation_unit = index.parse(
+            input_filename, args=arglist, options=default_parser_options)
 
-    # force C++ parsing, so that way headers are parsed correctly if they contain
-    # C++-style declarations.
-    arglist = ['-x', 'c++', '-std=c++11']
-    for dir in additional_include_dirs:
-        arglist.append('-I')
-        arglist.append(dir)
+    return build_parsed_file(translation_unit, input_filename, logger, additional_include_dirs, file_excluder,
+                             collect_layouts)
 
-    translation_unit = index.parse(
-        input_filename, args=arglist, options=default_parser_options)
 
+def build_parsed_file(translation_unit, input_filename, logger, additional_include_dirs=[], file_excluder=None,
+                      collect_layouts=False):
+    '''
+        Builds the parse result from an already parsed (or reparsed)
+        translation unit. the memory layout of each record is only read if
+        collect_layouts is set.
+    '''
     compiler_errorlist = []
-    for diagnostic in translation_unit.diagnostics:
-        if diagnostic.severity == clang.cindex.Diagnostic.Error or diagnostic.severity == clang.cindex.Diagnostic.Fatal:
-            compiler_errorlist.append(diagnostic)
+    with tracing.span("diagnostics scan", "parse", file=input_filename):
+        for diagnostic in translation_unit.diagnostics:
+            if diagnostic.severity == clang.cindex.Diagnostic.Error or diagnostic.severity == clang.cindex.Diagnostic.Fatal:
+                compiler_errorlist.append(diagnostic)
 
     if len(compiler_errorlist) > 0:
         raise CompilerError(compiler_errorlist)
@@ -158,7 +469,20 @@ def parse_input_file(input_filename, logger, additional_include_dirs=[]):
     # old way
     typeman = type_manager()
 
-    _build_typeman_recurse(logger, typeman, translation_unit.cursor)
+    with tracing.span("AST traversal", "parse", file=input_filename):
+        _build_typeman_recurse(logger, typeman, translation_unit.cursor,
+                               _traversal_scope(input_filename, file_excluder, collect_layouts))
     include_list = _build_include_list(typeman, additional_include_dirs)
 
-    return parsed_file(input_filename, typeman, include_list, additional_include_dirs)
+    # every file the translation unit pulled in, so callers can tell when the
+    # parse result is out of date.
+    tu_files = [os.path.realpath(input_filename)]
+    seen_files = set(tu_files)
+    with tracing.span("translation unit includes", "parse", file=input_filename):
+        for inclusion in translation_unit.get_includes():
+            included = os.path.realpath(inclusion.include.name)
+            if included not in seen_files:
+                seen_files.add(included)
+                tu_files.append(included)
+
+    return parsed_file(input_filename, typeman, include_list, additional_include_dirs, tu_files)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import argparse
+import collections
+import json
+import os
+import socket
+import socketserver
+import stat
+import time
+
+import clangworkarounds
+from clangargs import build_clang_arglist
+from exceptiontypes import CompilerError, SevereLogMsgException
+from fileexclusion import FileExcluder
+from filegen import render_output_header, render_output_source, select_backend
+from typeclosure import find_root_types, reachable_typenames
+from filegenutils import build_depfile, build_output_filepath, write_if_changed
+from logger import Logger, LogLevel
+
+
+def _snapshot(files):
+    snapshot = {}
+    for f in files:
+        try:
+            file_stat = os.stat(f)
+            snapshot[f] = (file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            snapshot[f] = None
+    return snapshot
+
+
+# never equal to the state of a file, so a unit holding it is always stale.
+_CHANGED_WHILE_PARSING = ('changed while parsing',)
+
+
+def _snapshot_after_parse(files, before, parse_start_ns):
+    '''
+        Snapshots the files of a finished parse. a file that was stat'ed
+        before the parse keeps that state, so an edit made while parsing is
+        seen as a change on the next request. a file first seen in the parse
+        can only be stat'ed now; if it was modified after the parse started it
+        is recorded as changed.
+    '''
+    snapshot = _snapshot([f for f in files if f not in before])
+    for f, state in snapshot.items():
+        if state is not None and state[0] >= parse_start_ns:
+            snapshot[f] = _CHANGED_WHILE_PARSING
+    for f in files:
+        if f in before:
+            snapshot[f] = before[f]
+    return snapshot
+
+
+class _WarmUnit(object):
+    def __init__(self, translation_unit, parsed_file, snapshot):
+        self._translation_unit = translation_unit
+        self._parsed_file = parsed_file
+        self._snapshot = snapshot
+
+    @property
+    def translation_unit(self):
+        return self._translation_unit
+
+    @property
+    def parsed_file(self):
+        return self._parsed_file
+
+    def is_stale(self):
+        return _snapshot(self._parsed_file.translation_unit_files) != self._snapshot
+
+
+class GeneratorSession(object):
+    '''
+        Keeps a libclang index and the translation units it parsed alive
+        between requests. a target whose files haven't changed since it was
+        last parsed is served from memory; one whose files have is reparsed,
+        which reuses the precompiled preamble of the translation unit.
+
+        this is also the in-process API: generate() returns the text of the
+        transform header without going through the command line or any files.
+    '''
+
+    def __init__(self, logger, clang_library_file=None, max_translation_units=64):
+        import clang.cindex
+        from fileparse import default_parser_options
+
+        if clang_library_file is not None and not clang.cindex.Config.loaded:
+            clang.cindex.Config.set_library_file(clang_library_file)
+
+        self._logger = logger
+        self._index = clang.cindex.Index.create()
+        self._parser_options = (
+            default_parser_options |
+            clangworkarounds.CXTranslationUnit_PrecompiledPreamble |
+            clangworkarounds.CXTranslationUnit_CreatePreambleOnFirstParse
+        )
+        self._max_translation_units = max_translation_units
+        # least recently used first.
+        self._units = collections.OrderedDict()
+
+    def parse(self, target_file, include_dirs=[], extra_args=[], file_excluder=None):
+        '''
+            Returns the parse result for the target, parsing or reparsing it
+            only if needed. raises CompilerError like parse_input_file does.
+        '''
+        from fileparse import build_parsed_file
+
+        target_file = os.path.abspath(target_file)
+        excluded_paths = tuple(file_excluder.excluded_paths) if file_excluder is not None else ()
+        excluded_fields = tuple(file_excluder.excluded_field_patterns) if file_excluder is not None else ()
+        storage_rules = tuple(file_excluder.field_storage_rules) if file_excluder is not None else ()
+        key = (target_file, tuple(include_dirs), tuple(extra_args), excluded_paths, excluded_fields, storage_rules)
+
+        unit = self._units.get(key)
+        if unit is not None:
+            self._units.move_to_end(key)
+            if not unit.is_stale():
+                self._logger.log(LogLevel.Debug1, "{0} is unchanged; using the warm parse.".format(target_file))
+                return unit.parsed_file
+
+        # the files are stat'ed before they are parsed; stat'ing them after
+        # would record an edit made during the parse as already parsed.
+        parse_start_ns = time.time_ns()
+        before = _snapshot(unit.parsed_file.translation_unit_files if unit is not None else [target_file])
+
+        if unit is not None:
+            self._logger.log(LogLevel.Info, "Reparsing {0}.".format(target_file))
+            translation_unit = unit.translation_unit
+            # the parse options were given when the unit was created; reparse
+            # takes its own (reparse) flags, of which none are needed.
+            translation_unit.reparse()
+        else:
+            self._logger.log(LogLevel.Info, "Parsing {0}.".format(target_file))
+            translation_unit = self._index.parse(target_file,
+                                                 args=build_clang_arglist(include_dirs, extra_args),
+                                                 options=self._parser_options)
+
+        # a translation unit that doesn't compile isn't kept; the next request
+        # for it starts over.
+        self._units.pop(key, None)
+        parsed = build_parsed_file(translation_unit, target_file, self._logger, include_dirs, file_excluder)
+
+        self._units[key] = _WarmUnit(translation_unit, parsed, _snapshot_after_parse(
+            parsed.translation_unit_files, before, parse_start_ns))
+        while len(self._units) > self._max_translation_units:
+            self._units.popitem(last=False)
+        return parsed
+
+    def generate(self, target_file, include_dirs=[], extra_args=[], file_excluder=None, backend=None):
+        if file_excluder is None:
+            file_excluder = FileExcluder()
+        return render_output_header(self.parse(target_file, include_dirs, extra_args, file_excluder),
+                                    file_excluder, backend)
+
+    def handle_request(self, request):
+        '''
+            Serves one request from a client: generates a transform header into
+            output_dir for every entry in targets, and optionally a depfile.
+            if root_types is given, only the types reachable from them are
+            generated. out_of_line and definitions_out work like the
+            transform.py options of the same name.
+        '''
+        file_excluder = FileExcluder(request.get('ignore_file'), request.get('field_rules'))
+        output_dir = request['output_dir']
+        try:
+            backend = select_backend(request.get('template_dir'))
+        except (OSError, ValueError) as err:
+            return {'outputs': [], 'errors': ["Could not load the templates in {0}: {1}".format(
+                request.get('template_dir'), err)]}
+
+        outputs = []
+        errors = []
+        parsed_targets = []
+        for target in request['targets']:
+            target_file = target['target_file']
+            try:
+                parsed_targets.append((target_file, self.parse(
+                    target_file, target.get('include_dirs', []), target.get('extra_args', []), file_excluder)))
+            except CompilerError as err:
+                errors.append("The following compiler error(s) were encountered when parsing {0}:\n{1}".format(
+                    target_file, err))
+            except SevereLogMsgException as logerr:
+                errors.append(str(logerr))
+
+        # the roots are looked up once all targets are parsed, since a root
+        # may be declared in any of them.
+        emitted_typenames = None
+        if request.get('root_types') is not None:
+            try:
+                emitted_typenames = reachable_typenames(find_root_types(
+                    [parsed.type_manager for target_file, parsed in parsed_targets], request['root_types'], self._logger))
+            except SevereLogMsgException as logerr:
+                return {'outputs': [], 'errors': errors + [str(logerr)]}
+
+        definitions_out = request.get('definitions_out')
+        out_of_line = request.get('out_of_line', False) or definitions_out is not None
+        depfile_rules = []
+        for target_file, parsed in parsed_targets:
+            output_filepath = build_output_filepath(output_dir, os.path.basename(target_file), "h")
+            write_if_changed(output_filepath, render_output_header(parsed, file_excluder, backend, emitted_typenames,
+                                                                   out_of_line))
+            outputs.append(output_filepath)
+            depfile_rules.append((output_filepath, parsed.translation_unit_files))
+
+            if out_of_line and definitions_out is None:
+                source_filepath = build_output_filepath(output_dir, os.path.basename(target_file), "cpp")
+                write_if_changed(source_filepath, render_output_source([parsed], file_excluder, backend, emitted_typenames))
+                outputs.append(source_filepath)
+                depfile_rules.append((source_filepath, parsed.translation_unit_files))
+
+        if definitions_out is not None and len(parsed_targets) > 0:
+            parsed_files = [parsed for target_file, parsed in parsed_targets]
+            write_if_changed(definitions_out, render_output_source(parsed_files, file_excluder, backend, emitted_typenames))
+            outputs.append(definitions_out)
+            dependencies = []
+            for parsed in parsed_files:
+                dependencies += [f for f in parsed.translation_unit_files if f not in dependencies]
+            depfile_rules.append((definitions_out, dependencies))
+
+        if request.get('depfile') is not None:
+            write_if_changed(request['depfile'], build_depfile(depfile_rules))
+
+        return {'outputs': outputs, 'errors': errors}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    # one JSON object per line each way, one request per connection.
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            if request.get('command') == 'shutdown':
+                response = {'outputs': [], 'errors': []}
+                self.server.stop_requested = True
+            else:
+                response = self.server.session.handle_request(request)
+        except Exception as err:
+            # e.g. an output directory that can't be written to. the client
+            # always gets a reply, and the daemon goes on serving.
+            response = {'outputs': [], 'errors': ["The request could not be served: {0}: {1}".format(
+                type(err).__name__, err)]}
+        self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class _GeneratorServer(socketserver.UnixStreamServer):
+    def __init__(self, socket_path, session):
+        # libclang translation units aren't thread safe, so requests are
+        # served one at a time.
+        socketserver.UnixStreamServer.__init__(self, socket_path, _RequestHandler)
+        self.session = session
+        self.stop_requested = False
+
+
+def serve(socket_path, session, logger):
+    # a socket left behind by a daemon that didn't shut down cleanly.
+    if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+        os.unlink(socket_path)
+
+    server = _GeneratorServer(socket_path, session)
+    logger.log(LogLevel.Info, "Serving generation requests on {0}.".format(socket_path))
+    try:
+        while not server.stop_requested:
+            server.handle_request()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def send_request(socket_path, request):
+    '''
+        Sends a request to a running daemon and returns its response, or None
+        if the daemon didn't send a valid one. every path in the request must
+        be absolute; the daemon has its own working directory. raises OSError
+        if the daemon can't be reached.
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode())
+        with client.makefile('rb') as response_file:
+            reply = response_file.readline().decode()
+    try:
+        response = json.loads(reply)
+    except ValueError:
+        return None
+    if not isinstance(response, dict) or 'errors' not in response or 'outputs' not in response:
+        return None
+    return response
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(
+            description="Keeps libclang and parsed headers warm and serves transform.py --server requests over a Unix socket.")
+        parser.add_argument('--socket', '-s', help='the path of the Unix socket to listen on.', required=True)
+
+        parser.add_argument('--clang-library-file', '-l',
+                            help='the Clang library file the generator will use as the parser front-end.',
+                            default='libclang-12.so')
+
+        parser.add_argument('--verbosity', '-v',
+                            help='the verbosity of information output to the screen. The higher the value, the more debug output is generated.',
+                            default=2, type=int)
+
+        parser.add_argument('--enable-warnings-as-errors', '-w',
+                            help='all tool-generated warnings will emit a fatal error and stop generation of the affected file.',
+                            default=False, action='store_true')
+
+        parser.add_argument('--max-translation-units', '-m',
+                            help='the number of parsed translation units kept in memory.',
+                            default=64, type=int)
+
+        parser.add_argument('--stop',
+                            help='ask the daemon listening on the socket to shut down, then exit.',
+                            default=False, action='store_true')
+
+        args = parser.parse_args()
+        logger = Logger(args.verbosity, args.enable_warnings_as_errors)
+
+        if args.stop:
+            send_request(args.socket, {'command': 'shutdown'})
+        else:
+            session = GeneratorSession(logger, args.clang_library_file, args.max_translation_units)
+            serve(args.socket, session, logger)
+
+    except SevereLogMsgException as logerr:
+        pass
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import atomictype
+from codetemplate import emission_backend, register_backend
+
+'''
+    The templates filegen renders DxDataType specializations for HDF5 from.
+    a template directory passed to transform.py can override any of them
+    by name.
+'''
+
+_file_template = '''\
+//////////////////////////////////////////////////////////////////////////////////////
+// Auto-generated by the DxTransform tool.
+// Do not hand-edit this file; modify $source_filename and re-run the
+// DxTransform tool to re-generate the file.
+//////////////////////////////////////////////////////////////////////////////////////
+#ifndef ${include_guard}_H5_DATATYPE_H
+#define ${include_guard}_H5_DATATYPE_H
+
+#include "DxDataType.h"
+${includes}
+${types}
+#endif
+'''
+
+_include_template = '''\
+#include "$include"
+'''
+
+# out-of-line emission: the header only declares each specialization, and
+# the constructors (and the instance every process shares) are defined once
+# in a source file.
+_source_file_template = '''\
+//////////////////////////////////////////////////////////////////////////////////////
+// Auto-generated by the DxTransform tool.
+// Do not hand-edit this file; modify $source_filename and re-run the
+// DxTransform tool to re-generate the file.
+//////////////////////////////////////////////////////////////////////////////////////
+${includes}
+${definitions}'''
+
+_enum_template = '''\
+namespace h5gen {
+    template <>
+    class DxDataType<$qualified_name> {
+    public:
+        static DxDataType& instance() noexcept {
+            static DxDataType<$qualified_name> e {};
+            return e;
+        }
+        const H5::DataType& h5_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const H5::DataType& h5_file_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const char* type_name() const noexcept {
+            return "$name";
+        }
+
+    private:
+        DxDataType() noexcept:
+            datatype_(sizeof($qualified_name))
+        {
+            $underlying_type ev {};
+${constants}        }
+
+        H5::EnumType datatype_;
+    };
+
+}
+'''
+
+_enum_declaration_template = '''\
+namespace h5gen {
+    template <>
+    class DxDataType<$qualified_name> {
+    public:
+        static DxDataType& instance() noexcept;
+
+        const H5::DataType& h5_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const H5::DataType& h5_file_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const char* type_name() const noexcept {
+            return "$name";
+        }
+
+    private:
+        DxDataType() noexcept;
+
+        H5::EnumType datatype_;
+    };
+
+}
+'''
+
+_enum_definition_template = '''\
+namespace h5gen {
+    DxDataType<$qualified_name>& DxDataType<$qualified_name>::instance() noexcept {
+        static DxDataType<$qualified_name> e {};
+        return e;
+    }
+
+    DxDataType<$qualified_name>::DxDataType() noexcept:
+        datatype_(sizeof($qualified_name))
+    {
+        $underlying_type ev {};
+${constants}    }
+
+}
+'''
+
+_enum_constant_template = '''\
+            datatype_.insert("$constant_name", (ev=$constant_value,&ev));
+'''
+
+# compounds and unions share this. the in-memory type mirrors the struct
+# layout, padding included; the file type is a packed copy of it (nested
+# compounds and arrays are packed too), so padding bytes are never written.
+# fields given a storage type have that type in the file type instead.
+_record_template = '''\
+namespace h5gen {
+    template <>
+    class DxDataType<$qualified_name> {
+    public:
+        static DxDataType& instance() noexcept {
+            static DxDataType<$qualified_name> e {};
+            return e;
+        }
+
+        const H5::DataType& h5_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const H5::DataType& h5_file_datatype() const noexcept {
+            return file_datatype_;
+        }
+
+        const char* type_name() const noexcept {
+            return "$name";
+        }
+${staging}
+    private:
+        DxDataType() noexcept:
+            datatype_(sizeof($layout_type))
+        {
+            static constexpr $layout_type zzz_tmp {};
+${members}${file_type}        }
+
+        H5::CompType datatype_;
+        H5::CompType file_datatype_;
+    };
+
+}
+'''
+
+_record_declaration_template = '''\
+namespace h5gen {
+    template <>
+    class DxDataType<$qualified_name> {
+    public:
+        static DxDataType& instance() noexcept;
+
+        const H5::DataType& h5_datatype() const noexcept {
+            return datatype_;
+        }
+
+        const H5::DataType& h5_file_datatype() const noexcept {
+            return file_datatype_;
+        }
+
+        const char* type_name() const noexcept {
+            return "$name";
+        }
+${staging}
+    private:
+        DxDataType() noexcept;
+
+        H5::CompType datatype_;
+        H5::CompType file_datatype_;
+    };
+
+}
+'''
+
+_record_definition_template = '''\
+namespace h5gen {
+    DxDataType<$qualified_name>& DxDataType<$qualified_name>::instance() noexcept {
+        static DxDataType<$qualified_name> e {};
+        return e;
+    }
+
+    DxDataType<$qualified_name>::DxDataType() noexcept:
+        datatype_(sizeof($layout_type))
+    {
+        static constexpr $layout_type zzz_tmp {};
+${members}${file_type}    }
+
+}
+'''
+
+# a record with std::string or std::vector members, directly or in a nested
+# record, is described by its stored_type instead of its own layout; the
+# writers stage each record into one before HDF5 sees it.
+_staging_template = '''
+        struct stored_type {
+${stored_members}        };
+
+        static void stage(const $qualified_name& in, stored_type& out, payload_arena& arena) {
+${stage_members}        }
+'''
+
+_stored_member_template = '''\
+            decltype($qualified_name::$field_name) $field_name;
+'''
+
+_stored_vlstring_member_template = '''\
+            const char* $field_name$extents;
+'''
+
+_stored_vlsequence_member_template = '''\
+            hvl_t $field_name$extents;
+'''
+
+_stored_staged_member_template = '''\
+            DxDataType<$field_type>::stored_type $field_name$extents;
+'''
+
+_stage_copied_member_template = '''\
+            std::memcpy(&out.$field_name, &in.$field_name, sizeof(out.$field_name));
+'''
+
+_stage_vlen_member_template = '''\
+            detail::stage_member(in.$field_name, out.$field_name, arena);
+'''
+
+_nested_instance_template = '''\
+            DxDataType<$field_type>& zzz_${safe_field_type}_dxtype = DxDataType<$field_type>::instance();
+'''
+
+_atomic_member_template = '''\
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name), H5::$native_type);
+'''
+
+# array members are a single rank-N array type whatever the element type, so
+# converting a record never has to visit one member per element.
+_atomic_array_member_template = '''\
+            hsize_t ${field_name}_dims[$rank] = {$dims};
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name$first_element), H5::ArrayType(H5::$native_type, $rank, ${field_name}_dims));
+'''
+
+_nested_member_template = '''\
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name), zzz_${safe_field_type}_dxtype.h5_datatype());
+'''
+
+_nested_array_member_template = '''\
+            hsize_t ${field_name}_dims[$rank] = {$dims};
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name$first_element), H5::ArrayType(zzz_${safe_field_type}_dxtype.h5_datatype(), $rank, ${field_name}_dims));
+'''
+
+_vlstring_member_template = '''\
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name), H5::StrType(H5::PredType::C_S1, H5T_VARIABLE));
+'''
+
+_vlstring_array_member_template = '''\
+            hsize_t ${field_name}_dims[$rank] = {$dims};
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name$first_element), H5::ArrayType(H5::StrType(H5::PredType::C_S1, H5T_VARIABLE), $rank, ${field_name}_dims));
+'''
+
+_vlsequence_member_template = '''\
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name), H5::VarLenType($element_datatype));
+'''
+
+_vlsequence_array_member_template = '''\
+            hsize_t ${field_name}_dims[$rank] = {$dims};
+            datatype_.insertMember("$field_name", HDF5_FIELD_OFFSET(zzz_tmp,$field_name$first_element), H5::ArrayType(H5::VarLenType($element_datatype), $rank, ${field_name}_dims));
+'''
+
+_packed_file_type_template = '''\
+            file_datatype_.copy(datatype_);
+            file_datatype_.pack();
+'''
+
+# HDF5 converts the narrowed members when the records are written.
+_narrowed_file_type_template = '''\
+            file_datatype_ = detail::narrowed_file_type(datatype_, {
+${narrowed_members}            });
+'''
+
+_narrowed_member_template = '''\
+                {"$field_name", $storage_datatype},
+'''
+
+# a nested record with narrowed fields of its own.
+_nested_file_datatype_template = "zzz_${safe_field_type}_dxtype.h5_file_datatype()"
+
+# the element type of a sequence, as an expression.
+_atomic_datatype_template = "H5::$native_type"
+
+_nested_datatype_template = "zzz_${safe_field_type}_dxtype.h5_datatype()"
+
+_native_type_names = {
+    atomictype.NativeType.CHAR: "PredType::NATIVE_CHAR",
+    atomictype.NativeType.SCHAR: "PredType::NATIVE_SCHAR",
+    atomictype.NativeType.UCHAR: "PredType::NATIVE_UCHAR",
+    atomictype.NativeType.SHORT: "PredType::NATIVE_SHORT",
+    atomictype.NativeType.USHORT: "PredType::NATIVE_USHORT",
+    atomictype.NativeType.INT: "PredType::NATIVE_INT",
+    atomictype.NativeType.UINT: "PredType::NATIVE_UINT",
+    atomictype.NativeType.LONG: "PredType::NATIVE_LONG",
+    atomictype.NativeType.ULONG: "PredType::NATIVE_ULONG",
+    atomictype.NativeType.LONGLONG: "PredType::NATIVE_LLONG",
+    atomictype.NativeType.ULONGLONG: "PredType::NATIVE_ULLONG",
+    atomictype.NativeType.FLOAT: "PredType::NATIVE_FLOAT",
+    atomictype.NativeType.DOUBLE: "PredType::NATIVE_DOUBLE",
+    atomictype.NativeType.LONGDOUBLE: "PredType::NATIVE_LDOUBLE",
+    atomictype.NativeType.BOOLEAN: "PredType::NATIVE_HBOOL",
+}
+
+HDF5_BACKEND_NAME = "hdf5"
+
+register_backend(emission_backend(HDF5_BACKEND_NAME, {
+    "file": _file_template,
+    "source_file": _source_file_template,
+    "include": _include_template,
+    "enum": _enum_template,
+    "enum_declaration": _enum_declaration_template,
+    "enum_definition": _enum_definition_template,
+    "enum_constant": _enum_constant_template,
+    "record": _record_template,
+    "record_declaration": _record_declaration_template,
+    "record_definition": _record_definition_template,
+    "staging": _staging_template,
+    "stored_member": _stored_member_template,
+    "stored_vlstring_member": _stored_vlstring_member_template,
+    "stored_vlsequence_member": _stored_vlsequence_member_template,
+    "stored_staged_member": _stored_staged_member_template,
+    "stage_copied_member": _stage_copied_member_template,
+    "stage_vlen_member": _stage_vlen_member_template,
+    "nested_instance": _nested_instance_template,
+    "atomic_member": _atomic_member_template,
+    "atomic_array_member": _atomic_array_member_template,
+    "nested_member": _nested_member_template,
+    "nested_array_member": _nested_array_member_template,
+    "vlstring_member": _vlstring_member_template,
+    "vlstring_array_member": _vlstring_array_member_template,
+    "vlsequence_member": _vlsequence_member_template,
+    "vlsequence_array_member": _vlsequence_array_member_template,
+    "atomic_datatype": _atomic_datatype_template,
+    "nested_datatype": _nested_datatype_template,
+    "packed_file_type": _packed_file_type_template,
+    "narrowed_file_type": _narrowed_file_type_template,
+    "narrowed_member": _narrowed_member_template,
+    "nested_file_datatype": _nested_file_datatype_template,
+}, _native_type_names))
@@ -22,6 +22,13 @@
 
 #pragma once
 #include "H5Cpp.h"
+#include "PayloadArena.h"
+
+#include <cstddef>
+#include <initializer_list>
+#include <string>
+#include <type_traits>
+#include <vector>
 
 #define HDF5_FIELD_OFFSET(StructVarName, FieldName) \
 static_cast<std::size_t>(reinterpret_cast<const char*>(&StructVarName.FieldName) - reinterpret_cast<const char*>(&StructVarName))
@@ -30,4 +37,109 @@ namespace h5gen
 {
     template <typename CompoundOrEnumT>
     class DxDataType {};
+
+    // a record with std::string or std::vector members (directly or in a
+    // nested record) can't be handed to HDF5 as it is. its DxDataType has a
+    // stored_type, a fixed layout that holds a const char* or hvl_t in place
+    // of each such member, and a stage() function that fills one in from a
+    // record; the h5_datatype() of such a record describes the stored_type.
+    namespace detail
+    {
+        inline void stage_member(const std::string& in, const char*& out, payload_arena& arena)
+        {
+            out = arena.copy_string(in);
+        }
+
+        template <typename T, typename Allocator>
+        void stage_member(const std::vector<T, Allocator>& in, hvl_t& out, payload_arena& arena)
+        {
+            out = arena.copy_sequence(in);
+        }
+
+        template <typename T>
+        void stage_member(const T& in, typename DxDataType<T>::stored_type& out, payload_arena& arena)
+        {
+            DxDataType<T>::stage(in, out, arena);
+        }
+
+        template <typename T, typename U, std::size_t N>
+        void stage_member(const T (&in)[N], U (&out)[N], payload_arena& arena)
+        {
+            for (std::size_t i = 0; i < N; ++i)
+            {
+                stage_member(in[i], out[i], arena);
+            }
+        }
+
+        template <typename T>
+        struct type_sink
+        {
+            using type = void;
+        };
+
+        // value is whether records of T are staged before they are written;
+        // type is what they are written as.
+        template <typename T, typename = void>
+        struct staged_record
+        {
+            static constexpr bool value = false;
+            using type = T;
+        };
+
+        template <typename T>
+        struct staged_record<T, typename type_sink<typename DxDataType<T>::stored_type>::type>
+        {
+            static constexpr bool value = true;
+            using type = typename DxDataType<T>::stored_type;
+        };
+    }
+
+    // the file type of a record with fields stored as a narrower type (see
+    // H5GEN_STORE_AS) is built from its in-memory type here; the writes keep
+    // using the in-memory type and HDF5 converts the narrowed members.
+    namespace detail
+    {
+        struct narrowed_member
+        {
+            const char* name;
+            H5::DataType type;
+        };
+
+        // a packed copy of memType with the type of each narrowed member
+        // replaced. the elements of an array member are replaced, so it
+        // keeps its dimensions.
+        inline H5::CompType narrowed_file_type(const H5::CompType& memType,
+                                               std::initializer_list<narrowed_member> narrowed)
+        {
+            H5::CompType fileType(memType.getSize());
+            const int numMembers = memType.getNmembers();
+            for (int i = 0; i < numMembers; ++i)
+            {
+                const H5std_string name = memType.getMemberName(i);
+                H5::DataType memberType = memType.getMemberDataType(i);
+                for (const narrowed_member& member : narrowed)
+                {
+                    if (name != member.name)
+                    {
+                        continue;
+                    }
+
+                    if (memberType.getClass() == H5T_ARRAY)
+                    {
+                        const H5::ArrayType arrayType = memType.getMemberArrayType(i);
+                        std::vector<hsize_t> dims(arrayType.getArrayNDims());
+                        arrayType.getArrayDims(dims.data());
+                        memberType = H5::ArrayType(member.type, static_cast<int>(dims.size()), dims.data());
+                    }
+                    else
+                    {
+                        memberType = member.type;
+                    }
+                }
+                fileType.insertMember(name, memType.getMemberOffset(i), memberType);
+            }
+            fileType.pack();
+            return fileType;
+        }
+    }
 }
\ No newline at end of file
@@ -0,0 +1,368 @@
+// MIT License
+
+// Copyright (c) 2022 Johnathon Lewis
+
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+#pragma once
+
+#include "H5Writer.h"
+
+#include <atomic>
+#include <condition_variable>
+#include <cstring>
+#include <exception>
+#include <mutex>
+#include <thread>
+#include <type_traits>
+#include <vector>
+
+namespace h5gen
+{
+    // what write() does when the queue has no room left for a record.
+    enum class BackPressurePolicy
+    {
+        // wait for the I/O thread to make room.
+        Block,
+        // discard the record being written.
+        DropNewest,
+        // discard the oldest records that haven't been handed to the I/O
+        // thread yet until the new record fits.
+        DropOldest
+    };
+
+    struct AsyncWriterOptions
+    {
+        // upper bound on the bytes held by records waiting for the I/O thread.
+        size_t queue_bytes = 4 * 1024 * 1024;
+
+        BackPressurePolicy back_pressure = BackPressurePolicy::Block;
+    };
+
+    // moves all HDF5 work off the caller's thread. write() only copies the
+    // record into a bounded queue; a dedicated I/O thread swaps the queue out
+    // and drains it in one batch into the H5DataSetStream of each record type.
+    //
+    // the first error raised on the I/O thread leaves the writer unusable:
+    // write() rejects every record from then on, and flush() and close()
+    // rethrow that error each time they are called.
+    class H5AsyncWriter
+    {
+    public:
+        explicit H5AsyncWriter(H5Writer&& writer,
+                               const AsyncWriterOptions& options = AsyncWriterOptions()):
+            writer_(std::move(writer)),
+            options_(options),
+            front_begin_(0),
+            front_records_(0),
+            flush_requests_(0),
+            flushes_completed_(0),
+            closing_(false),
+            io_stopped_(false),
+            queue_depth_(0),
+            dropped_records_(0)
+        {
+            front_.reserve(options_.queue_bytes);
+            back_.reserve(options_.queue_bytes);
+            io_thread_ = std::thread(&H5AsyncWriter::run, this);
+        }
+
+        H5AsyncWriter(const std::string& applicationName,
+                      const DataSetCreationPolicy& policy = DataSetCreationPolicy(),
+                      const AsyncWriterOptions& options = AsyncWriterOptions()):
+            H5AsyncWriter(H5Writer(applicationName, policy), options)
+        {
+        }
+
+        H5AsyncWriter(const H5AsyncWriter&) = delete;
+        H5AsyncWriter& operator=(const H5AsyncWriter&) = delete;
+
+        ~H5AsyncWriter()
+        {
+            try
+            {
+                close();
+            }
+            catch (...)
+            {
+                // destructors can't throw; call close() explicitly to observe
+                // errors raised on the I/O thread.
+            }
+        }
+
+        // queues a copy of the record. returns false if the record was dropped
+        // because of the back-pressure policy, because the writer is closed or
+        // has failed, or because the record doesn't fit in queue_bytes at all.
+        template <typename CompoundOrEnumT>
+        bool write(const CompoundOrEnumT& data)
+        {
+            static_assert(std::is_trivially_copyable<CompoundOrEnumT>::value,
+                          "records written through the async writer must be trivially copyable; write records with variable-length members through H5Writer.");
+
+            const entry_header header { &sink<CompoundOrEnumT>, sizeof(CompoundOrEnumT) };
+            const size_t entrySize = sizeof(entry_header) + sizeof(CompoundOrEnumT);
+
+            std::unique_lock<std::mutex> lock(mutex_);
+            if (closing_ || io_error_)
+            {
+                return false;
+            }
+
+            // no amount of waiting or dropping makes room for such a record.
+            if (entrySize > options_.queue_bytes)
+            {
+                ++dropped_records_;
+                return false;
+            }
+
+            if (!make_room(lock, entrySize))
+            {
+                ++dropped_records_;
+                return false;
+            }
+
+            const size_t offset = front_.size();
+            front_.resize(offset + entrySize);
+            std::memcpy(front_.data() + offset, &header, sizeof(entry_header));
+            std::memcpy(front_.data() + offset + sizeof(entry_header), &data, sizeof(CompoundOrEnumT));
+            ++front_records_;
+            ++queue_depth_;
+
+            lock.unlock();
+            work_available_.notify_one();
+            return true;
+        }
+
+        // blocks until every record queued before the call has been appended to
+        // its dataset and the file has been flushed. rethrows the error the
+        // I/O thread failed with, if any.
+        void flush()
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            const size_t request = ++flush_requests_;
+            work_available_.notify_one();
+            flush_done_.wait(lock, [this, request] {
+                return flushes_completed_ >= request || io_stopped_ || io_error_;
+            });
+            rethrow_io_error();
+        }
+
+        // drains the queue, flushes the file and stops the I/O thread. records
+        // written after close() are rejected.
+        void close()
+        {
+            {
+                std::lock_guard<std::mutex> lock(mutex_);
+                if (closing_)
+                {
+                    return;
+                }
+                closing_ = true;
+            }
+            work_available_.notify_one();
+            room_available_.notify_all();
+
+            if (io_thread_.joinable())
+            {
+                io_thread_.join();
+            }
+
+            std::lock_guard<std::mutex> lock(mutex_);
+            rethrow_io_error();
+        }
+
+        // records accepted by write() that haven't been handed to their dataset
+        // stream yet, including the batch the I/O thread is working on.
+        size_t queue_depth() const noexcept
+        {
+            return queue_depth_.load(std::memory_order_relaxed);
+        }
+
+        size_t dropped_records() const noexcept
+        {
+            return dropped_records_.load(std::memory_order_relaxed);
+        }
+
+    private:
+        using sink_fn = void (*)(H5Writer&, const unsigned char*);
+
+        struct entry_header
+        {
+            sink_fn sink;
+            size_t size;
+        };
+
+        // copies the queued bytes back into a properly aligned record before
+        // handing it to the synchronous writer.
+        template <typename CompoundOrEnumT>
+        static void sink(H5Writer& writer, const unsigned char* bytes)
+        {
+            typename std::aligned_storage<sizeof(CompoundOrEnumT), alignof(CompoundOrEnumT)>::type storage;
+            std::memcpy(&storage, bytes, sizeof(CompoundOrEnumT));
+            writer.write(*reinterpret_cast<const CompoundOrEnumT*>(&storage));
+        }
+
+        size_t front_bytes() const noexcept
+        {
+            return front_.size() - front_begin_;
+        }
+
+        // called with the lock held. returns false if the record has to be
+        // dropped instead.
+        bool make_room(std::unique_lock<std::mutex>& lock, size_t entrySize)
+        {
+            if (front_bytes() + entrySize > options_.queue_bytes)
+            {
+                switch (options_.back_pressure)
+                {
+                case BackPressurePolicy::Block:
+                    room_available_.wait(lock, [this, entrySize] {
+                        return closing_ || io_error_ || front_bytes() + entrySize <= options_.queue_bytes;
+                    });
+                    if (closing_ || io_error_)
+                    {
+                        return false;
+                    }
+                    break;
+
+                case BackPressurePolicy::DropNewest:
+                    return false;
+
+                case BackPressurePolicy::DropOldest:
+                    while (front_bytes() + entrySize > options_.queue_bytes)
+                    {
+                        entry_header header;
+                        std::memcpy(&header, front_.data() + front_begin_, sizeof(entry_header));
+                        front_begin_ += sizeof(entry_header) + header.size;
+                        --front_records_;
+                        --queue_depth_;
+                        ++dropped_records_;
+                    }
+                    break;
+                }
+            }
+
+            // reclaim the space in front of records that were dropped, so the
+            // buffer never grows past the capacity reserved up front.
+            if (front_.size() + entrySize > options_.queue_bytes && front_begin_ > 0)
+            {
+                std::memmove(front_.data(), front_.data() + front_begin_, front_bytes());
+                front_.resize(front_bytes());
+                front_begin_ = 0;
+            }
+            return true;
+        }
+
+        void run()
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            for (;;)
+            {
+                work_available_.wait(lock, [this] {
+                    return closing_ || front_records_ > 0 || flush_requests_ > flushes_completed_;
+                });
+
+                // everything queued before a flush request is in the batch we
+                // swap out here, so completing the batch completes the request.
+                const size_t pendingFlush = flush_requests_;
+                const bool stopping = closing_;
+                const size_t batchBegin = front_begin_;
+                const size_t batchRecords = front_records_;
+                back_.swap(front_);
+                front_.clear();
+                front_begin_ = 0;
+                front_records_ = 0;
+                lock.unlock();
+                room_available_.notify_all();
+
+                std::exception_ptr error;
+                try
+                {
+                    size_t offset = batchBegin;
+                    while (offset < back_.size())
+                    {
+                        entry_header header;
+                        std::memcpy(&header, back_.data() + offset, sizeof(entry_header));
+                        header.sink(writer_, back_.data() + offset + sizeof(entry_header));
+                        offset += sizeof(entry_header) + header.size;
+                    }
+                    if (stopping || pendingFlush > flushes_completed_)
+                    {
+                        writer_.flush();
+                    }
+                }
+                catch (...)
+                {
+                    error = std::current_exception();
+                }
+                back_.clear();
+
+                lock.lock();
+                queue_depth_ -= batchRecords;
+                if (error && !io_error_)
+                {
+                    io_error_ = error;
+                    room_available_.notify_all();
+                }
+                flushes_completed_ = pendingFlush;
+
+                if (stopping && front_records_ == 0)
+                {
+                    io_stopped_ = true;
+                    flush_done_.notify_all();
+                    return;
+                }
+                flush_done_.notify_all();
+            }
+        }
+
+        void rethrow_io_error()
+        {
+            if (io_error_)
+            {
+                std::rethrow_exception(io_error_);
+            }
+        }
+
+        H5Writer writer_;
+        AsyncWriterOptions options_;
+
+        std::mutex mutex_;
+        std::condition_variable work_available_;
+        std::condition_variable room_available_;
+        std::condition_variable flush_done_;
+
+        // producers append to front_ while the I/O thread drains back_.
+        std::vector<unsigned char> front_;
+        std::vector<unsigned char> back_;
+        size_t front_begin_;
+        size_t front_records_;
+
+        size_t flush_requests_;
+        size_t flushes_completed_;
+        bool closing_;
+        bool io_stopped_;
+        std::exception_ptr io_error_;
+
+        std::atomic<size_t> queue_depth_;
+        std::atomic<size_t> dropped_records_;
+
+        std::thread io_thread_;
+    };
+}
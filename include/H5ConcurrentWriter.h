@@ -0,0 +1,487 @@
+// MIT License
+
+// Copyright (c) 2022 Johnathon Lewis
+
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+#pragma once
+
+#include "H5Writer.h"
+
+#include <cassert>
+#include <condition_variable>
+#include <cstring>
+#include <deque>
+#include <exception>
+#include <map>
+#include <memory>
+#include <mutex>
+#include <stdexcept>
+#include <thread>
+#include <type_traits>
+#include <typeindex>
+#include <unordered_map>
+#include <vector>
+
+namespace h5gen
+{
+    // the order in which records of one type end up in their dataset.
+    enum class RecordOrdering
+    {
+        // records from the same producer keep their relative order, but
+        // records from different producers may interleave in whole batches.
+        PerProducer,
+        // records are stored in the order their write() calls completed,
+        // across all producers. writes of such a type take a per-type lock.
+        Total
+    };
+
+    struct ConcurrentWriterOptions
+    {
+        // number of records of one type a producer stages before handing the
+        // batch to the committer.
+        size_t staging_records = 4096;
+
+        // number of full batches that may wait for the committer before
+        // producers block.
+        size_t max_pending_batches = 64;
+    };
+
+    // lets many threads write records without sharing a lock on the hot path.
+    //
+    // thread safety: each producer thread obtains its own Producer through
+    // make_producer() and is the only thread that may use it. Producer::write()
+    // stages records in thread-private buffers; only full batches go through
+    // the writer's queue, and a single committer thread does all HDF5 calls.
+    // set_ordering() must be called before any record of that type is written,
+    // and a type can't go back to per-producer ordering once it is total.
+    // flush() covers records that producers have already handed over, so call
+    // Producer::flush() (or destroy the producer) on each producer thread
+    // first. every Producer must be destroyed before the writer is.
+    class H5ConcurrentWriter
+    {
+        using commit_fn = void (*)(H5Writer&, const unsigned char*, size_t);
+
+        struct batch
+        {
+            commit_fn commit;
+            size_t record_size;
+            size_t count;
+            std::vector<unsigned char> bytes;
+        };
+
+        struct ordered_stage
+        {
+            std::mutex mutex;
+            batch pending;
+        };
+
+    public:
+        class Producer
+        {
+        public:
+            Producer(Producer&& other):
+                owner_(other.owner_),
+                stages_(std::move(other.stages_))
+            {
+                other.owner_ = nullptr;
+            }
+
+            Producer(const Producer&) = delete;
+            Producer& operator=(const Producer&) = delete;
+
+            ~Producer()
+            {
+                if (owner_ != nullptr)
+                {
+                    try
+                    {
+                        flush();
+                    }
+                    catch (const std::logic_error&)
+                    {
+                        // the writer was closed; what's still staged is lost.
+                    }
+                }
+            }
+
+            // records written after the writer is closed are rejected when
+            // they're handed to the committer: the write() that fills a
+            // batch, or flush(), throws std::logic_error.
+            template <typename CompoundOrEnumT>
+            void write(const CompoundOrEnumT& data)
+            {
+                static_assert(std::is_trivially_copyable<CompoundOrEnumT>::value,
+                              "records written through the concurrent writer must be trivially copyable; write records with variable-length members through H5Writer.");
+
+                stage& s = stage_for<CompoundOrEnumT>();
+                if (s.ordered != nullptr)
+                {
+                    owner_->write_ordered(*s.ordered, data);
+                    return;
+                }
+
+                std::memcpy(s.pending.bytes.data() + (s.pending.count * sizeof(CompoundOrEnumT)),
+                            &data,
+                            sizeof(CompoundOrEnumT));
+                if (++s.pending.count == owner_->options_.staging_records)
+                {
+                    owner_->submit(s.pending);
+                }
+            }
+
+            // hands every partially filled staging buffer to the committer.
+            void flush()
+            {
+                for (auto& s : stages_)
+                {
+                    if (s.second.pending.count > 0)
+                    {
+                        owner_->submit(s.second.pending);
+                    }
+                }
+            }
+
+        private:
+            friend class H5ConcurrentWriter;
+
+            struct stage
+            {
+                batch pending;
+                ordered_stage* ordered;
+            };
+
+            explicit Producer(H5ConcurrentWriter& owner):
+                owner_(&owner)
+            {
+            }
+
+            template <typename CompoundOrEnumT>
+            stage& stage_for()
+            {
+                const auto typeIdx = std::type_index(typeid(CompoundOrEnumT));
+                auto elem = stages_.find(typeIdx);
+                if (elem != stages_.end())
+                {
+                    return elem->second;
+                }
+
+                stage s { owner_->make_batch<CompoundOrEnumT>(), owner_->find_ordered_stage(typeIdx) };
+                return stages_.emplace(typeIdx, std::move(s)).first->second;
+            }
+
+            H5ConcurrentWriter* owner_;
+            std::unordered_map<std::type_index, stage> stages_;
+        };
+
+        explicit H5ConcurrentWriter(H5Writer&& writer,
+                                    const ConcurrentWriterOptions& options = ConcurrentWriterOptions()):
+            writer_(std::move(writer)),
+            options_(options),
+            submitted_batches_(0),
+            committed_batches_(0),
+            flush_requests_(0),
+            flushes_completed_(0),
+            closing_(false)
+        {
+            assert(options_.staging_records > 0);
+            committer_ = std::thread(&H5ConcurrentWriter::run, this);
+        }
+
+        H5ConcurrentWriter(const std::string& applicationName,
+                           const DataSetCreationPolicy& policy = DataSetCreationPolicy(),
+                           const ConcurrentWriterOptions& options = ConcurrentWriterOptions()):
+            H5ConcurrentWriter(H5Writer(applicationName, policy), options)
+        {
+        }
+
+        H5ConcurrentWriter(const H5ConcurrentWriter&) = delete;
+        H5ConcurrentWriter& operator=(const H5ConcurrentWriter&) = delete;
+
+        ~H5ConcurrentWriter()
+        {
+            try
+            {
+                close();
+            }
+            catch (...)
+            {
+                // destructors can't throw; call close() explicitly to observe
+                // errors raised on the committer thread.
+            }
+        }
+
+        Producer make_producer()
+        {
+            return Producer(*this);
+        }
+
+        template <typename CompoundOrEnumT>
+        void set_ordering(RecordOrdering ordering)
+        {
+            const auto typeIdx = std::type_index(typeid(CompoundOrEnumT));
+            std::lock_guard<std::mutex> lock(mutex_);
+            if (ordering == RecordOrdering::Total)
+            {
+                std::unique_ptr<ordered_stage>& stage = ordered_stages_[typeIdx];
+                if (!stage)
+                {
+                    stage.reset(new ordered_stage());
+                    stage->pending = make_batch<CompoundOrEnumT>();
+                }
+            }
+            else
+            {
+                // producers keep a pointer to the shared stage of a totally
+                // ordered type, so the ordering can't be relaxed again.
+                assert(ordered_stages_.find(typeIdx) == ordered_stages_.end());
+            }
+        }
+
+        // blocks until every batch handed to the committer before the call,
+        // plus everything staged for totally ordered types, has been appended
+        // to its dataset and the file has been flushed. once the writer is
+        // closed, close() has done all of that.
+        void flush()
+        {
+            flush_ordered_stages();
+
+            std::unique_lock<std::mutex> lock(mutex_);
+            if (closing_)
+            {
+                rethrow_committer_error();
+                return;
+            }
+
+            const size_t target = submitted_batches_;
+            const size_t request = ++flush_requests_;
+            work_available_.notify_one();
+            committed_.wait(lock, [this, target, request] {
+                return (committed_batches_ >= target && flushes_completed_ >= request) || committer_error_;
+            });
+            rethrow_committer_error();
+        }
+
+        // commits everything that was handed over and stops the committer.
+        void close()
+        {
+            flush_ordered_stages();
+            {
+                std::lock_guard<std::mutex> lock(mutex_);
+                if (closing_)
+                {
+                    return;
+                }
+                closing_ = true;
+            }
+            work_available_.notify_one();
+
+            if (committer_.joinable())
+            {
+                committer_.join();
+            }
+
+            std::lock_guard<std::mutex> lock(mutex_);
+            rethrow_committer_error();
+        }
+
+    private:
+        template <typename CompoundOrEnumT>
+        static void commit(H5Writer& writer, const unsigned char* bytes, size_t count)
+        {
+            writer.write(reinterpret_cast<const CompoundOrEnumT*>(bytes), count);
+        }
+
+        template <typename CompoundOrEnumT>
+        batch make_batch()
+        {
+            batch b { &commit<CompoundOrEnumT>, sizeof(CompoundOrEnumT), 0, {} };
+            b.bytes.resize(options_.staging_records * sizeof(CompoundOrEnumT));
+            return b;
+        }
+
+        ordered_stage* find_ordered_stage(const std::type_index& typeIdx)
+        {
+            std::lock_guard<std::mutex> lock(mutex_);
+            auto elem = ordered_stages_.find(typeIdx);
+            return elem != ordered_stages_.end() ? elem->second.get() : nullptr;
+        }
+
+        template <typename CompoundOrEnumT>
+        void write_ordered(ordered_stage& stage, const CompoundOrEnumT& data)
+        {
+            // batches are submitted while the per-type lock is held, so they
+            // reach the committer in the same order the records were written.
+            std::lock_guard<std::mutex> lock(stage.mutex);
+            std::memcpy(stage.pending.bytes.data() + (stage.pending.count * sizeof(CompoundOrEnumT)),
+                        &data,
+                        sizeof(CompoundOrEnumT));
+            if (++stage.pending.count == options_.staging_records)
+            {
+                submit(stage.pending);
+            }
+        }
+
+        void flush_ordered_stages()
+        {
+            std::vector<ordered_stage*> stages;
+            {
+                std::lock_guard<std::mutex> lock(mutex_);
+                for (auto& elem : ordered_stages_)
+                {
+                    stages.push_back(elem.second.get());
+                }
+            }
+
+            for (ordered_stage* stage : stages)
+            {
+                std::lock_guard<std::mutex> lock(stage->mutex);
+                if (stage->pending.count > 0)
+                {
+                    submit(stage->pending);
+                }
+            }
+        }
+
+        // hands a filled staging batch to the committer and replaces it with an
+        // empty one, recycled from a previously committed batch if possible.
+        // a batch handed over after close() would never be committed, so it
+        // is dropped and reported instead.
+        void submit(batch& staged)
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            not_full_.wait(lock, [this] {
+                return closing_ || pending_.size() < options_.max_pending_batches;
+            });
+            if (closing_)
+            {
+                staged.count = 0;
+                throw std::logic_error("H5ConcurrentWriter: records were written after close()");
+            }
+
+            batch replacement { staged.commit, staged.record_size, 0, {} };
+            for (auto it = free_buffers_.begin(); it != free_buffers_.end(); ++it)
+            {
+                if (it->size() == staged.bytes.size())
+                {
+                    replacement.bytes = std::move(*it);
+                    free_buffers_.erase(it);
+                    break;
+                }
+            }
+            if (replacement.bytes.empty())
+            {
+                replacement.bytes.resize(staged.bytes.size());
+            }
+
+            pending_.push_back(std::move(staged));
+            staged = std::move(replacement);
+            ++submitted_batches_;
+
+            lock.unlock();
+            work_available_.notify_one();
+        }
+
+        void run()
+        {
+            std::unique_lock<std::mutex> lock(mutex_);
+            for (;;)
+            {
+                work_available_.wait(lock, [this] {
+                    return closing_ || !pending_.empty() || flush_requests_ > flushes_completed_;
+                });
+
+                std::deque<batch> work;
+                work.swap(pending_);
+                const bool stopping = closing_;
+                const size_t pendingFlush = flush_requests_;
+                lock.unlock();
+                not_full_.notify_all();
+
+                std::exception_ptr error;
+                try
+                {
+                    for (const batch& b : work)
+                    {
+                        b.commit(writer_, b.bytes.data(), b.count);
+                    }
+                    if (stopping || pendingFlush > flushes_completed_)
+                    {
+                        writer_.flush();
+                    }
+                }
+                catch (...)
+                {
+                    error = std::current_exception();
+                }
+
+                lock.lock();
+                committed_batches_ += work.size();
+                flushes_completed_ = pendingFlush;
+                for (batch& b : work)
+                {
+                    free_buffers_.push_back(std::move(b.bytes));
+                }
+                if (free_buffers_.size() > options_.max_pending_batches)
+                {
+                    free_buffers_.resize(options_.max_pending_batches);
+                }
+                if (error && !committer_error_)
+                {
+                    committer_error_ = error;
+                }
+                committed_.notify_all();
+
+                if (stopping && pending_.empty())
+                {
+                    return;
+                }
+            }
+        }
+
+        void rethrow_committer_error()
+        {
+            if (committer_error_)
+            {
+                std::rethrow_exception(committer_error_);
+            }
+        }
+
+        H5Writer writer_;
+        ConcurrentWriterOptions options_;
+
+        std::mutex mutex_;
+        std::condition_variable work_available_;
+        std::condition_variable not_full_;
+        std::condition_variable committed_;
+
+        std::deque<batch> pending_;
+        std::vector<std::vector<unsigned char>> free_buffers_;
+        std::map<std::type_index, std::unique_ptr<ordered_stage>> ordered_stages_;
+
+        size_t submitted_batches_;
+        size_t committed_batches_;
+        size_t flush_requests_;
+        size_t flushes_completed_;
+        bool closing_;
+        std::exception_ptr committer_error_;
+
+        std::thread committer_;
+    };
+}
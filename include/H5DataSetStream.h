@@ -21,9 +21,18 @@
 // SOFTWARE.
 
 #pragma once
+#include "DxDataType.h"
 #include "H5Cpp.h"
+#include "PayloadArena.h"
 
 #include <array>
+#include <cassert>
+#include <cstring>
+#include <memory>
+#include <string>
+#include <type_traits>
+#include <utility>
+#include <vector>
 
 namespace h5gen
 { 
@@ -40,80 +49,461 @@ namespace h5gen
             using type = T;
         };
 
-        static constexpr size_t DEFAULT_CHUNKSIZE = 8;
+        static constexpr size_t DEFAULT_TARGET_CHUNK_BYTES = 64 * 1024;
+        static constexpr size_t DEFAULT_BUFFER_CAPACITY = 1024;
         static constexpr size_t RANK = 1;
+
+        // rounds the requested number of buffered records up to a whole number
+        // of chunks, so that every full flush extends the dataset by exactly
+        // N chunks and never leaves a partially written chunk behind.
+        inline size_t round_to_chunk_multiple(size_t numRecords, size_t chunkSize)
+        {
+            if (numRecords < chunkSize)
+            {
+                return chunkSize;
+            }
+            return ((numRecords + chunkSize - 1) / chunkSize) * chunkSize;
+        }
     }
 
+    // the filters applied to every chunk of a dataset, in the order HDF5 will
+    // run them when writing: n-bit, shuffle, deflate, fletcher32.
+    // everything is disabled by default, i.e. data is stored uncompressed.
+    // there's no scale-offset filter: HDF5 only applies it to integer and
+    // floating-point datasets, and the streams write compound and enum records.
+    struct FilterPipeline
+    {
+        // byte-shuffles each chunk so that deflate sees runs of similar bytes.
+        bool shuffle = false;
+
+        // gzip compression level in [0, 9]; negative disables deflate.
+        int deflate_level = -1;
+
+        // packs members that don't use all the bits of their storage type.
+        bool nbit = false;
+
+        // stores a checksum with each chunk.
+        bool fletcher32 = false;
+
+        void apply(const H5::DSetCreatPropList& cparms) const
+        {
+            if (nbit)
+            {
+                cparms.setNbit();
+            }
+            if (shuffle)
+            {
+                cparms.setShuffle();
+            }
+            if (deflate_level >= 0)
+            {
+                cparms.setDeflate(deflate_level);
+            }
+            if (fletcher32)
+            {
+                cparms.setFletcher32();
+            }
+        }
+    };
+
+    // what happens to a value that doesn't fit the narrower type its field is
+    // stored as in the file (see H5GEN_STORE_AS), e.g. 70000 in a field
+    // stored as int16.
+    enum class RangeViolationPolicy
+    {
+        // HDF5's default: an integer becomes the smallest or largest value
+        // of the storage type, a floating-point value +/-inf.
+        Clamp,
+
+        // clamp, and count the values that didn't fit; see
+        // H5DataSetStream::num_range_violations().
+        Count,
+
+        // fail the write: flush(), or the write() that fills the buffer,
+        // throws H5::DataSetIException. the records being flushed are
+        // dropped, and the stream goes on taking records after that.
+        Fail
+    };
+
+    namespace detail
+    {
+        // lives on the heap, so the address HDF5 is given for it stays valid
+        // when the stream that owns it is moved.
+        struct range_violation_handler
+        {
+            RangeViolationPolicy policy;
+            size_t count;
+        };
+
+        inline H5T_conv_ret_t on_conversion_exception(H5T_conv_except_t exception,
+                                                      hid_t, hid_t, void*, void*,
+                                                      void* userData)
+        {
+            if (exception != H5T_CONV_EXCEPT_RANGE_HI && exception != H5T_CONV_EXCEPT_RANGE_LOW)
+            {
+                return H5T_CONV_UNHANDLED;
+            }
+
+            range_violation_handler* handler = static_cast<range_violation_handler*>(userData);
+            ++handler->count;
+            return handler->policy == RangeViolationPolicy::Fail ? H5T_CONV_ABORT : H5T_CONV_UNHANDLED;
+        }
+    }
+
+    // controls how a dataset stream lays out and caches the dataset it creates.
+    // the defaults size chunks by bytes rather than by records, so that small
+    // records don't end up in millions of tiny chunks.
+    struct DataSetCreationPolicy
+    {
+        // number of records per chunk. when zero, the chunk size is derived
+        // from target_chunk_bytes and the size of the record type.
+        size_t chunk_records = 0;
+
+        // the approximate size of a chunk in bytes when chunk_records is zero.
+        // somewhere between 64 KiB and 1 MiB is usually a good trade-off.
+        size_t target_chunk_bytes = detail::DEFAULT_TARGET_CHUNK_BYTES;
+
+        // number of records staged in memory before they are appended to the
+        // dataset. rounded up to a whole number of chunks.
+        size_t buffer_records = detail::DEFAULT_BUFFER_CAPACITY;
+
+        // raw data chunk cache settings for the dataset access property list.
+        // a chunk_cache_bytes of zero keeps the file's default cache.
+        size_t chunk_cache_bytes = 0;
+        size_t chunk_cache_slots = 521;
+        double chunk_cache_w0 = 0.75;
+
+        // when HDF5 writes the fill value into newly allocated chunks. since
+        // streams only ever append whole records, H5D_FILL_TIME_NEVER skips
+        // writing data that is about to be overwritten anyway.
+        H5D_fill_time_t fill_time = H5D_FILL_TIME_IFSET;
+
+        // filters applied to each chunk when it is written.
+        FilterPipeline filters;
+
+        // create datasets with the packed file type of a record, so compiler
+        // padding isn't written to disk. writes still use the native layout.
+        bool packed_file_type = true;
+
+        // commit the file type once as a named datatype under /types and
+        // create the dataset with it, so the type's description is stored once
+        // and shared rather than copied into the dataset's object header.
+        bool commit_named_type = false;
+
+        // what happens to values that don't fit the type their field is
+        // stored as. only fields narrowed in the packed file type are
+        // converted, so this has no effect without packed_file_type.
+        RangeViolationPolicy range_violations = RangeViolationPolicy::Clamp;
+
+        size_t chunk_records_for(size_t recordSize) const noexcept
+        {
+            if (chunk_records > 0)
+            {
+                return chunk_records;
+            }
+            const size_t records = target_chunk_bytes / recordSize;
+            return records > 0 ? records : 1;
+        }
+    };
+
     class H5DataSetStream
     {
     public:
     
+        // memType describes the record as it is laid out in memory and is used
+        // for every write. fileType is what the dataset is created with, which
+        // may differ from memType (e.g. a packed copy of it); HDF5 converts
+        // between the two when the buffer is flushed.
         template <class UnderlyingT>
         H5DataSetStream(const std::string& typeName,
                         const H5::H5File& fileHandle,
-                        const H5::DataType& dataType,
+                        const H5::DataType& memType,
+                        const H5::DataType& fileType,
+                        const DataSetCreationPolicy& policy,
                         detail::type_holder<UnderlyingT>&& tmp):
             num_written_elems_(0),
-            typename_(typeName)
+            typename_(typeName),
+            memtype_(memType),
+            record_size_(sizeof(typename detail::staged_record<UnderlyingT>::type)),
+            buffer_capacity_(0),
+            num_buffered_elems_(0)
         {
-            static constexpr UnderlyingT fill_value {};
+            // memType describes the stored_type of a record that is staged.
+            static constexpr typename detail::staged_record<UnderlyingT>::type fill_value {};
 
-            static constexpr hsize_t chunkdims[] { detail::DEFAULT_CHUNKSIZE };
+            // chunks hold records in their on-disk layout, so size them by that.
+            const size_t chunkSize = policy.chunk_records_for(fileType.getSize());
+            const hsize_t chunkdims[] { chunkSize };
         
             H5::DSetCreatPropList cparms {};
             cparms.setChunk(detail::RANK, chunkdims);
-            cparms.setFillValue(dataType, &fill_value);
+            cparms.setFillValue(memType, &fill_value);
+            cparms.setFillTime(policy.fill_time);
+            policy.filters.apply(cparms);
+
+            H5::DSetAccPropList aparms {};
+            if (policy.chunk_cache_bytes > 0)
+            {
+                aparms.setChunkCache(policy.chunk_cache_slots,
+                                     policy.chunk_cache_bytes,
+                                     policy.chunk_cache_w0);
+            }
 
             static constexpr hsize_t dim[] { 0 };
             static constexpr hsize_t maxdim[] {H5S_UNLIMITED};
             H5::DataSpace dataspace = H5::DataSpace(detail::RANK, dim, maxdim);
 
-            dataset_ = fileHandle.createDataSet(H5std_string(typeName), dataType, dataspace, cparms);
+            dataset_ = fileHandle.createDataSet(H5std_string(typeName), fileType, dataspace, cparms, aparms);
+            buffer_capacity_ = detail::round_to_chunk_multiple(policy.buffer_records, chunkSize);
+            buffer_.resize(buffer_capacity_ * record_size_);
+
+            // clamping is what HDF5 does anyway, so the conversions are only
+            // hooked when there's something else to do.
+            if (policy.range_violations != RangeViolationPolicy::Clamp)
+            {
+                range_violations_.reset(new detail::range_violation_handler { policy.range_violations, 0 });
+                if (H5Pset_type_conv_cb(xfer_.getId(), &detail::on_conversion_exception, range_violations_.get()) < 0)
+                {
+                    throw H5::PropListIException("H5DataSetStream", "H5Pset_type_conv_cb failed");
+                }
+            }
+        }
+
+        H5DataSetStream(H5DataSetStream&& other):
+            num_written_elems_(other.num_written_elems_),
+            typename_(std::move(other.typename_)),
+            dataset_(other.dataset_),
+            memtype_(other.memtype_),
+            record_size_(other.record_size_),
+            buffer_capacity_(other.buffer_capacity_),
+            num_buffered_elems_(other.num_buffered_elems_),
+            buffer_(std::move(other.buffer_)),
+            payloads_(std::move(other.payloads_)),
+            xfer_(other.xfer_),
+            range_violations_(std::move(other.range_violations_))
+        {
+            // the moved-from stream no longer owns any staged records, so it
+            // must not try to append anything when it is destroyed.
+            other.num_buffered_elems_ = 0;
+        }
+
+        H5DataSetStream& operator=(H5DataSetStream&& other)
+        {
+            if (this != &other)
+            {
+                flush();
+                num_written_elems_ = other.num_written_elems_;
+                typename_ = std::move(other.typename_);
+                dataset_ = other.dataset_;
+                memtype_ = other.memtype_;
+                record_size_ = other.record_size_;
+                buffer_capacity_ = other.buffer_capacity_;
+                num_buffered_elems_ = other.num_buffered_elems_;
+                buffer_ = std::move(other.buffer_);
+                payloads_ = std::move(other.payloads_);
+                xfer_ = other.xfer_;
+                range_violations_ = std::move(other.range_violations_);
+                other.num_buffered_elems_ = 0;
+            }
+            return *this;
         }
 
+        // copying a stream would mean two owners of the same staged records,
+        // both of which would try to append them on destruction.
+        H5DataSetStream(const H5DataSetStream&) = delete;
+        H5DataSetStream& operator=(const H5DataSetStream&) = delete;
+
+        ~H5DataSetStream()
+        {
+            try
+            {
+                flush();
+            }
+            catch (const H5::Exception&)
+            {
+                // destructors can't throw; anything still staged at this
+                // point is lost. call flush() explicitly to observe errors.
+            }
+        }
+
+        // stages a record in the stream's buffer. the dataset is only touched
+        // once the buffer is full, at which point all staged records are
+        // appended with a single extend and a single hyperslab write.
+        template <typename T>
+        void write(const T& data)
+        {
+            stage_record(data, std::integral_constant<bool, detail::staged_record<T>::value>());
+            ++num_buffered_elems_;
+
+            if (num_buffered_elems_ == buffer_capacity_)
+            {
+                flush();
+            }
+        }
+
+        // stages a contiguous run of records, flushing whenever the buffer
+        // fills up along the way.
         template <typename T>
-        void write(const T& data, const H5::DataType& datatype)
+        void write(const T* data, size_t count)
         {
-            // get the hyperslab that we're 
-            const hsize_t dims[] { 1 };
-            const hsize_t maxdims[] { H5S_UNLIMITED };
+            write_run(data, count, std::integral_constant<bool, detail::staged_record<T>::value>());
+        }
 
-            H5::DataSpace memspace(detail::RANK, dims, maxdims);
+        // appends all staged records to the dataset. if that fails, the
+        // staged records are dropped (and the dataset is shrunk back to the
+        // records written before) before the exception is rethrown, so a
+        // full buffer never outlives a failed flush.
+        void flush()
+        {
+            if (num_buffered_elems_ == 0)
+            {
+                return;
+            }
 
-            H5::DataSpace filespace = dataset_.getSpace();
-            const hsize_t filedim = filespace.getSimpleExtentNpoints();
+            try
+            {
+                // extend the dataset
+                const hsize_t newSize[] { num_written_elems_ + num_buffered_elems_ };
+                dataset_.extend(newSize);
 
-            // extend the dataset
-            hsize_t newSize[] { filedim + 1 };
-            dataset_.extend(newSize);
+                // select the hyperslab to write to in the file
+                H5::DataSpace filespace = dataset_.getSpace();
+                const hsize_t offset[] { num_written_elems_ };
+                const hsize_t count[] { num_buffered_elems_ };
+                filespace.selectHyperslab(H5S_SELECT_SET, count, offset);
 
-            // select the hyperslab to write to in the file
-            filespace = dataset_.getSpace();
-            hsize_t offset[] { filedim };
-            hsize_t dims1[] { 1 };
+                H5::DataSpace memspace(detail::RANK, count);
+                dataset_.write(buffer_.data(), memtype_, memspace, filespace, xfer_);
+            }
+            catch (const H5::Exception&)
+            {
+                const hsize_t writtenSize[] { num_written_elems_ };
+                H5Dset_extent(dataset_.getId(), writtenSize);
+                payloads_.reset();
+                num_buffered_elems_ = 0;
+                throw;
+            }
 
-            filespace.selectHyperslab(H5S_SELECT_SET, dims1, offset);
+            // HDF5 has copied the payloads of the written records by now.
+            payloads_.reset();
 
-            dataset_.write(&data, datatype, memspace, filespace);
+            num_written_elems_ += num_buffered_elems_;
+            num_buffered_elems_ = 0;
+        }
+
+        size_t num_written_elems() const noexcept
+        {
+            return num_written_elems_;
+        }
+
+        size_t num_buffered_elems() const noexcept
+        {
+            return num_buffered_elems_;
+        }
+
+        // the number of values written so far that didn't fit the type their
+        // field is stored as. only counted under RangeViolationPolicy::Count
+        // and RangeViolationPolicy::Fail; always zero otherwise.
+        size_t num_range_violations() const noexcept
+        {
+            return range_violations_ ? range_violations_->count : 0;
         }
-    
 
     private:
+        template <typename T>
+        void stage_record(const T& data, std::false_type)
+        {
+            static_assert(std::is_trivially_copyable<T>::value,
+                          "records written through a dataset stream must be trivially copyable.");
+            assert(sizeof(T) == record_size_);
+
+            std::memcpy(buffer_.data() + (num_buffered_elems_ * record_size_), &data, record_size_);
+        }
+
+        // a record with variable-length members is converted to its stored
+        // type, with the payloads copied into the stream's arena, since the
+        // caller's strings and vectors may be gone by the time it's flushed.
+        template <typename T>
+        void stage_record(const T& data, std::true_type)
+        {
+            using stored_type = typename detail::staged_record<T>::type;
+            assert(sizeof(stored_type) == record_size_);
+
+            stored_type staged;
+            DxDataType<T>::stage(data, staged, payloads_);
+            std::memcpy(buffer_.data() + (num_buffered_elems_ * record_size_), &staged, record_size_);
+        }
+
+        template <typename T>
+        void write_run(const T* data, size_t count, std::true_type)
+        {
+            for (size_t i = 0; i < count; ++i)
+            {
+                write(data[i]);
+            }
+        }
+
+        template <typename T>
+        void write_run(const T* data, size_t count, std::false_type)
+        {
+            static_assert(std::is_trivially_copyable<T>::value,
+                          "records written through a dataset stream must be trivially copyable.");
+            assert(sizeof(T) == record_size_);
+
+            const unsigned char* bytes = reinterpret_cast<const unsigned char*>(data);
+            while (count > 0)
+            {
+                const size_t room = buffer_capacity_ - num_buffered_elems_;
+                const size_t n = count < room ? count : room;
+                std::memcpy(buffer_.data() + (num_buffered_elems_ * record_size_), bytes, n * record_size_);
+                num_buffered_elems_ += n;
+                bytes += n * record_size_;
+                count -= n;
+
+                if (num_buffered_elems_ == buffer_capacity_)
+                {
+                    flush();
+                }
+            }
+        }
+
         size_t num_written_elems_;
         std::string typename_;
         H5::DataSet dataset_;
+        H5::DataType memtype_;
+
+        size_t record_size_;
+        size_t buffer_capacity_;
+        size_t num_buffered_elems_;
+        std::vector<unsigned char> buffer_;
+        payload_arena payloads_;
 
+        H5::DSetMemXferPropList xfer_;
+        std::unique_ptr<detail::range_violation_handler> range_violations_;
     };
 
     template <typename UnderlyingT>
     H5DataSetStream make_dataset_stream(const std::string& typeName,
                                         const H5::H5File& fileHandle,
-                                        const H5::DataType& dataType)
+                                        const H5::DataType& memType,
+                                        const H5::DataType& fileType,
+                                        const DataSetCreationPolicy& policy = DataSetCreationPolicy())
     {
         return H5DataSetStream(typeName,
                                fileHandle,
-                               dataType, 
+                               memType, 
+                               fileType,
+                               policy,
                                detail::type_holder<UnderlyingT>());
     }
 
+    template <typename UnderlyingT>
+    H5DataSetStream make_dataset_stream(const std::string& typeName,
+                                        const H5::H5File& fileHandle,
+                                        const H5::DataType& dataType,
+                                        const DataSetCreationPolicy& policy = DataSetCreationPolicy())
+    {
+        return make_dataset_stream<UnderlyingT>(typeName, fileHandle, dataType, dataType, policy);
+    }
+
 }
\ No newline at end of file
@@ -0,0 +1,65 @@
+// MIT License
+
+// Copyright (c) 2022 Johnathon Lewis
+
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+#pragma once
+
+// marks a field of a record that is left out of the HDF5 type generated for
+// the record, e.g. a scratch buffer or a pointer:
+//
+//     struct Sample
+//     {
+//         double value;
+//         H5GEN_SKIP char scratch[4096];
+//     };
+//
+// the generator sees the mark as an annotate attribute, since libclang
+// defines __clang__; for other compilers it expands to nothing. a doc comment
+// containing h5gen::skip on the field, or a --field-rules file, has the same
+// effect. either way, the offsets of the fields that are written don't change.
+#if defined(__clang__)
+#define H5GEN_SKIP __attribute__((annotate("h5gen::skip")))
+#else
+#define H5GEN_SKIP
+#endif
+
+// stores an arithmetic field (or array of them) as a narrower type in the
+// file, while the record in memory keeps the type it's declared with:
+//
+//     struct Sample
+//     {
+//         H5GEN_STORE_AS(float) double value;
+//         H5GEN_STORE_AS(int16) std::int64_t counter;
+//     };
+//
+// the type is one of int8, uint8, int16, uint16, int32, uint32, int64,
+// uint64, float or double (int16_t, std::int16_t, short and so on work too),
+// and has to be smaller than the field's own type; any other is ignored with
+// a warning. HDF5 converts the values when records are written. a value that
+// doesn't fit is handled as DataSetCreationPolicy::range_violations says:
+// RangeViolationPolicy::Clamp (the default), Count or Fail. a doc comment
+// containing h5gen::store_as=float, or a Type::field = float line in a
+// --field-rules file, has the same effect.
+#if defined(__clang__)
+#define H5GEN_STORE_AS(type) __attribute__((annotate("h5gen::store_as=" #type)))
+#else
+#define H5GEN_STORE_AS(type)
+#endif
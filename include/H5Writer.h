@@ -27,20 +27,58 @@
 #include "H5DataSetStream.h"
 
 #include <array>
+#include <atomic>
 #include <cassert>
 #include <map>
+#include <memory>
 #include <string>
 #include <typeindex>
 #include <typeinfo>
+#include <vector>
 
 
 
 namespace h5gen
 {
+    namespace detail
+    {
+        static constexpr const char* NAMED_TYPES_GROUP = "types";
+
+        inline size_t next_type_slot() noexcept
+        {
+            static std::atomic<size_t> counter { 0 };
+            return counter.fetch_add(1, std::memory_order_relaxed);
+        }
+
+        // hands out a small, dense, process-wide index per record type the
+        // first time the type is written, so writers can find the stream of a
+        // type by indexing a vector instead of searching a map.
+        template <typename T>
+        struct type_slot
+        {
+            static size_t index() noexcept
+            {
+                static const size_t slot = next_type_slot();
+                return slot;
+            }
+        };
+    }
+
+    // writes each record type to its own dataset in a single file.
+    //
+    // thread safety: H5Writer does no locking of its own. an instance must only
+    // be used by one thread at a time, and the HDF5 library itself must not be
+    // used concurrently from other threads unless it was built thread-safe.
+    // for producers on several threads, use H5AsyncWriter (every member is safe
+    // to call concurrently) or H5ConcurrentWriter (one Producer per thread),
+    // both of which confine all HDF5 calls to a single I/O thread.
     class H5Writer
     {
     public:
-        H5Writer(const std::string& applicationName) noexcept
+        H5Writer(const std::string& applicationName,
+                 const DataSetCreationPolicy& policy = DataSetCreationPolicy()) noexcept:
+            policy_(policy),
+            has_types_group_(false)
         {
             //todo: optimize
             std::string outputFilename = applicationName + "_DxData.h5";
@@ -52,43 +90,146 @@ namespace h5gen
         template <typename CompoundOrEnumT>
         void write(const CompoundOrEnumT& data)
         {
-            DxDataType<CompoundOrEnumT> data_type = DxDataType<CompoundOrEnumT>::instance();
-            const H5::DataType& h5type = data_type.h5_datatype();
-            H5DataSetStream& ds = get_or_create_dataset<CompoundOrEnumT>(typeid(data), 
-                                                                         data_type.type_name(), 
-                                                                         h5type);
+            get_or_create_dataset<CompoundOrEnumT>().write(data);
+        }
+
+        // writes a contiguous run of records of the same type.
+        template <typename CompoundOrEnumT>
+        void write(const CompoundOrEnumT* data, size_t count)
+        {
+            if (count == 0)
+            {
+                return;
+            }
+
+            get_or_create_dataset<CompoundOrEnumT>().write(data, count);
+        }
+
+        // overrides the creation policy, including the filter pipeline, used
+        // for the dataset of a single record type. must be called before the
+        // first record of that type is written.
+        template <typename CompoundOrEnumT>
+        void set_creation_policy(const DataSetCreationPolicy& policy)
+        {
+            assert(find_dataset<CompoundOrEnumT>() == nullptr);
+            type_policies_[std::type_index(typeid(CompoundOrEnumT))] = policy;
+        }
+
+        // overrides only the filter pipeline used for the dataset of a single
+        // record type; everything else comes from the writer's default policy.
+        template <typename CompoundOrEnumT>
+        void set_filters(const FilterPipeline& filters)
+        {
+            DataSetCreationPolicy policy = policy_;
+            policy.filters = filters;
+            set_creation_policy<CompoundOrEnumT>(policy);
+        }
+
+        // the number of values of a record type that didn't fit the type
+        // their field is stored as, counted under RangeViolationPolicy::Count
+        // and RangeViolationPolicy::Fail; see DataSetCreationPolicy::range_violations.
+        template <typename CompoundOrEnumT>
+        size_t num_range_violations() const noexcept
+        {
+            const H5DataSetStream* ds = find_dataset<CompoundOrEnumT>();
+            return ds != nullptr ? ds->num_range_violations() : 0;
+        }
 
-            ds.write(data, h5type);
+        // appends every record still staged in a dataset stream to the file
+        // and asks HDF5 to flush its own buffers.
+        void flush()
+        {
+            for (auto& ds : datasets_)
+            {
+                if (ds)
+                {
+                    ds->flush();
+                }
+            }
+            file_.flush(H5F_SCOPE_LOCAL);
         }
 
 
     private:
         template <typename RawType>
-        H5DataSetStream& get_or_create_dataset(const std::type_info& tid,
-                                               const char* typeName,
-                                               const H5::DataType& dataType)
+        H5DataSetStream* find_dataset() const noexcept
+        {
+            const size_t slot = detail::type_slot<RawType>::index();
+            return slot < datasets_.size() ? datasets_[slot].get() : nullptr;
+        }
+
+        // the hot path is a vector index; the datatype and the dataset are
+        // only looked up and created the first time a type is written.
+        template <typename RawType>
+        H5DataSetStream& get_or_create_dataset()
+        {
+            H5DataSetStream* ds = find_dataset<RawType>();
+            if (ds != nullptr)
+            {
+                return *ds;
+            }
+            return create_dataset<RawType>();
+        }
+
+        template <typename RawType>
+        H5DataSetStream& create_dataset()
         {
-            auto typeIdx = std::type_index(tid);
-            auto elem = datasets_.find(typeIdx);
-            if (elem != datasets_.end())
+            const DxDataType<RawType>& data_type = DxDataType<RawType>::instance();
+
+            auto typePolicy = type_policies_.find(std::type_index(typeid(RawType)));
+            const DataSetCreationPolicy& policy = typePolicy != type_policies_.end() ? 
+                                                      typePolicy->second : policy_;
+
+            const size_t slot = detail::type_slot<RawType>::index();
+            if (slot >= datasets_.size())
             {
-                return elem->second;
+                datasets_.resize(slot + 1);
             }
-            else
+
+            H5::DataType fileType = policy.packed_file_type ? 
+                                        data_type.h5_file_datatype() : data_type.h5_datatype();
+            if (policy.commit_named_type)
             {
-                auto result = datasets_.emplace(typeIdx, 
-                                                make_dataset_stream<RawType>(typeName, 
-                                                                             file_, 
-                                                                             dataType));
-                assert(result.second);
-                return result.first->second;
+                fileType = commit_named_type(data_type.type_name(), fileType);
             }
+
+            datasets_[slot].reset(new H5DataSetStream(
+                make_dataset_stream<RawType>(data_type.type_name(), 
+                                             file_, 
+                                             data_type.h5_datatype(),
+                                             fileType,
+                                             policy)));
+            return *datasets_[slot];
+        }
+
+        // commits a copy of the type rather than the type itself: the
+        // DxDataType instance is shared by every writer in the process, and a
+        // datatype can only be committed to one file.
+        H5::DataType commit_named_type(const char* typeName, const H5::DataType& fileType)
+        {
+            if (!has_types_group_)
+            {
+                types_group_ = file_.createGroup(detail::NAMED_TYPES_GROUP);
+                has_types_group_ = true;
+            }
+
+            H5::DataType named;
+            named.copy(fileType);
+            named.commit(types_group_, typeName);
+            return named;
         }
 
 
         std::string filename_;
         H5::H5File file_;
+        DataSetCreationPolicy policy_;
+        std::map<std::type_index, DataSetCreationPolicy> type_policies_;
+
+        H5::Group types_group_;
+        bool has_types_group_;
 
-        std::map<std::type_index, H5DataSetStream> datasets_;
+        // indexed by detail::type_slot<T>::index(); empty for types this
+        // writer hasn't seen.
+        std::vector<std::unique_ptr<H5DataSetStream>> datasets_;
     };
 }
\ No newline at end of file
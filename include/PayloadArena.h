@@ -0,0 +1,143 @@
+// MIT License
+
+// Copyright (c) 2022 Johnathon Lewis
+
+// Permission is hereby granted, free of charge, to any person obtaining a copy
+// of this software and associated documentation files (the "Software"), to deal
+// in the Software without restriction, including without limitation the rights
+// to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+// copies of the Software, and to permit persons to whom the Software is
+// furnished to do so, subject to the following conditions:
+
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+// FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+// AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+// LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+// OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+// SOFTWARE.
+
+#pragma once
+#include "H5Cpp.h"
+
+#include <cstddef>
+#include <cstring>
+#include <memory>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+namespace h5gen
+{
+    namespace detail
+    {
+        static constexpr size_t DEFAULT_PAYLOAD_BLOCK_BYTES = 64 * 1024;
+    }
+
+    // holds copies of the variable-length payloads (the characters of a
+    // string, the elements of a vector) of records that have been staged but
+    // not written yet. staged records point into it, so nothing it hands out
+    // ever moves; memory comes from fixed-size blocks that are kept by reset()
+    // and reused, so once the arena has grown to hold a buffer's worth of
+    // payloads, staging a record no longer allocates.
+    class payload_arena
+    {
+    public:
+        explicit payload_arena(size_t blockSize = detail::DEFAULT_PAYLOAD_BLOCK_BYTES) noexcept:
+            block_size_(blockSize),
+            current_block_(0),
+            used_bytes_(0)
+        {
+        }
+
+        payload_arena(payload_arena&&) = default;
+        payload_arena& operator=(payload_arena&&) = default;
+        payload_arena(const payload_arena&) = delete;
+        payload_arena& operator=(const payload_arena&) = delete;
+
+        // alignment must be a power of two no larger than that of
+        // std::max_align_t.
+        void* allocate(size_t bytes, size_t alignment)
+        {
+            while (current_block_ < blocks_.size())
+            {
+                const size_t offset = (used_bytes_ + alignment - 1) & ~(alignment - 1);
+                if (offset + bytes <= blocks_[current_block_].size)
+                {
+                    used_bytes_ = offset + bytes;
+                    return blocks_[current_block_].data.get() + offset;
+                }
+                ++current_block_;
+                used_bytes_ = 0;
+            }
+
+            // a payload larger than a block gets a block of its own.
+            const size_t size = bytes > block_size_ ? bytes : block_size_;
+            blocks_.push_back(block { std::unique_ptr<unsigned char[]>(new unsigned char[size]), size });
+            current_block_ = blocks_.size() - 1;
+            used_bytes_ = bytes;
+            return blocks_.back().data.get();
+        }
+
+        // returns a NUL-terminated copy of the string, in the form HDF5 expects
+        // a variable-length string in memory.
+        const char* copy_string(const std::string& str)
+        {
+            char* copy = static_cast<char*>(allocate(str.size() + 1, 1));
+            std::memcpy(copy, str.c_str(), str.size() + 1);
+            return copy;
+        }
+
+        // returns a copy of the vector's elements, in the form HDF5 expects a
+        // variable-length sequence in memory.
+        template <typename T, typename Allocator>
+        hvl_t copy_sequence(const std::vector<T, Allocator>& vec)
+        {
+            static_assert(std::is_trivially_copyable<T>::value,
+                          "the elements of a variable-length sequence must be trivially copyable.");
+
+            hvl_t seq;
+            seq.len = vec.size();
+            seq.p = nullptr;
+            if (!vec.empty())
+            {
+                seq.p = allocate(vec.size() * sizeof(T), alignof(T));
+                std::memcpy(seq.p, vec.data(), vec.size() * sizeof(T));
+            }
+            return seq;
+        }
+
+        // makes all of the arena's memory available again. anything handed
+        // out before the call must not be used afterwards.
+        void reset() noexcept
+        {
+            current_block_ = 0;
+            used_bytes_ = 0;
+        }
+
+        size_t capacity() const noexcept
+        {
+            size_t total = 0;
+            for (const block& b : blocks_)
+            {
+                total += b.size;
+            }
+            return total;
+        }
+
+    private:
+        struct block
+        {
+            std::unique_ptr<unsigned char[]> data;
+            size_t size;
+        };
+
+        size_t block_size_;
+        size_t current_block_;
+        size_t used_bytes_;
+        std::vector<block> blocks_;
+    };
+}
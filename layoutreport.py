@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import json
+
+from atomictype import storage_type_size
+from typecode import TypeCode
+
+'''
+    Reports how the records of the parsed files are laid out in memory: how
+    many bytes of each are padding, where the largest holes are, how large a
+    record is once HDF5 has packed it for the file, and a field order that
+    would need less padding.
+'''
+
+# what a variable-length member takes up in a packed record on disk: its
+# length plus the ID of the global heap object holding the payload.
+_VARIABLE_LENGTH_STORED_BYTES = 16
+
+
+def build_layout_report(parsed_files):
+    '''
+        Returns the analysis of every record declared in the parsed files,
+        the ones wasting the most bytes first. records whose layout couldn't
+        be read are left out.
+    '''
+    analyses = {}
+    for parsed_file in parsed_files:
+        for datatype in parsed_file.compound_types_parsed_from_file + parsed_file.union_types_parsed_from_file:
+            _analyze_record(datatype, analyses)
+
+    report = [analysis for analysis in analyses.values() if analysis is not None]
+    report.sort(key=lambda analysis: (-(analysis["padding_bytes"] + analysis["nested_padding_bytes"]),
+                                      analysis["type"]))
+    return report
+
+
+def _analyze_record(datatype, analyses):
+    name = datatype.fully_qualified_typename
+    if name in analyses:
+        return analyses[name]
+    # a record that reaches itself (through a vector) is only counted once.
+    analyses[name] = None
+
+    layout = datatype.layout
+    if layout is None:
+        return None
+
+    holes = _find_holes(layout)
+    padding_bytes = sum(hole["bytes"] for hole in holes)
+
+    nested_padding_bytes = 0
+    stored_bytes = 0
+    variable_length = False
+    written_fields = datatype.written_fields if datatype.typecode == TypeCode.UNION else datatype.fields
+    for field in written_fields:
+        field_type = field.type_definition
+        field_layout = layout.get_field(field.name)
+        if field_type.typecode == TypeCode.VLSTRING or field_type.typecode == TypeCode.VLSEQUENCE:
+            stored_bytes += _VARIABLE_LENGTH_STORED_BYTES * field.num_array_elems()
+            variable_length = True
+            continue
+        if field.storage_type is not None:
+            stored_bytes += storage_type_size(field.storage_type) * field.num_array_elems()
+            continue
+
+        nested = None
+        if field_type.typecode == TypeCode.COMPOUND or field_type.typecode == TypeCode.UNION:
+            nested = _analyze_record(field_type, analyses)
+        if nested is not None:
+            nested_padding_bytes += (nested["padding_bytes"] + nested["nested_padding_bytes"]) * field.num_array_elems()
+            stored_bytes += nested["stored_bytes"] * field.num_array_elems()
+            variable_length = variable_length or nested["variable_length"]
+        elif field_layout is not None:
+            stored_bytes += field_layout.size
+
+    suggested_order, suggested_size = _suggest_order(layout)
+
+    analysis = {
+        "type": name,
+        "file": datatype.declaration_filename,
+        "kind": "union" if layout.is_union() else "struct",
+        "size": layout.size,
+        "alignment": layout.alignment,
+        "payload_bytes": layout.size - padding_bytes,
+        "padding_bytes": padding_bytes,
+        "padding_percent": round(100.0 * padding_bytes / layout.size, 1) if layout.size > 0 else 0.0,
+        "nested_padding_bytes": nested_padding_bytes,
+        "holes": sorted(holes, key=lambda hole: (-hole["bytes"], hole["offset"])),
+        "stored_bytes": stored_bytes,
+        "variable_length": variable_length,
+        "suggested_order": suggested_order,
+        "suggested_size": suggested_size
+    }
+    analyses[name] = analysis
+    return analysis
+
+
+def _find_holes(layout):
+    holes = []
+    covered_to = 0
+    previous_field = None
+    for field in sorted(layout.fields, key=lambda field: field.offset_bits):
+        if field.offset > covered_to:
+            holes.append({"offset": covered_to, "bytes": field.offset - covered_to, "after": previous_field})
+        covered_to = max(covered_to, field.end)
+        previous_field = field.name
+
+    if layout.size > covered_to:
+        holes.append({"offset": covered_to, "bytes": layout.size - covered_to, "after": previous_field})
+    return holes
+
+
+def _align_up(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _suggest_order(layout):
+    '''
+        Returns the field names sorted by decreasing alignment (which never
+        needs more padding than any other order) and the size the record
+        would have in that order, or (None, None) if that wouldn't make it
+        smaller. unions and records with bit-fields are left alone.
+    '''
+    if layout.is_union() or len(layout.fields) == 0 or any(field.is_bitfield() for field in layout.fields):
+        return None, None
+
+    reordered = sorted(layout.fields, key=lambda field: -field.alignment)
+    offset = 0
+    for field in reordered:
+        offset = _align_up(offset, field.alignment) + field.size
+    size = _align_up(offset, layout.alignment)
+
+    if size >= layout.size:
+        return None, None
+    return [field.name for field in reordered], size
+
+
+def format_layout_json(report):
+    return json.dumps({"types": report}, indent=2) + "\n"
+
+
+def format_layout_table(report):
+    '''
+        Returns the report as a table, one record per line, followed by the
+        suggested field orders.
+    '''
+    header = ("type", "sizeof", "payload", "padding", "pad %", "nested pad", "largest hole", "stored", "reordered")
+    rows = []
+    for analysis in report:
+        largest_hole = ""
+        if len(analysis["holes"]) > 0:
+            hole = analysis["holes"][0]
+            largest_hole = "{0} @ {1}".format(hole["bytes"], hole["offset"])
+        rows.append((analysis["type"],
+                     str(analysis["size"]),
+                     str(analysis["payload_bytes"]),
+                     str(analysis["padding_bytes"]),
+                     "{0:.1f}".format(analysis["padding_percent"]),
+                     str(analysis["nested_padding_bytes"]),
+                     largest_hole,
+                     str(analysis["stored_bytes"]) + ("+" if analysis["variable_length"] else ""),
+                     str(analysis["suggested_size"]) if analysis["suggested_size"] is not None else ""))
+
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        # the type name is left-aligned, the numbers right-aligned.
+        cells = [row[0].ljust(widths[0])] + [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+        lines.append("  ".join(cells).rstrip())
+
+    suggestions = [analysis for analysis in report if analysis["suggested_order"] is not None]
+    if len(suggestions) > 0:
+        lines.append("")
+        lines.append("Suggested field orders:")
+        for analysis in suggestions:
+            lines.append("  {0} ({1} -> {2} bytes): {3}".format(
+                analysis["type"], analysis["size"], analysis["suggested_size"],
+                ", ".join(analysis["suggested_order"])))
+    return "\n".join(lines) + "\n"
@@ -43,6 +43,15 @@ class Logger:
         self._warnings_are_errors = warnings_are_errors
     
     
+    def is_enabled(self, log_level):
+        '''
+            Whether a message at this level would be printed. hot loops check
+            this before building a message that would only be thrown away.
+        '''
+        if log_level == LogLevel.Warning and self._warnings_are_errors:
+            return True
+        return log_level <= self._log_level
+
     def log(self, log_level, logstr):
         fixed_lvl = log_level
         
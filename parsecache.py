@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import glob
+import hashlib
+import os
+import pickle
+
+from clangargs import build_clang_arglist
+from logger import LogLevel
+
+
+class ParseCache(object):
+    '''
+        An on-disk cache of parsed_file models. An entry is looked up by the
+        target file, the include directories, the clang arguments, the excluded
+        paths, the field rules and the working directory, and is only used if
+        none of the files the translation unit included have changed since it
+        was stored. Loading an entry never touches libclang.
+    '''
+
+    def __init__(self, cache_directory, logger, file_excluder=None, collect_layouts=False):
+        self._cache_dir = cache_directory
+        self._logger = logger
+        self._tool_fingerprint = ParseCache._fingerprint_tool_sources()
+        # types from excluded files and excluded fields are left out of the
+        # parse, and the field storage types are part of it, so the rules
+        # are part of every key.
+        self._excluded_paths = file_excluder.excluded_paths if file_excluder is not None else []
+        self._excluded_fields = file_excluder.excluded_field_patterns if file_excluder is not None else []
+        self._field_storage_rules = file_excluder.field_storage_rules if file_excluder is not None else []
+        # a parse with record layouts isn't interchangeable with one without.
+        self._collect_layouts = collect_layouts
+
+    def load(self, target_file, additional_include_dirs=[], extra_args=[]):
+        entry_path = self._entry_path(target_file, additional_include_dirs, extra_args)
+        if not os.path.exists(entry_path):
+            return None
+
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                entry = pickle.load(entry_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as err:
+            self._logger.log(LogLevel.Debug1, "Discarding unreadable parse cache entry {0}: {1}".format(
+                entry_path, err))
+            return None
+
+        for dependency, digest in entry['dependencies']:
+            if ParseCache._hash_file(dependency) != digest:
+                self._logger.log(LogLevel.Debug1, "Parse cache entry for {0} is stale; {1} changed.".format(
+                    target_file, dependency))
+                return None
+
+        return entry['parsed_file']
+
+    def store(self, target_file, additional_include_dirs, parsed_file, extra_args=[]):
+        dependencies = []
+        for dependency in parsed_file.translation_unit_files:
+            digest = ParseCache._hash_file(dependency)
+            if digest is None:
+                return
+            dependencies.append((dependency, digest))
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        entry_path = self._entry_path(target_file, additional_include_dirs, extra_args)
+
+        # write to a temporary file first so that a concurrent or interrupted
+        # run never sees a partially written entry.
+        tmp_path = "{0}.{1}.tmp".format(entry_path, os.getpid())
+        with open(tmp_path, 'wb') as entry_file:
+            pickle.dump({'dependencies': dependencies, 'parsed_file': parsed_file},
+                        entry_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, entry_path)
+
+    def _entry_path(self, target_file, additional_include_dirs, extra_args):
+        key = hashlib.sha256()
+        key.update(self._tool_fingerprint)
+        key.update(os.getcwd().encode())
+        key.update(os.path.abspath(target_file).encode())
+        for excluded_path in self._excluded_paths:
+            key.update(b'\1')
+            key.update(excluded_path.encode())
+        for excluded_field in self._excluded_fields:
+            key.update(b'\2')
+            key.update(excluded_field.encode())
+        for pattern, storage_typename in self._field_storage_rules:
+            key.update(b'\3')
+            key.update(pattern.encode())
+            key.update(b'=')
+            key.update(storage_typename.encode())
+        if self._collect_layouts:
+            key.update(b'\4')
+        for arg in build_clang_arglist(additional_include_dirs, extra_args):
+            key.update(b'\0')
+            key.update(arg.encode())
+        return os.path.join(self._cache_dir, key.hexdigest() + '.pickle')
+
+    @staticmethod
+    def _hash_file(path):
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _fingerprint_tool_sources():
+        # cached entries are pickled model objects, so any change to the
+        # generator's own sources invalidates all of them.
+        fingerprint = hashlib.sha256()
+        tool_dir = os.path.dirname(os.path.abspath(__file__))
+        for source in sorted(glob.glob(os.path.join(tool_dir, '*.py'))):
+            with open(source, 'rb') as f:
+                fingerprint.update(f.read())
+        return fingerprint.digest()
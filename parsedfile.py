@@ -23,22 +23,28 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
+import tracing
 from includepath import IncludePath
+from typecode import TypeCode
 from typemanager import type_manager
 
 
 class parsed_file(object):
-    def __init__(self, parsed_filename, typeman, includelist, include_directories):
+    def __init__(self, parsed_filename, typeman, includelist, include_directories, translation_unit_files=[]):
         self._my_file = parsed_filename
         self._type_mgr = typeman
+        self._tu_files = list(translation_unit_files)
 
+        # kept in first-seen order so the generated includes don't change
+        # from run to run.
         includeset = set()
-        for include in includelist:
-            includeset.add(IncludePath(include, include_directories))
-
         self._includes = []
-        for include in includeset:
-            self._includes.append(include)
+        with tracing.span("include resolution", "parse", file=parsed_filename):
+            for include in includelist:
+                include_path = IncludePath(include, include_directories)
+                if include_path not in includeset:
+                    includeset.add(include_path)
+                    self._includes.append(include_path)
 
     @property
     def all_parsed_compound_types(self):
@@ -50,15 +56,23 @@ class parsed_file(object):
 
     @property
     def compound_types_parsed_from_file(self):
-        return [type for type in self._type_mgr.get_compound_types() if type.declaration_filename == self._my_file]
+        return self._type_mgr.get_types_declared_in(self._my_file, TypeCode.COMPOUND)
 
     @property
     def enum_types_parsed_from_file(self):
-        return [type for type in self._type_mgr.get_enum_types() if type.declaration_filename == self._my_file]
+        return self._type_mgr.get_types_declared_in(self._my_file, TypeCode.ENUM)
 
     @property
     def union_types_parsed_from_file(self):
-        return [type for type in self._type_mgr.get_union_types() if type.declaration_filename == self._my_file]
+        return self._type_mgr.get_types_declared_in(self._my_file, TypeCode.UNION)
+
+    @property
+    def type_manager(self):
+        return self._type_mgr
+
+    @type_manager.setter
+    def type_manager(self, typeman):
+        self._type_mgr = typeman
 
     @property
     def other_includes(self):
@@ -67,3 +81,12 @@ class parsed_file(object):
     @property
     def parsed_filepath(self):
         return self._my_file
+
+    @property
+    def translation_unit_files(self):
+        return self._tu_files
+
+    def add_translation_unit_files(self, files):
+        for f in files:
+            if f not in self._tu_files:
+                self._tu_files.append(f)
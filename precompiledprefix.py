@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import collections
+import hashlib
+import os
+import re
+
+import clangworkarounds
+from clangargs import build_clang_arglist
+from logger import LogLevel
+
+_include_directive = re.compile(r'^#\s*include\s*([<"][^>"]+[>"])')
+_directive = re.compile(r'^#\s*(\w+)\s*(\S*)')
+
+
+class PrecompiledPrefix(object):
+    '''
+        A precompiled header built from the #include lines that a group of
+        target files have in common. targets are parsed with -include-pch, so
+        clang deserializes the shared headers instead of parsing them again for
+        every target. the PCH is kept next to a manifest of content hashes of
+        the headers it was built from and rebuilt when any of them change.
+
+        quote_dirs are the directories of the targets, which the prefix is
+        built with as -iquote directories: a quoted include is looked up next
+        to the file it's in, and the prefix header itself lives elsewhere.
+    '''
+
+    def __init__(self, include_lines, include_dirs, extra_args, pch_directory, quote_dirs=()):
+        self._include_lines = list(include_lines)
+        self._include_dirs = list(include_dirs)
+        self._extra_args = list(extra_args)
+        self._build_args = list(extra_args)
+        for quote_dir in quote_dirs:
+            self._build_args += ['-iquote', quote_dir]
+        self._dependency_files = []
+
+        key = hashlib.sha256()
+        for part in self._include_lines + ['\0'] + build_clang_arglist(self._include_dirs, self._build_args):
+            key.update(part.encode())
+            key.update(b'\0')
+        basename = os.path.join(os.path.abspath(pch_directory), 'prefix_' + key.hexdigest()[:16])
+        self._header_path = basename + '.h'
+        self._pch_path = basename + '.pch'
+        self._manifest_path = basename + '.deps'
+
+    @property
+    def clang_args(self):
+        return ['-include-pch', self._pch_path]
+
+    @property
+    def dependency_files(self):
+        return self._dependency_files
+
+    def ensure_built(self, logger):
+        '''
+            Builds the PCH unless an up-to-date one exists. returns False if it
+            couldn't be built, in which case targets should be parsed without it.
+        '''
+        if self._is_up_to_date():
+            return True
+
+        import clang.cindex
+
+        os.makedirs(os.path.dirname(self._header_path), exist_ok=True)
+        with open(self._header_path, 'w') as header:
+            header.write('#pragma once\n')
+            for include_line in self._include_lines:
+                header.write('#include {0}\n'.format(include_line))
+
+        # the prefix is compiled as a header; everything else must match the
+        # flags the targets are parsed with or clang will reject the PCH.
+        arglist = build_clang_arglist(self._include_dirs, self._build_args)
+        arglist[arglist.index('c++')] = 'c++-header'
+
+        parser_options = (
+            clangworkarounds.CXTranslationUnit_DetailedPreprocessingRecord |
+            clangworkarounds.CXTranslationUnit_Incomplete |
+            clangworkarounds.CXTranslationUnit_ForSerialization |
+            clangworkarounds.CXTranslationUnit_SkipFunctionBodies
+        )
+
+        index = clang.cindex.Index.create()
+        translation_unit = index.parse(self._header_path, args=arglist, options=parser_options)
+        for diagnostic in translation_unit.diagnostics:
+            if diagnostic.severity >= clang.cindex.Diagnostic.Error:
+                # not a warning: the targets are parsed without the prefix,
+                # which is slower but otherwise no different.
+                logger.log(LogLevel.Info, "Could not precompile the common includes {0}: {1}".format(
+                    ", ".join(self._include_lines), diagnostic.spelling))
+                return False
+
+        try:
+            translation_unit.save(self._pch_path)
+        except clang.cindex.TranslationUnitSaveError as err:
+            logger.log(LogLevel.Info, "Could not save precompiled header {0}: {1}".format(
+                self._pch_path, err))
+            return False
+
+        dependency_files = [self._header_path]
+        for inclusion in translation_unit.get_includes():
+            included = os.path.realpath(inclusion.include.name)
+            if included not in dependency_files:
+                dependency_files.append(included)
+        self._dependency_files = dependency_files
+
+        with open(self._manifest_path, 'w') as manifest:
+            for dependency in dependency_files:
+                manifest.write('{0} {1}\n'.format(_hash_file(dependency), dependency))
+
+        logger.log(LogLevel.Info, "Precompiled {0} common include(s) into {1}.".format(
+            len(self._include_lines), self._pch_path))
+        return True
+
+    def _is_up_to_date(self):
+        if not os.path.exists(self._pch_path) or not os.path.exists(self._manifest_path):
+            return False
+
+        dependency_files = []
+        with open(self._manifest_path, 'r') as manifest:
+            for line in manifest:
+                digest, dependency = line.rstrip('\n').split(' ', 1)
+                if _hash_file(dependency) != digest:
+                    return False
+                dependency_files.append(dependency)
+
+        self._dependency_files = dependency_files
+        return True
+
+
+def _hash_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _read_include_lines(target_file):
+    '''
+        Returns the #include lines a file starts with, past comments, #pragma
+        once and an include guard. the first line that is anything else ends
+        them: an include after a conditional or a #define may not be one the
+        real parse sees, or may not see it the same way.
+    '''
+    include_lines = []
+    guard = None
+    guard_defined = False
+    in_comment = False
+    with open(target_file, 'r', errors='replace') as f:
+        for line in f:
+            text = line.strip()
+            if in_comment:
+                if '*/' not in text:
+                    continue
+                text = text[text.index('*/') + 2:].strip()
+                in_comment = False
+            if text.startswith('/*'):
+                comment_end = text.find('*/', 2)
+                if comment_end < 0:
+                    in_comment = True
+                    continue
+                text = text[comment_end + 2:].strip()
+            if len(text) == 0 or text.startswith('//'):
+                continue
+
+            include = _include_directive.match(text)
+            if include is not None:
+                if guard is not None and not guard_defined:
+                    break
+                include_lines.append(include.group(1))
+                continue
+
+            directive = _directive.match(text)
+            if directive is None:
+                break
+            name, argument = directive.groups()
+            if name == 'pragma' and argument == 'once':
+                continue
+            if name == 'ifndef' and guard is None and len(include_lines) == 0:
+                guard = argument
+                continue
+            if name == 'define' and guard == argument and not guard_defined:
+                guard_defined = True
+                continue
+            break
+
+    if guard is not None and not guard_defined:
+        # the #ifndef wasn't an include guard after all.
+        return []
+    return include_lines
+
+
+def attach_precompiled_prefixes(jobs, pch_directory, logger):
+    '''
+        Groups the jobs by their parser flags and, within a group, gives the
+        targets that share leading #include lines a PrecompiledPrefix built
+        from those lines. jobs that share no includes are left alone.
+    '''
+    groups = {}
+    for job in jobs:
+        key = (tuple(job.include_dirs), tuple(job.extra_args))
+        groups.setdefault(key, []).append(job)
+
+    for (include_dirs, extra_args), group in groups.items():
+        if len(group) < 2:
+            continue
+
+        includes = {}
+        for job in group:
+            includes[job] = _resolved_include_lines(job.target_file)
+
+        # a target that shares nothing with the others (e.g. a leaf header
+        # without includes) is parsed on its own rather than stopping the
+        # rest from sharing a prefix. the include most targets share picks
+        # who shares the next prefix, until no include is shared any more.
+        remaining = [job for job in group if len(includes[job]) > 0]
+        while len(remaining) >= 2:
+            counts = collections.Counter(key for job in remaining for key in includes[job])
+            shared_key, count = counts.most_common(1)[0]
+            if count < 2:
+                break
+            sharing = [job for job in remaining if shared_key in includes[job]]
+            remaining = [job for job in remaining if shared_key not in includes[job]]
+
+            # in the order of the first target, which is the order the headers
+            # expect to be included in.
+            common_includes = [(key, line) for key, line in includes[sharing[0]].items()
+                               if all(key in includes[job] for job in sharing[1:])]
+            quote_dirs = list(dict.fromkeys(os.path.dirname(os.path.abspath(job.target_file)) for job in sharing))
+            prefix = PrecompiledPrefix([line for key, line in common_includes], include_dirs, extra_args,
+                                       pch_directory, quote_dirs)
+            for job in sharing:
+                job.precompiled_prefix = prefix
+
+        if len(remaining) > 0:
+            logger.log(LogLevel.Debug1, "No common includes to precompile for {0} target(s).".format(len(remaining)))
+
+
+def _resolved_include_lines(target_file):
+    '''
+        Returns the leading #include lines of a file, keyed by what they
+        include: a quoted include that's found next to the file is keyed by
+        that file's path, since the same line in another directory is another
+        header. anything else is keyed by the line itself.
+    '''
+    target_dir = os.path.dirname(os.path.abspath(target_file))
+    resolved = {}
+    for line in _read_include_lines(target_file):
+        key = line
+        if line.startswith('"'):
+            candidate = os.path.join(target_dir, line[1:-1])
+            if os.path.isfile(candidate):
+                key = os.path.realpath(candidate)
+        resolved.setdefault(key, line)
+    return resolved
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import sys
+
+
+class field_layout(object):
+    '''
+        Where one field of a record sits in memory, as the compiler laid it
+        out. offsets are in bits so that bit-fields can be described too.
+    '''
+    __slots__ = ('_name', '_offset_bits', '_size', '_alignment', '_bit_width')
+
+    def __init__(self, name, offset_bits, size, alignment, bit_width=None):
+        self._name = sys.intern(name)
+        self._offset_bits = offset_bits
+        self._size = size
+        self._alignment = alignment
+        self._bit_width = bit_width
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def offset_bits(self):
+        return self._offset_bits
+
+    @property
+    def offset(self):
+        return self._offset_bits // 8
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def alignment(self):
+        return self._alignment
+
+    @property
+    def bit_width(self):
+        return self._bit_width
+
+    def is_bitfield(self):
+        return self._bit_width is not None
+
+    @property
+    def end(self):
+        '''
+            The offset of the first byte past the field.
+        '''
+        if self._bit_width is not None:
+            return (self._offset_bits + self._bit_width + 7) // 8
+        return self.offset + self._size
+
+
+class record_layout(object):
+    '''
+        The size, alignment and field offsets of a struct, class or union, in
+        declaration order.
+    '''
+    __slots__ = ('_size', '_alignment', '_fields', '_is_union')
+
+    def __init__(self, size, alignment, is_union=False):
+        self._size = size
+        self._alignment = alignment
+        self._fields = []
+        self._is_union = is_union
+
+    def add_field(self, name, offset_bits, size, alignment, bit_width=None):
+        self._fields.append(field_layout(name, offset_bits, size, alignment, bit_width))
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def alignment(self):
+        return self._alignment
+
+    @property
+    def fields(self):
+        return self._fields
+
+    def is_union(self):
+        return self._is_union
+
+    def get_field(self, name):
+        for field in self._fields:
+            if field.name == name:
+                return field
+        return None
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+clang_cindex = pytest.importorskip('clang.cindex')
+
+from fileparse import parse_input_file
+from logger import Logger, LogLevel
+from typecode import TypeCode
+
+# just enough of std for the parser to recognize the templates, so the test
+# doesn't depend on where the standard library headers are.
+_HEADER = '''\
+namespace std {
+    template <typename T> struct allocator {};
+    template <typename T, typename A = allocator<T>> class vector { T* data_; };
+    template <typename C> class basic_string { C* data_; };
+    typedef basic_string<char> string;
+}
+
+struct Named { std::string name; int id; };
+struct Plain { int a; double b; };
+struct Wrapper { Named inner; };
+
+struct Holder
+{
+    std::vector<Plain> plain;
+    std::vector<Named> named;
+    std::vector<Wrapper> wrapped;
+    std::vector<int> values;
+};
+
+struct Node
+{
+    int value;
+    std::vector<Node> children;
+};
+'''
+
+
+def _parse(tmp_path):
+    header = tmp_path / 'sequences.h'
+    header.write_text(_HEADER)
+    return parse_input_file(str(header), Logger(LogLevel.Severe))
+
+
+def _field_names(parsed, typename):
+    return [field.name for field in parsed.type_manager.get_type(typename).fields]
+
+
+def test_vector_of_record_with_variable_length_members_is_rejected(tmp_path):
+    parsed = _parse(tmp_path)
+    assert _field_names(parsed, 'Holder') == ['plain', 'values']
+
+
+def test_vector_of_the_record_it_is_in_is_rejected(tmp_path):
+    parsed = _parse(tmp_path)
+    assert _field_names(parsed, 'Node') == ['value']
+
+
+def test_vector_of_fixed_layout_record_is_a_sequence(tmp_path):
+    parsed = _parse(tmp_path)
+    plain = parsed.type_manager.get_type('Holder').fields[0].type_definition
+    assert plain.typecode == TypeCode.VLSEQUENCE
+    assert plain.element_type.typename == 'Plain'
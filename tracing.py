@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+import contextlib
+import json
+import os
+import threading
+import time
+
+# None while tracing is off, so a disabled span costs one comparison.
+_events = None
+_null_span = contextlib.nullcontext()
+
+
+class _Span(object):
+    __slots__ = ('_name', '_category', '_args', '_start')
+
+    def __init__(self, name, category, args):
+        self._name = name
+        self._category = category
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if _events is not None:
+            _events.append({
+                "name": self._name,
+                "cat": self._category,
+                "ph": "X",
+                "ts": self._start / 1000.0,
+                "dur": (end - self._start) / 1000.0,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": self._args
+            })
+        return False
+
+
+def enable():
+    global _events
+    if _events is None:
+        _events = []
+
+
+def is_enabled():
+    return _events is not None
+
+
+def span(name, category, **args):
+    '''
+        Times the enclosed block as a complete event in the trace. does
+        nothing unless tracing was enabled.
+    '''
+    if _events is None:
+        return _null_span
+    return _Span(name, category, args)
+
+
+def take_events():
+    '''
+        Removes and returns the events recorded so far; worker processes use
+        this to send their events back with their results.
+    '''
+    global _events
+    if _events is None:
+        return []
+    events = _events
+    _events = []
+    return events
+
+
+def add_events(events):
+    if _events is not None:
+        _events.extend(events)
+
+
+def write_chrome_trace(trace_filepath):
+    with open(trace_filepath, 'w') as trace_file:
+        json.dump({"traceEvents": _events if _events is not None else [],
+                   "displayTimeUnit": "ms"}, trace_file)
+
+
+def summarize(category, top_n):
+    '''
+        Returns (name, total milliseconds, count) for the top_n names in the
+        category that took the longest in total.
+    '''
+    totals = {}
+    for event in (_events if _events is not None else []):
+        if event["cat"] == category:
+            total, count = totals.get(event["name"], (0.0, 0))
+            totals[event["name"]] = (total + event["dur"] / 1000.0, count + 1)
+
+    ranked = sorted(totals.items(), key=lambda item: item[1][0], reverse=True)
+    return [(name, total, count) for name, (total, count) in ranked[:top_n]]
@@ -25,24 +25,225 @@ SOFTWARE.
 '''
 import argparse
 import os
+import shutil
+import sys
+import tempfile
 import time
 
-import clang.cindex
-
-from exceptiontypes import CompilerError, SevereLogMsgException
+import tracing
+from batchparse import ParseJob, parse_jobs, share_type_managers
+from compiledb import CompilationDatabase
+from exceptiontypes import SevereLogMsgException
 from fileexclusion import FileExcluder
-from filegen import generate_output_header_file
-from fileparse import parse_input_file
+from generatord import send_request
+from layoutreport import build_layout_report, format_layout_json, format_layout_table
+from filegen import generate_output_header_file, generate_output_source_file, select_backend
+from filegenutils import build_depfile, build_output_filepath, write_if_changed
 from logger import Logger, LogLevel
-from parsedfile import parsed_file
-from typemanager import type_manager
+from parsecache import ParseCache
+from precompiledprefix import attach_precompiled_prefixes
+from typeclosure import find_root_types, reachable_typenames
+
+
+def _build_parse_jobs(args, logger):
+    include_dirs = args.include_directory if args.include_directory is not None else []
+    compile_db = None
+    if args.compile_commands is not None:
+        compile_db = CompilationDatabase(args.compile_commands)
+
+    jobs = []
+    seen_targets = set()
+    for target_file in args.target_files:
+        if not os.path.exists(target_file):
+            logger.log(LogLevel.Severe, "Could not find file {0} to read.".format(
+                target_file))
+
+        # the same header can be named through different relative paths.
+        real_target = os.path.realpath(target_file)
+        if real_target in seen_targets:
+            logger.log(LogLevel.Debug1, "Skipping duplicate target {0}.".format(target_file))
+            continue
+        seen_targets.add(real_target)
+
+        target_include_dirs = list(include_dirs)
+        extra_args = []
+        if compile_db is not None:
+            flags = compile_db.flags_for(target_file)
+            if flags is not None:
+                target_include_dirs += flags[0]
+                extra_args = flags[1]
+            else:
+                logger.log(LogLevel.Debug1, "No compile command applies to {0}; using the command line include paths.".format(
+                    target_file))
+
+        jobs.append(ParseJob(target_file, target_include_dirs, extra_args))
+    return jobs
+
+
+def _read_root_types(args):
+    '''
+        Returns the root type names given with --root-type and in --roots-file,
+        or None if there are none, in which case every type is generated.
+    '''
+    root_typenames = list(args.root_type) if args.root_type is not None else []
+    if args.roots_file is not None:
+        with open(args.roots_file, 'r') as roots_file:
+            for line in roots_file:
+                line = line.strip()
+                if len(line) > 0 and not line.startswith('#'):
+                    root_typenames.append(line)
+    return root_typenames if len(root_typenames) > 0 else None
+
+
+def _generate_on_server(args, jobs, logger):
+    request = {
+        'targets': [{'target_file': os.path.abspath(job.target_file),
+                     'include_dirs': [os.path.abspath(d) for d in job.include_dirs],
+                     'extra_args': job.extra_args} for job in jobs],
+        'output_dir': os.path.abspath(args.output_dir),
+        'ignore_file': os.path.abspath(args.ignore_file),
+        'field_rules': os.path.abspath(args.field_rules) if args.field_rules is not None else None,
+        'depfile': os.path.abspath(args.depfile) if args.depfile is not None else None,
+        'template_dir': os.path.abspath(args.template_dir) if args.template_dir is not None else None,
+        'root_types': _read_root_types(args),
+        'out_of_line': args.out_of_line,
+        'definitions_out': os.path.abspath(args.definitions_out) if args.definitions_out is not None else None
+    }
+
+    try:
+        response = send_request(args.server, request)
+    except OSError as err:
+        logger.log(LogLevel.Severe, "Could not reach the generator daemon at {0}: {1}".format(args.server, err))
+    if response is None:
+        logger.log(LogLevel.Severe, "The generator daemon at {0} sent no valid reply.".format(args.server))
+    for error in response['errors']:
+        print(error)
+    for output_filepath in response['outputs']:
+        logger.log(LogLevel.Debug1, "Generated {0}.".format(output_filepath))
+    if len(response['errors']) > 0:
+        logger.log(LogLevel.Severe, "{0} of {1} file(s) could not be generated.".format(
+            len(response['errors']), len(jobs)))
+
+
+def _report_profile(args, logger):
+    if args.trace_out is not None:
+        tracing.write_chrome_trace(args.trace_out)
+        logger.log(LogLevel.Info, "Wrote trace to {0}.".format(args.trace_out))
+
+    if args.profile:
+        for category, title in (("phase", "Phases"), ("header parse", "Slowest headers to parse"),
+                                ("header emit", "Slowest headers to emit"), ("type", "Slowest types to emit")):
+            print("{0}:".format(title))
+            for name, total_ms, count in tracing.summarize(category, args.profile_top):
+                print("  {0:>10.2f} ms  {1}{2}".format(total_ms, name, " (x{0})".format(count) if count > 1 else ""))
+
+
+def _report_layouts(args, parsed_files, logger):
+    report = build_layout_report(parsed_files)
+    if args.layout_report_out is not None:
+        write_if_changed(args.layout_report_out, format_layout_json(report))
+        logger.log(LogLevel.Info, "Wrote layout report to {0}.".format(args.layout_report_out))
+
+    if args.layout_report:
+        print(format_layout_table(report), end='')
+
+
+def _generate_locally(args, jobs, logger):
+    '''
+        Parses and generates every job in this process (and its parse
+        workers), returning the number of target files that could not be
+        parsed. the targets that did parse are still generated.
+    '''
+    logger.log(LogLevel.Info, "Parsing {0} file(s).".format(len(jobs)))
+
+    # exclusions are applied while walking the AST, not just when generating.
+    file_excluder = FileExcluder(args.ignore_file, args.field_rules)
+    report_layouts = args.layout_report or args.layout_report_out is not None
+
+    parse_cache = None
+    if args.cache_dir is not None:
+        parse_cache = ParseCache(args.cache_dir, logger, file_excluder, report_layouts)
+
+    pch_dir = None
+    remove_pch_dir = False
+    if args.precompile_common_includes:
+        if args.cache_dir is not None:
+            pch_dir = os.path.join(args.cache_dir, 'pch')
+        else:
+            pch_dir = tempfile.mkdtemp(prefix='h5gen_pch_')
+            remove_pch_dir = True
+        attach_precompiled_prefixes(jobs, pch_dir, logger)
+
+    # libclang is only loaded (in this process or in the workers) if there
+    # is something that isn't cached.
+    start = time.time()
+    with tracing.span("parse", "phase"):
+        results = parse_jobs(jobs, logger, args.verbosity, args.enable_warnings_as_errors,
+                             args.clang_library_file, parse_cache, args.jobs, file_excluder, report_layouts)
+    end = time.time()
+
+    if remove_pch_dir:
+        shutil.rmtree(pch_dir, ignore_errors=True)
+
+    logger.log(LogLevel.Info, "Parsing of {0} file(s) completed in {1} seconds.".format(
+        len(jobs), end - start))
+    logger.log(LogLevel.Info, "Generating code.")
+
+    parsed_files = [parsed_file for job, parsed_file in results]
+    with tracing.span("share type managers", "phase"):
+        share_type_managers(parsed_files, logger)
+
+    emitted_typenames = None
+    root_typenames = _read_root_types(args)
+    if root_typenames is not None:
+        root_types = find_root_types([parsed_file.type_manager for parsed_file in parsed_files], root_typenames, logger)
+        emitted_typenames = reachable_typenames(root_types)
+        logger.log(LogLevel.Info, "Generating the {0} type(s) reachable from {1} root type(s).".format(
+            len(emitted_typenames), len(root_types)))
+
+    try:
+        backend = select_backend(args.template_dir)
+    except (OSError, ValueError) as err:
+        logger.log(LogLevel.Severe, "Could not load the templates in {0}: {1}".format(args.template_dir, err))
+
+    out_of_line = args.out_of_line or args.definitions_out is not None
+    depfile_rules = []
+    with tracing.span("generate", "phase"):
+        for parsed_file in parsed_files:
+            with tracing.span(parsed_file.parsed_filepath, "header emit"):
+                output_filepath = generate_output_header_file(
+                    logger, args.output_dir, parsed_file, file_excluder, backend, emitted_typenames, out_of_line)
+                depfile_rules.append((output_filepath, parsed_file.translation_unit_files))
+
+                if out_of_line and args.definitions_out is None:
+                    source_filepath = generate_output_source_file(
+                        logger, build_output_filepath(args.output_dir, os.path.basename(parsed_file.parsed_filepath), "cpp"),
+                        [parsed_file], file_excluder, backend, emitted_typenames)
+                    depfile_rules.append((source_filepath, parsed_file.translation_unit_files))
+
+        if args.definitions_out is not None:
+            generate_output_source_file(logger, args.definitions_out, parsed_files, file_excluder, backend, emitted_typenames)
+            dependencies = []
+            for parsed_file in parsed_files:
+                dependencies += [f for f in parsed_file.translation_unit_files if f not in dependencies]
+            depfile_rules.append((args.definitions_out, dependencies))
+
+    if args.depfile is not None:
+        write_if_changed(args.depfile, build_depfile(depfile_rules))
+
+    if report_layouts:
+        _report_layouts(args, parsed_files, logger)
+
+    return len(jobs) - len(results)
+
 
 if __name__ == "__main__":
     try:
         parser = argparse.ArgumentParser(
-            description="Generates C++ shim code to transform most arbitrary structs into an HDF5 data type.")
-        parser.add_argument('target_file',
-                            help='the file that the transform will be generated for.')
+            description="Generates C++ shim code to transform most arbitrary structs into an HDF5 data type.",
+            fromfile_prefix_chars='@')
+        parser.add_argument('target_files', nargs='+', metavar='target_file',
+                            help='the file(s) that the transform will be generated for. @file reads further arguments, one per line, from a response file.')
 
         parser.add_argument('--output-dir', '-o', metavar=("output directory"),
                             help='the directory the transforms will be generated in.', default=os.getcwd())
@@ -62,41 +263,95 @@ if __name__ == "__main__":
                             help='the text file specifying which include directories that potentially can be pulled into a parse chain should be skipped.',
                             default='ignore.txt')
 
+        parser.add_argument('--field-rules',
+                            help='a text file of fields to leave out of the generated types, one Type::field pattern (* and ? match anything) per line, e.g. ns::Record::scratch or *::debug_*. fields can also be marked in the source with H5GEN_SKIP from H5GenAnnotations.h or a "h5gen::skip" doc comment. a line of the form Type::field = type (e.g. *::timestamp = float) instead stores the matching arithmetic fields as that type in the file; see H5GEN_STORE_AS.',
+                            default=None)
+
         parser.add_argument('--enable-warnings-as-errors', '-w',
                             help='all tool-generated warnings will emit a fatal error and stop further generation.',
                             default=False, action='store_true')
 
+        parser.add_argument('--cache-dir', '-c',
+                            help='a directory to cache parse results in. a cached result is reused, without loading libclang, as long as the target file, every file it includes and the include paths are unchanged.',
+                            default=None)
+
+        parser.add_argument('--compile-commands', '-p',
+                            help='a compile_commands.json to take per-file include paths and defines from. a header without an entry of its own uses the entry of a source file with the same name.',
+                            default=None)
+
+        parser.add_argument('--precompile-common-includes', '-P',
+                            help='precompile the #include lines shared by every target parsed with the same flags and load them as a PCH instead of parsing them once per target. the PCH is kept in the cache directory if one is given.',
+                            default=False, action='store_true')
+
+        parser.add_argument('--depfile', '-d',
+                            help='write a Make/Ninja depfile listing, for every generated header, each header its target file included.',
+                            default=None)
+
+        parser.add_argument('--template-dir', '-t',
+                            help='a directory of <template name>.tmpl files that replace the built-in templates of the same name (see h5templates.py).',
+                            default=None)
+
+        parser.add_argument('--root-type', '-r',
+                            help='a record or enum type, by its fully qualified name, that is written to a file. if any root types are given, only they and the types their fields use are generated. may be repeated.',
+                            action='append')
+
+        parser.add_argument('--roots-file',
+                            help='a text file of root types (see --root-type), one per line. blank lines and lines starting with # are skipped.',
+                            default=None)
+
+        parser.add_argument('--out-of-line',
+                            help='only declare the members of each DxDataType in the generated header and define them in a generated .cpp next to it, so that including the header stays cheap and the datatypes are built by code compiled once.',
+                            default=False, action='store_true')
+
+        parser.add_argument('--definitions-out',
+                            help='implies --out-of-line, and writes the definitions for all target files into this one source file instead of a .cpp per header.',
+                            default=None)
+
+        parser.add_argument('--server', '-s',
+                            help='hand the targets to a generatord.py daemon listening on this Unix socket instead of parsing them here.',
+                            default=None)
+
+        parser.add_argument('--profile',
+                            help='time every phase, header and emitted type and print the slowest of each when done.',
+                            default=False, action='store_true')
+
+        parser.add_argument('--profile-top',
+                            help='how many headers and types --profile lists.',
+                            default=10, type=int)
+
+        parser.add_argument('--trace-out',
+                            help='write the timings as a Chrome trace (chrome://tracing, Perfetto) to this file.',
+                            default=None)
+
+        parser.add_argument('--layout-report',
+                            help='print, for every record in the target files, its size, how many of its bytes are padding, its largest padding holes, its size on disk and a field order that would need less padding.',
+                            default=False, action='store_true')
+
+        parser.add_argument('--layout-report-out',
+                            help='write the layout report as JSON to this file.',
+                            default=None)
+
+        parser.add_argument('--jobs', '-j',
+                            help='the number of processes used to parse target files in parallel.',
+                            default=os.cpu_count() or 1, type=int)
+
         args = parser.parse_args()
         logger = Logger(args.verbosity, args.enable_warnings_as_errors)
-        clang.cindex.Config.set_library_file(args.clang_library_file)
-
-        logger.log(LogLevel.Info, "Parsing file {0}.".format(args.target_file))
 
-        if not os.path.exists(args.target_file):
-            logger.log(LogLevel.Severe, "Could not find file {0} to read.".format(
-                args.target_file))
-            exit()
+        jobs = _build_parse_jobs(args, logger)
 
-        start = time.time()
-        if args.include_directory is not None:
-            parsed_file = parse_input_file(
-                args.target_file, logger, args.include_directory)
+        if args.server is not None:
+            if args.layout_report or args.layout_report_out is not None:
+                logger.log(LogLevel.Warning, "The layout report is only available when parsing locally; ignoring it.")
+            _generate_on_server(args, jobs, logger)
         else:
-            parsed_file = parse_input_file(args.target_file, logger)
-        end = time.time()
-
-        logger.log(LogLevel.Info, "Parsing of {0} completed in {1} seconds.".format(
-            args.target_file, end - start))
-        logger.log(LogLevel.Info, "Generating code.")
-
-        file_excluder = FileExcluder(args.ignore_file)
-        generate_output_header_file(
-            logger, args.output_dir, parsed_file, file_excluder)
-
-    except CompilerError as err:
-        print("The following compiler error(s) were encountered when parsing {0}:".format(
-            args.target_file))
-        print(err)
-        print("The process was aborted and the output was not successfully generated.")
+            if args.profile or args.trace_out is not None:
+                tracing.enable()
+            num_failed = _generate_locally(args, jobs, logger)
+            _report_profile(args, logger)
+            if num_failed > 0:
+                logger.log(LogLevel.Info, "{0} of {1} file(s) could not be parsed.".format(num_failed, len(jobs)))
+                sys.exit(1)
+
     except SevereLogMsgException as logerr:
-        pass
+        sys.exit(1)
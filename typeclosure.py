@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+from logger import LogLevel
+from typecode import TypeCode
+
+
+def field_dependencies(datatype):
+    '''
+        Returns the types whose DxDataType the DxDataType of datatype refers
+        to: the compound and enum types of the fields it writes, and the
+        element types of its sequences.
+    '''
+    if datatype.typecode == TypeCode.UNION:
+        fields = datatype.written_fields
+    elif datatype.typecode == TypeCode.COMPOUND:
+        fields = datatype.fields
+    else:
+        return []
+
+    dependencies = []
+    for field in fields:
+        field_type = field.type_definition
+        if field_type.typecode == TypeCode.VLSEQUENCE:
+            field_type = field_type.element_type
+        if field_type.typecode == TypeCode.COMPOUND or field_type.typecode == TypeCode.ENUM:
+            dependencies.append(field_type)
+    return dependencies
+
+
+def find_root_types(type_managers, root_typenames, logger):
+    '''
+        Looks the root type names up in the type managers, warning about any
+        that none of them know.
+    '''
+    roots = []
+    for typename in root_typenames:
+        # "::ns::Type" names the same type as "ns::Type".
+        lookup_name = typename[2:] if typename.startswith("::") else typename
+        typeman = next((typeman for typeman in type_managers if typeman.is_known_type(lookup_name)), None)
+        if typeman is None:
+            logger.log(LogLevel.Warning, "Root type {0} isn't declared in any target file or anything they include.".format(
+                typename))
+            continue
+        roots.append(typeman.get_type(lookup_name))
+    return roots
+
+
+# types are compared by name from here on: parses that don't share a type
+# manager each have their own instance of a type.
+
+def reachable_typenames(root_types):
+    '''
+        Returns the names of the root types and of every type they depend on,
+        directly or not.
+    '''
+    reachable = set(datatype.fully_qualified_typename for datatype in root_types)
+    pending = list(root_types)
+    while len(pending) > 0:
+        for dependency in field_dependencies(pending.pop()):
+            if dependency.fully_qualified_typename not in reachable:
+                reachable.add(dependency.fully_qualified_typename)
+                pending.append(dependency)
+    return reachable
+
+
+def topological_order(types):
+    '''
+        Returns the types ordered so that each one comes after every type in
+        the list that it depends on; apart from that the order is kept.
+    '''
+    wanted = dict((datatype.fully_qualified_typename, datatype) for datatype in types)
+    visited = set()
+    ordered = []
+    for datatype in types:
+        if datatype.fully_qualified_typename in visited:
+            continue
+        visited.add(datatype.fully_qualified_typename)
+        stack = [(datatype, iter(field_dependencies(datatype)))]
+        while len(stack) > 0:
+            current, dependencies = stack[-1]
+            for dependency in dependencies:
+                name = dependency.fully_qualified_typename
+                if name in wanted and name not in visited:
+                    visited.add(name)
+                    dependency = wanted[name]
+                    stack.append((dependency, iter(field_dependencies(dependency))))
+                    break
+            else:
+                stack.pop()
+                ordered.append(current)
+    return ordered
@@ -32,3 +32,5 @@ class TypeCode(Enum):
     COMPOUND = 2
     ENUM = 3
     UNION = 4
+    VLSTRING = 5
+    VLSEQUENCE = 6
@@ -24,11 +24,20 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import sys
+
 from atomictype import *
 from typecode import TypeCode
 
 
 class type_manager(object):
+    '''
+        Maps type names to types. besides the name map, non-atomic types are
+        indexed by typecode and by the file that declared them, in the order
+        they were added, so neither lookup has to scan every known type.
+    '''
+    __slots__ = ('_typemap', '_by_typecode', '_by_file')
+
     def __init__(self):
         self._typemap = {
             "bool": native_bool_type(),
@@ -47,11 +56,24 @@ class type_manager(object):
             "double": native_double_type(),
             "long double": native_long_double_type()
         }
+        self._by_typecode = {TypeCode.COMPOUND: [], TypeCode.ENUM: [], TypeCode.UNION: []}
+        self._by_file = {}
 
     def add_type(self, typename, type):
         assert typename not in self._typemap, "Type {0} is already in the type manager.".format(
             typename)
-        self._typemap[typename] = type
+        self._typemap[sys.intern(typename)] = type
+        self._index_type(type)
+
+    def _index_type(self, type):
+        if type.typecode == TypeCode.ATOMIC:
+            return
+        self._by_typecode[type.typecode].append(type)
+        file_index = self._by_file.get(type.declaration_filename)
+        if file_index is None:
+            file_index = {TypeCode.COMPOUND: [], TypeCode.ENUM: [], TypeCode.UNION: []}
+            self._by_file[type.declaration_filename] = file_index
+        file_index[type.typecode].append(type)
 
     def is_known_type(self, typename):
         return typename in self._typemap
@@ -61,11 +83,43 @@ class type_manager(object):
             typename)
         return self._typemap[typename]
 
+    def merge(self, other):
+        '''
+            Adds every type from another type manager that this one doesn't know
+            yet. Returns the names of types that both managers know but that were
+            declared in different files; if there are any, nothing is added.
+        '''
+        conflicts = []
+        for typename, type in other._typemap.items():
+            known_type = self._typemap.get(typename)
+            if known_type is not None and \
+                    (known_type.typecode != type.typecode or
+                     (type.typecode != TypeCode.ATOMIC and
+                      known_type.declaration_filename != type.declaration_filename)):
+                conflicts.append(typename)
+        if len(conflicts) > 0:
+            return conflicts
+
+        for typename, type in other._typemap.items():
+            if typename not in self._typemap:
+                self._typemap[typename] = type
+                self._index_type(type)
+        return conflicts
+
     def get_compound_types(self):
-        return [type for type in self._typemap.values() if type.typecode == TypeCode.COMPOUND]
+        return list(self._by_typecode[TypeCode.COMPOUND])
 
     def get_enum_types(self):
-        return [type for type in self._typemap.values() if type.typecode == TypeCode.ENUM]
+        return list(self._by_typecode[TypeCode.ENUM])
 
     def get_union_types(self):
-        return [type for type in self._typemap.values() if type.typecode == TypeCode.UNION]
+        return list(self._by_typecode[TypeCode.UNION])
+
+    def get_types_declared_in(self, filename, typecode):
+        file_index = self._by_file.get(filename)
+        if file_index is None:
+            return []
+        return list(file_index[typecode])
+
+    def get_declaring_files(self):
+        return list(self._by_file.keys())
@@ -24,18 +24,23 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import sys
+
 from fieldelem import field_element
 from typecode import TypeCode
 
 
 class union_type(object):
+    __slots__ = ('_typename', '_header_filename', '_fieldlist', '_layout')
+
     def __init__(self, typename, declaration_filename):
-        self._typename = typename
-        self._header_filename = declaration_filename
+        self._typename = sys.intern(typename)
+        self._header_filename = sys.intern(declaration_filename)
         self._fieldlist = []
+        self._layout = None
 
-    def add_field(self, fieldname, fieldtype, num_elems=1):
-        self._fieldlist.append(field_element(fieldname, fieldtype, num_elems))
+    def add_field(self, fieldname, fieldtype, array_dims=(), storage_type=None):
+        self._fieldlist.append(field_element(fieldname, fieldtype, array_dims, storage_type))
 
     @property
     def declaration_filename(self):
@@ -60,3 +65,27 @@ class union_type(object):
     @property
     def fields(self):
         return self._fieldlist
+
+    @property
+    def written_fields(self):
+        '''
+            An HDF5 compound can't overlap members, so a union is written as
+            just one of its fields: the first compound field if there is one,
+            otherwise the first field.
+        '''
+        if len(self._fieldlist) == 0:
+            return []
+
+        field_to_use = next(
+            (field for field in self._fieldlist if field.type_definition.typecode == TypeCode.COMPOUND), None)
+        if field_to_use is None:
+            field_to_use = self._fieldlist[0]
+        return [field_to_use]
+
+    @property
+    def layout(self):
+        return self._layout
+
+    @layout.setter
+    def layout(self, layout):
+        self._layout = layout
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+'''
+MIT License
+
+Copyright (c) 2022 Johnathon Lewis
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+from typecode import TypeCode
+
+
+class vlstring_type(object):
+    '''
+        A std::string field, written as an HDF5 variable-length string. like
+        the atomic types it carries no state, so there is only one instance.
+    '''
+    __slots__ = ()
+    _instance = None
+
+    def __new__(cls):
+        if vlstring_type._instance is None:
+            vlstring_type._instance = object.__new__(cls)
+        return vlstring_type._instance
+
+    @property
+    def typecode(self):
+        return TypeCode.VLSTRING
+
+    @property
+    def typename(self):
+        return "std::string"
+
+    @property
+    def fully_qualified_typename(self):
+        return self.typename
+
+
+class vlsequence_type(object):
+    '''
+        A std::vector field, written as an HDF5 variable-length sequence of
+        its element type.
+    '''
+    __slots__ = ('_element_type',)
+
+    def __init__(self, element_type):
+        self._element_type = element_type
+
+    @property
+    def element_type(self):
+        return self._element_type
+
+    @property
+    def typecode(self):
+        return TypeCode.VLSEQUENCE
+
+    @property
+    def typename(self):
+        return "std::vector<{0}>".format(self._element_type.fully_qualified_typename)
+
+    @property
+    def fully_qualified_typename(self):
+        return self.typename